@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+
+"""
+Benchmarks for the managers, run against generated fixtures instead of the
+real system: synthetic rootfs trees and stub system binaries on PATH.
+
+Run it from the root of the repository:
+
+    python3 -m benchmarks.benchmark --sizes 100,10000 --latency 0.005
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+from collections.abc import Callable
+from typing import Any
+
+from lib import tracing
+from modules.packages import PackageManager
+from modules.repository import RepositoryManager, RepositoryPool
+from modules.rootfs import RootFSManager
+from modules.services import ServicesManager
+
+FILES_PER_DIRECTORY: int = 50
+LARGE_FILE_SIZE: int = 4 * 1024 * 1024
+
+STUB_PREAMBLE: str = """#!/bin/sh
+echo "$(basename "$0") $*" >> "$BENCH_LOG"
+sleep "${BENCH_LATENCY:-0}"
+"""
+
+STUBS: dict[str, str] = {
+    "systemctl": """
+if [ "$1" = "show" ]; then
+    shift 3
+    first=1
+    for unit in "$@"; do
+        [ "$first" = 1 ] || echo
+        first=0
+        echo "LoadState=loaded"
+        case "$unit" in
+            *[02468].service) echo "UnitFileState=enabled";;
+            *) echo "UnitFileState=disabled";;
+        esac
+    done
+fi
+""",
+    "apt": "",
+    "dpkg-query": """
+i=0
+while [ "$i" -lt "${BENCH_INSTALLED:-0}" ]; do
+    echo "package-$i installed"
+    i=$((i + 1))
+done
+""",
+    "git": """
+[ "$1" = "-C" ] && shift 2
+case "$1" in
+    rev-parse) echo true;;
+    status) echo "# branch.upstream origin/master";;
+    rev-list) echo "0 0";;
+    clone) mkdir -p "$3";;
+esac
+""",
+    "sudo": """
+exec "$@"
+""",
+}
+
+class Result():
+    """
+    The measurements of a single scenario.
+    """
+    def __init__(self, name: str, wall_time: float, forks: int, bytes_written: int):
+        self.name: str = name
+        self.wall_time: float = wall_time
+        self.forks: int = forks
+        self.bytes_written: int = bytes_written
+
+    def to_dict(self) -> dict[str, Any]:
+        """
+        Returns the result as a dictionary.
+        """
+        return {
+            "name": self.name,
+            "wall_time": self.wall_time,
+            "forks": self.forks,
+            "bytes_written": self.bytes_written,
+        }
+
+def create_stubs(directory: str) -> str:
+    """
+    Writes the stub binaries and returns the directory holding them.
+    """
+    bin_dir: str = os.path.join(directory, "bin")
+    os.makedirs(bin_dir, exist_ok=True)
+
+    for name, body in STUBS.items():
+        path: str = os.path.join(bin_dir, name)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(STUB_PREAMBLE + body)
+        os.chmod(path, 0o755)
+
+    return bin_dir
+
+def create_rootfs_tree(directory: str, file_count: int, seed: int = 0) -> tuple[str, str]:
+    """
+    Generates a rootfs tree of `file_count` files, mostly small dotfile-sized
+    ones and a few large binaries under usr/. The target has every directory
+    already created so no file is skipped. Returns the rootfs and target paths.
+    """
+    generator = random.Random(seed)
+    rootfs_dir: str = os.path.join(directory, "rootfs")
+    target_dir: str = os.path.join(directory, "target")
+
+    for index in range(file_count):
+        top_level: str = "usr" if index % 2 else "etc"
+        relative_dir: str = os.path.join(top_level, f"dir{index // FILES_PER_DIRECTORY}")
+        is_large: bool = top_level == "usr" and index % 1000 == 1
+
+        os.makedirs(os.path.join(rootfs_dir, relative_dir), exist_ok=True)
+        os.makedirs(os.path.join(target_dir, relative_dir), exist_ok=True)
+
+        size: int = LARGE_FILE_SIZE if is_large else generator.randint(64, 4096)
+        with open(os.path.join(rootfs_dir, relative_dir, f"file{index}"), "wb") as f:
+            f.write(generator.randbytes(size))
+
+    return rootfs_dir, target_dir
+
+def measure(name: str, action: Callable[[], None]) -> Result:
+    """
+    Runs a scenario, counting the stub binaries it runs and the bytes it copies.
+    The stubs log every call themselves, so commands started without a
+    tracing span are counted too.
+    """
+    tracer: tracing.Tracer = tracing.enable()
+    tracer.spans.clear()
+    log_path: str = os.environ["BENCH_LOG"]
+
+    with open(log_path, "w", encoding="utf-8"):
+        pass
+
+    start: float = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        action()
+    wall_time: float = time.perf_counter() - start
+
+    with open(log_path, "r", encoding="utf-8") as f:
+        forks: int = sum(1 for _ in f)
+    bytes_written: int = sum(int(span.args.get("bytes", 0)) for span in tracer.spans
+                             if span.category == "file" and span.name.startswith("copy "))
+
+    return Result(name, wall_time, forks, bytes_written)
+
+def benchmark_rootfs(workspace: str, file_count: int, jobs: int | None) -> list[Result]:
+    """
+    Installs a generated tree, reruns the install with nothing changed and
+    then overwrites everything again.
+    """
+    directory: str = os.path.join(workspace, f"rootfs-{file_count}")
+    rootfs_dir, target_dir = create_rootfs_tree(directory, file_count)
+    state_dir: str = os.path.join(directory, "state")
+    results: list[Result] = []
+
+    def install(incremental: bool) -> Callable[[], None]:
+        return lambda: RootFSManager(rootfs_dir, target_dir, state_dir) \
+            .install_files(incremental=incremental, jobs=jobs)
+
+    results.append(measure(f"rootfs-{file_count}-fresh", install(True)))
+    results.append(measure(f"rootfs-{file_count}-rerun", install(True)))
+    results.append(measure(f"rootfs-{file_count}-overwrite", install(False)))
+    results.append(measure(f"rootfs-{file_count}-plan",
+                           lambda: RootFSManager(rootfs_dir, target_dir, state_dir).plan_files()))
+
+    shutil.rmtree(directory)
+
+    return results
+
+def benchmark_services(service_count: int) -> Result:
+    """
+    Enables a list of services, half of which are already enabled.
+    """
+    services: list[str] = [f"service-{index}.service" for index in range(service_count)]
+
+    return measure(f"services-{service_count}",
+                   lambda: ServicesManager(services).enable_services())
+
+def benchmark_packages(package_count: int) -> list[Result]:
+    """
+    Installs a list of packages with half of them and all of them installed.
+    """
+    packages: list[str] = [f"package-{index}" for index in range(package_count)]
+    results: list[Result] = []
+
+    def install() -> None:
+        pm = PackageManager()
+        pm.install_packages(pm.get_package_manager(), packages)
+
+    os.environ["BENCH_INSTALLED"] = str(package_count // 2)
+    results.append(measure(f"packages-{package_count}-half-installed", install))
+    os.environ["BENCH_INSTALLED"] = str(package_count)
+    results.append(measure(f"packages-{package_count}-all-installed", install))
+
+    return results
+
+def benchmark_repositories(workspace: str, repository_count: int) -> list[Result]:
+    """
+    Clones and then updates a list of repositories, one at a time
+    and then all of them at once through a RepositoryPool.
+    """
+    repositories_dir: str = os.path.join(workspace, "repositories")
+    repositories: list[tuple[str, str]] = [(f"file:///remote/repo{index}.git", f"repo{index}")
+                                           for index in range(repository_count)]
+    results: list[Result] = []
+
+    def clone() -> None:
+        for url, repo_dir in repositories:
+            RepositoryManager(url, repo_dir, repositories_dir).clone_repo()
+
+    def update() -> None:
+        for url, repo_dir in repositories:
+            RepositoryManager(url, repo_dir, repositories_dir).update_repo()
+
+    def sync() -> None:
+        RepositoryPool(repositories, repositories_dir=repositories_dir).sync()
+
+    results.append(measure(f"repos-{repository_count}-clone", clone))
+    results.append(measure(f"repos-{repository_count}-update", update))
+    results.append(measure(f"repos-{repository_count}-pool-update", sync))
+    shutil.rmtree(repositories_dir)
+    results.append(measure(f"repos-{repository_count}-pool-clone", sync))
+
+    return results
+
+def print_table(results: list[Result]) -> None:
+    """
+    Prints the results as a table.
+    """
+    print(f"{'Scenario':<36} {'Wall time':>12} {'Forks':>7} {'Bytes written':>15}")
+
+    for result in results:
+        print(f"{result.name:<36} {result.wall_time * 1000:>10.1f}ms " + \
+              f"{result.forks:>7} {result.bytes_written:>15}")
+
+def main() -> None:
+    """
+    Runs every benchmark and reports the results.
+    """
+    parser = argparse.ArgumentParser(prog="benchmark",
+                                     description="Benchmarks for the linux-config managers.")
+    parser.add_argument("--sizes",
+                        default="100,10000,100000",
+                        help="Comma separated file counts of the generated rootfs trees")
+    parser.add_argument("--latency",
+                        type=float,
+                        default=0.005,
+                        help="Seconds every stub binary sleeps before returning")
+    parser.add_argument("--services",
+                        type=int,
+                        default=30,
+                        help="Number of services to enable")
+    parser.add_argument("--packages",
+                        type=int,
+                        default=30,
+                        help="Number of packages to install")
+    parser.add_argument("--repos",
+                        type=int,
+                        default=10,
+                        help="Number of repositories to clone and update")
+    parser.add_argument("-j", "--jobs",
+                        type=int,
+                        default=None,
+                        help="Number of files copied in parallel")
+    parser.add_argument("--json",
+                        action="store_true",
+                        default=False,
+                        help="Print the results as JSON")
+    args = parser.parse_args()
+
+    results: list[Result] = []
+
+    with tempfile.TemporaryDirectory(prefix="linux-config-benchmark-") as workspace:
+        os.environ["PATH"] = create_stubs(workspace) + os.pathsep + os.environ["PATH"]
+        os.environ["BENCH_LOG"] = os.path.join(workspace, "calls.log")
+        os.environ["BENCH_LATENCY"] = str(args.latency)
+
+        for size in args.sizes.split(","):
+            results.extend(benchmark_rootfs(workspace, int(size), args.jobs))
+        results.append(benchmark_services(args.services))
+        results.extend(benchmark_packages(args.packages))
+        results.extend(benchmark_repositories(workspace, args.repos))
+
+    if args.json:
+        print(json.dumps([result.to_dict() for result in results], indent=2))
+    else:
+        print_table(results)
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        sys.exit(130)
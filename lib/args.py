@@ -14,6 +14,9 @@ class ArgumentParser:
         self.parser = argparse.ArgumentParser(prog="linux-config",
                                               description="Linux configuration script.")
         self.group = self.parser.add_mutually_exclusive_group()
+        self.subparsers = self.parser.add_subparsers(dest="command",
+                                                     metavar="COMMAND",
+                                                     help="Run a single phase instead of all of them")
 
     def populate_args(self):
         """
@@ -23,10 +26,136 @@ class ArgumentParser:
                                  action="store_true",
                                  default=False,
                                  help="Print more messages")
+        self.parser.add_argument("-y", "--yes",
+                                 action="store_true",
+                                 default=False,
+                                 help="Run every phase without asking")
+        self.parser.add_argument("-p", "--profile",
+                                 metavar="FILE",
+                                 default=None,
+                                 help="Read the phases to run from a profile instead of asking")
+        self.parser.add_argument("-i", "--incremental",
+                                 action="store_true",
+                                 default=False,
+                                 help="Only install root filesystem files that have changed")
+        self.parser.add_argument("-j", "--jobs",
+                                 type=int,
+                                 default=None,
+                                 help="Number of files copied in parallel")
+        self.parser.add_argument("--trace",
+                                 metavar="FILE",
+                                 default=None,
+                                 help="Record how long every step takes and save it as a Chrome trace")
         self.group.add_argument("--version",
                                 action="version",
                                 version="%(prog)s 1.0")
 
+        self.subparsers.add_parser("packages", help="Install the missing packages")
+        self.subparsers.add_parser("services", help="Enable the services")
+        self.__populate_rootfs_args()
+        self.subparsers.add_parser("secure-boot", help="Set up secure boot with a signed shim")
+        self.__populate_repos_args()
+        self.__populate_zram_args()
+
+    def __populate_rootfs_args(self):
+        rootfs_parser = self.subparsers.add_parser("rootfs", help="Set up the root filesystem")
+        rootfs_group = rootfs_parser.add_mutually_exclusive_group()
+
+        rootfs_parser.add_argument("--json",
+                                   action="store_true",
+                                   default=False,
+                                   help="Print the plan as JSON")
+        rootfs_parser.add_argument("--no-diff",
+                                   action="store_true",
+                                   default=False,
+                                   help="Do not include diffs in the plan")
+        rootfs_group.add_argument("--plan",
+                                  action="store_true",
+                                  default=False,
+                                  help="Show what setting up the root filesystem would change")
+        rootfs_group.add_argument("--list-backups",
+                                  action="store_true",
+                                  default=False,
+                                  help="List the runs that have backed up files")
+        rootfs_group.add_argument("--restore",
+                                  metavar="RUN_ID",
+                                  default=None,
+                                  help="Restore the files overwritten by a previous run")
+
+    def __populate_repos_args(self):
+        repos_parser = self.subparsers.add_parser("repos", help="Clone or update repositories")
+        repos_subparsers = repos_parser.add_subparsers(dest="repos_command",
+                                                       metavar="ACTION",
+                                                       required=True)
+
+        clone_parser = repos_subparsers.add_parser("clone", help="Clone a repository")
+        clone_parser.add_argument("url", help="URL of the repository")
+        clone_parser.add_argument("directory",
+                                  nargs="?",
+                                  default=None,
+                                  help="Directory to clone into, named after the URL by default")
+
+        self.__populate_clone_args(clone_parser)
+
+        update_parser = repos_subparsers.add_parser("update", help="Update a cloned repository")
+        update_parser.add_argument("directory", help="Directory of the repository")
+
+        sync_parser = repos_subparsers.add_parser("sync",
+                                                  help="Clone or update a list of repositories" + \
+                                                       " in parallel")
+        sync_parser.add_argument("file",
+                                 help="File listing one '<url> [directory]' per line")
+        sync_parser.add_argument("-j", "--jobs",
+                                 dest="repository_jobs",
+                                 metavar="JOBS",
+                                 type=int,
+                                 default=None,
+                                 help="Number of repositories synced in parallel")
+        self.__populate_clone_args(sync_parser)
+
+        optimize_parser = repos_subparsers.add_parser("optimize",
+                                                      help="Run the maintenance cloned" + \
+                                                           " repositories need")
+        optimize_parser.add_argument("directory",
+                                     nargs="?",
+                                     default=None,
+                                     help="Directory of the repository, every cloned one by default")
+        optimize_parser.add_argument("--aggressive",
+                                     action="store_true",
+                                     default=False,
+                                     help="Always recompress everything with a full repack")
+        optimize_parser.add_argument("--cpus",
+                                     type=int,
+                                     default=None,
+                                     help="Number of CPUs to use, every available one by default")
+
+    def __populate_clone_args(self, parser: argparse.ArgumentParser):
+        parser.add_argument("--shared",
+                            action="store_true",
+                            default=False,
+                            help="Borrow objects from a store shared by every cloned repository")
+        parser.add_argument("--filter",
+                            dest="blob_filter",
+                            metavar="FILTER",
+                            default=None,
+                            help="Make a partial clone, such as 'blob:none'")
+        parser.add_argument("--depth",
+                            type=int,
+                            default=None,
+                            help="Make a shallow clone with this many commits")
+
+    def __populate_zram_args(self):
+        zram_parser = self.subparsers.add_parser("zram",
+                                                 help="Set up compressed memory with zram or zswap")
+        zram_parser.add_argument("--zswap",
+                                 action="store_true",
+                                 default=False,
+                                 help="Use zswap in front of the swap file instead of zram")
+        zram_parser.add_argument("--no-apply",
+                                 action="store_true",
+                                 default=False,
+                                 help="Only install the config, it takes effect after a reboot")
+
     def parse_args(self):
         """
         This method parses the command line arguments.
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+
+"""
+Module containing the BackupStore class.
+"""
+
+if __name__ == "__main__":
+    raise RuntimeError("This module is not meant to be run directly. Please use the main script.")
+
+import datetime
+import fcntl
+import json
+import os
+import stat
+import threading
+
+from lib import tracing
+from lib.file_copier import copy_file
+from lib.manifest import hash_file
+
+BACKUP_STORE_PATH: str = "/var/lib/linux-config"
+
+def new_run_id() -> str:
+    """
+    Returns an identifier for a new run, sorting after the previous ones.
+    """
+    return datetime.datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+
+class BackupStore():
+    """
+    Content-addressed store for the files overwritten by the script.
+
+    Every distinct version of a file is kept once under `objects/`, named
+    after its SHA-256 digest, and every run writes an index under `runs/`
+    mapping the paths it overwrote to the version they had before.
+    """
+    def __init__(self, path: str = BACKUP_STORE_PATH, run_id: str | None = None):
+        self.objects_dir: str = os.path.join(path, "objects")
+        self.runs_dir: str = os.path.join(path, "runs")
+        self.run_id: str = run_id or new_run_id()
+        self.files: dict[str, dict[str, str | int]] = {}
+        self.__lock = threading.Lock()
+
+    def __object_path(self, digest: str) -> str:
+        return os.path.join(self.objects_dir, digest[:2], digest)
+
+    def __add_object(self, file: str, object_path: str, hardlink: bool) -> None:
+        """
+        Adds a file to the object store, linking it when possible and
+        copying it (as a reflink if the filesystem supports it) otherwise.
+        """
+        os.makedirs(os.path.dirname(object_path), exist_ok=True)
+        temporary_path: str = f"{object_path}.{threading.get_ident()}.tmp"
+
+        try:
+            if hardlink:
+                try:
+                    os.link(file, temporary_path)
+                except OSError:
+                    hardlink = False
+
+            if not hardlink:
+                copy_file(file, temporary_path)
+
+            os.replace(temporary_path, object_path)
+        finally:
+            if os.path.lexists(temporary_path):
+                os.remove(temporary_path)
+
+    def store(self, file: str, hardlink: bool = False) -> str:
+        """
+        Backs up a file and records it in the index of the current run.
+        Files already in the store are only hashed, never copied again.
+
+        Only pass `hardlink` when the file is going to be replaced instead
+        of rewritten in place, otherwise the backup would change with it.
+        """
+        with tracing.span(f"backup {file}", "file") as current_span:
+            file_stat: os.stat_result = os.stat(file)
+            digest: str = hash_file(file)
+            object_path: str = self.__object_path(digest)
+            current_span.set("bytes", file_stat.st_size)
+
+            if not os.path.exists(object_path):
+                self.__add_object(file, object_path, hardlink)
+            else:
+                current_span.set("deduplicated", True)
+
+        with self.__lock:
+            self.files[file] = {
+                "hash": digest,
+                "mode": stat.S_IMODE(file_stat.st_mode),
+                "uid": file_stat.st_uid,
+                "gid": file_stat.st_gid,
+            }
+
+        return digest
+
+    def save(self) -> None:
+        """
+        Writes the index of the current run, if anything was backed up.
+        Stores sharing a run identifier add their files to the same index.
+        """
+        if not self.files:
+            return
+
+        os.makedirs(self.runs_dir, exist_ok=True)
+        index_path: str = os.path.join(self.runs_dir, f"{self.run_id}.json")
+        temporary_path: str = f"{index_path}.{os.getpid()}.{id(self)}.tmp"
+
+        with open(os.path.join(self.runs_dir, ".lock"), "w", encoding="utf-8") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+
+            files: dict[str, dict[str, str | int]] = {}
+
+            if os.path.exists(index_path):
+                with open(index_path, "r", encoding="utf-8") as f:
+                    files = json.load(f)["files"]
+
+            # The first backup of a file in a run is the one to restore.
+            for file, entry in self.files.items():
+                files.setdefault(file, entry)
+
+            with open(temporary_path, "w", encoding="utf-8") as f:
+                json.dump({"files": files}, f, indent=1, sort_keys=True)
+            os.replace(temporary_path, index_path)
+
+    def list_runs(self) -> list[str]:
+        """
+        Returns the identifiers of the recorded runs, oldest first.
+        """
+        try:
+            return sorted(file.removesuffix(".json") for file in os.listdir(self.runs_dir)
+                          if file.endswith(".json"))
+        except FileNotFoundError:
+            return []
+
+    def restore(self, run_id: str, verbose: bool = False) -> list[str]:
+        """
+        Puts back the files overwritten by a run, skipping those that
+        already have the backed up content. Returns the restored paths.
+        """
+        index_path: str = os.path.join(self.runs_dir, f"{run_id}.json")
+
+        if not os.path.exists(index_path):
+            raise FileNotFoundError(f"No backup was recorded for the run '{run_id}'.")
+
+        with open(index_path, "r", encoding="utf-8") as f:
+            files: dict[str, dict[str, str | int]] = json.load(f)["files"]
+
+        restored: list[str] = []
+
+        for file, entry in files.items():
+            digest: str = str(entry["hash"])
+
+            if os.path.exists(file) and hash_file(file) == digest:
+                if verbose:
+                    print(f"[VERBOSE] '{file}' is already restored, skipping...")
+                continue
+
+            if verbose:
+                print(f"[VERBOSE] Restoring '{file}'...")
+
+            temporary_path: str = f"{file}.linux-config.tmp"
+
+            try:
+                copy_file(self.__object_path(digest), temporary_path)
+                os.chmod(temporary_path, int(entry["mode"]))
+                if os.getuid() == 0:
+                    os.chown(temporary_path, int(entry["uid"]), int(entry["gid"]))
+                os.replace(temporary_path, file)
+            finally:
+                if os.path.lexists(temporary_path):
+                    os.remove(temporary_path)
+
+            restored.append(file)
+
+        return restored
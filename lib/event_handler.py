@@ -1,21 +1,28 @@
 """
 Event handler module for arguments parsing and action execution.
+
+The managers are only imported by the handlers that use them, so showing
+the help or running a single phase does not pay for importing the others.
 """
 
 if __name__ == "__main__":
     raise RuntimeError("This module is not meant to be run directly. Please use the main script.")
 
+import argparse
 import logging
+import os
 import sys
 
+from typing import Any
+
+from lib import tracing
 from lib.args import ArgumentParser
-from modules.packages import PackageManager
-from modules.rootfs import RootFSManager
-from modules.services import ServicesManager
 
-ARGUMENTS_PARSER = ArgumentParser()
-ARGUMENTS_PARSER.populate_args()
-args = ARGUMENTS_PARSER.parse_args()
+PHASES: dict[str, str] = {
+    "packages": "Do you want to install packages? (y/n): ",
+    "services": "Do you want to enable services? (y/n): ",
+    "rootfs": "Do you want to set up the root filesystem? (y/n): ",
+}
 
 def __get_current_platform() -> str:
     """
@@ -30,7 +37,42 @@ def __validate_platform() -> None:
     ERROR_MESSAGE: str = __get_current_platform() + " is not a supported platform."
     assert __get_current_platform() == "linux", ERROR_MESSAGE
 
+def __read_profile(profile: str) -> dict[str, bool]:
+    """
+    Reads which phases to run from a profile such as:
+
+        [phases]
+        packages = yes
+        services = no
+        rootfs = yes
+    """
+    import configparser # pylint: disable=import-outside-toplevel
+
+    parser = configparser.ConfigParser()
+
+    if not os.path.isfile(profile) or not parser.read(profile):
+        raise FileNotFoundError(f"The profile '{profile}' could not be read.")
+
+    if not parser.has_section("phases"):
+        raise ValueError(f"The profile '{profile}' does not have a [phases] section.")
+
+    return {phase: parser.getboolean("phases", phase, fallback=False) for phase in PHASES}
+
+def __should_run(phase: str, args: argparse.Namespace, profile: dict[str, bool] | None) -> bool:
+    """
+    Decides if a phase should run, only asking when running interactively.
+    """
+    if profile is not None:
+        return profile[phase]
+
+    if args.yes:
+        return True
+
+    return input(PHASES[phase]).lower() == "y"
+
 def __install_packages(verbose: bool = False) -> None:
+    from modules.packages import PackageManager # pylint: disable=import-outside-toplevel
+
     pm = PackageManager()
 
     package_manager: str = pm.get_package_manager(verbose)
@@ -38,23 +80,213 @@ def __install_packages(verbose: bool = False) -> None:
     if verbose:
         print("[VERBOSE] Package manager was set to:", package_manager)
 
-    pm.install_packages(package_manager)
+    pm.install_packages(package_manager, verbose=verbose)
 
 def __enable_services(verbose: bool = False) -> None:
+    from modules.services import ServicesManager # pylint: disable=import-outside-toplevel
+
     SERVICE_MANAGER = ServicesManager()
 
     SERVICE_MANAGER.enable_services(verbose)
 
-def __setup_rootfs(verbose: bool = False) -> None:
+def __setup_rootfs(verbose: bool = False, incremental: bool = False,
+                   jobs: int | None = None) -> None:
+    from modules.rootfs import RootFSManager # pylint: disable=import-outside-toplevel
+
     rfms = RootFSManager()
 
-    rfms.install_files(args.verbose)
+    rfms.install_files(verbose, incremental, jobs)
+
+def __plan_rootfs(verbose: bool = False, as_json: bool = False,
+                  show_diff: bool = True) -> None:
+    from lib.plan import render_json, render_text # pylint: disable=import-outside-toplevel
+    from modules.rootfs import RootFSManager # pylint: disable=import-outside-toplevel
+
+    rfms = RootFSManager()
+
+    actions = rfms.plan_files(verbose)
+
+    if as_json:
+        print(render_json(actions, show_diff))
+    else:
+        print(render_text(actions, show_diff))
+
+def __list_backups() -> None:
+    from modules.rootfs import RootFSManager # pylint: disable=import-outside-toplevel
+
+    rfms = RootFSManager()
+
+    for run_id in rfms.list_backups():
+        print(run_id)
+
+def __restore_backup(run_id: str, verbose: bool = False) -> None:
+    from modules.rootfs import RootFSManager # pylint: disable=import-outside-toplevel
+
+    rfms = RootFSManager()
+
+    rfms.restore_files(run_id, verbose)
+
+def __handle_rootfs(args: argparse.Namespace) -> None:
+    if args.plan:
+        __plan_rootfs(args.verbose, args.json, not args.no_diff)
+    elif args.list_backups:
+        __list_backups()
+    elif args.restore:
+        __restore_backup(args.restore, args.verbose)
+    else:
+        __setup_rootfs(args.verbose, args.incremental, args.jobs)
+
+def __handle_secure_boot(args: argparse.Namespace) -> None:
+    from modules.secure_boot import SecureBootManager # pylint: disable=import-outside-toplevel
+
+    sbm = SecureBootManager()
+
+    # Backing up needs root, so it is done first to fail before installing anything.
+    run_id: str = sbm.backup_boot_files(args.verbose)
+    print(f"[INFO] The boot files were backed up as run '{run_id}'.")
+    sbm.install_dependencies(args.verbose)
+    sbm.install_shim(args.verbose)
+
+def __handle_repos(args: argparse.Namespace) -> None:
+    # pylint: disable-next=import-outside-toplevel
+    from modules.repository import RepositoryManager, RepositoryPool, list_repositories, \
+        read_repository_list
+
+    clone_options: dict[str, Any] = {
+        "shared": getattr(args, "shared", False),
+        "blob_filter": getattr(args, "blob_filter", None),
+        "depth": getattr(args, "depth", None),
+    }
+
+    match args.repos_command:
+        case "clone":
+            directory: str = args.directory or \
+                os.path.basename(args.url.rstrip("/")).removesuffix(".git")
+            RepositoryManager(args.url, directory, **clone_options).clone_repo()
+        case "update":
+            RepositoryManager("", args.directory).update_repo()
+        case "sync":
+            results = RepositoryPool(read_repository_list(args.file), args.repository_jobs,
+                                     **clone_options).sync()
+            for result in results:
+                print(result)
+            if not all(result.success for result in results):
+                raise RuntimeError("Some repositories could not be synced.")
+        case "optimize":
+            repositories: list[tuple[str, str]] = [("", args.directory)] if args.directory \
+                else list_repositories()
+            results = RepositoryPool(repositories).optimize(args.cpus, args.aggressive)
+            for result in results:
+                print(result)
+            if not all(result.success for result in results):
+                raise RuntimeError("Some repositories could not be optimized.")
+        case _:
+            raise ValueError(f"Unknown repository action: {args.repos_command}")
+
+def __handle_zram(args: argparse.Namespace) -> None:
+    from modules.rootfs import RootFSManager # pylint: disable=import-outside-toplevel
+    from modules.zram import ZramManager # pylint: disable=import-outside-toplevel
+
+    zram = ZramManager()
+    configs: dict[str, str] = zram.generate_configs(args.zswap)
+
+    if args.verbose:
+        for path, content in configs.items():
+            print(f"[VERBOSE] /{path}:\n{content}")
+
+    RootFSManager().install_generated_files(configs, args.verbose)
+
+    if args.no_apply:
+        return
+
+    zram.apply_zswap(args.zswap)
+    if not args.zswap:
+        zram.apply_zram()
+
+def __run_phases(args: argparse.Namespace) -> None:
+    """
+    Runs every phase the user agrees to, each step starting as soon as
+    the steps it depends on are finished.
+    """
+    from lib.scheduler import Scheduler, Step # pylint: disable=import-outside-toplevel
+    from modules.rootfs import RootFSManager # pylint: disable=import-outside-toplevel
+
+    profile: dict[str, bool] | None = None
+
+    if args.profile:
+        profile = __read_profile(args.profile)
+
+    # Ask everything up front, the phases may run at the same time.
+    selected_phases: list[str] = [phase for phase in PHASES if __should_run(phase, args, profile)]
+    scheduler = Scheduler(verbose=args.verbose)
+    rfms: RootFSManager | None = None
+
+    if "packages" in selected_phases:
+        scheduler.add(Step("packages", lambda: __install_packages(args.verbose),
+                           provides=("packages",),
+                           error_message="An error has occurred while installing packages: %s"))
+
+    if "rootfs" in selected_phases:
+        error_message: str = "An error has occurred while setting up the root filesystem: %s"
+
+        try:
+            rfms = RootFSManager()
+        except Exception as e: # pylint: disable=broad-exception-caught
+            logging.error(error_message, e)
+        else:
+            def install(directory: str) -> None:
+                rfms.install_files(args.verbose, args.incremental, args.jobs, [directory],
+                                   quiet=True)
+                print(f"[INFO] The /{directory} files are installed.")
+
+            # /etc is filled in by the packages (libvirt hooks, modprobe.d, ...),
+            # /usr and /home do not depend on them and can be installed meanwhile.
+            scheduler.add(Step("rootfs:etc", lambda: install("etc"),
+                               requires=("packages",),
+                               provides=("unit-files",),
+                               error_message=error_message))
+            scheduler.add(Step("rootfs:usr", lambda: install("usr"),
+                               error_message=error_message))
+            scheduler.add(Step("rootfs:home", lambda: install("home"),
+                               error_message=error_message))
+
+    if "services" in selected_phases:
+        scheduler.add(Step("services", lambda: __enable_services(args.verbose),
+                           requires=("packages", "unit-files"),
+                           error_message="An error has occurred while enabling services: %s"))
+
+    scheduler.run()
+
+    # The rootfs steps share a run, it is reported once they are all done.
+    if rfms is not None and rfms.RUN_ID in rfms.list_backups():
+        print(f"[INFO] Overwritten files were backed up as run '{rfms.RUN_ID}'.")
+
+def __run_command(args: argparse.Namespace) -> None:
+    match args.command:
+        case "packages":
+            __install_packages(args.verbose)
+        case "services":
+            __enable_services(args.verbose)
+        case "rootfs":
+            __handle_rootfs(args)
+        case "secure-boot":
+            __handle_secure_boot(args)
+        case "repos":
+            __handle_repos(args)
+        case "zram":
+            __handle_zram(args)
+        case _:
+            __run_phases(args)
 
 def parse_actions() -> None:
     """
     Parse the action specified in the command line
     arguments and execute the corresponding function.
     """
+    ARGUMENTS_PARSER = ArgumentParser()
+    ARGUMENTS_PARSER.populate_args()
+    args = ARGUMENTS_PARSER.parse_args()
+
     try:
         __validate_platform()
     except Exception as e:
@@ -62,25 +294,17 @@ def parse_actions() -> None:
 
     if args.verbose:
         print("[VERBOSE] Your platform is:", __get_current_platform())
-        input("Press any key to continue.\n")
+        if not args.yes and not args.profile:
+            input("Press any key to continue.\n")
 
-    try:
-        should_install_packages: bool = input("Do you want to install packages? (y/n): ").lower() == "y"
-        if should_install_packages:
-            __install_packages(args.verbose)
-    except Exception as e:
-        logging.error("An error has occurred while installing packages: %s", e)
-
-    try:
-        should_enable_services: bool = input("Do you want to enable services? (y/n): ").lower() == "y"
-        if should_enable_services:
-            __enable_services(args.verbose)
-    except Exception as e:
-        logging.error("An error has occurred while enabling services: %s", e)
+    if args.trace:
+        tracing.enable()
 
     try:
-        should_setup_rootfs: bool = input("Do you want to set up the root filesystem? (y/n): ").lower() == "y"
-        if should_setup_rootfs:
-            __setup_rootfs(args.verbose)
-    except Exception as e:
-        logging.error("An error has occurred while setting up the root filesystem: %s", e)
+        with tracing.span(args.command or "all", "phase"):
+            __run_command(args)
+    finally:
+        if tracing.TRACER is not None:
+            tracing.TRACER.export_chrome_trace(args.trace)
+            print(f"[INFO] Trace saved to '{args.trace}', slowest steps:")
+            print(tracing.TRACER.summary())
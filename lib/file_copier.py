@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+
+"""
+Module containing the FileCopier class.
+"""
+
+if __name__ == "__main__":
+    raise RuntimeError("This module is not meant to be run directly. Please use the main script.")
+
+import errno
+import fcntl
+import os
+import shutil
+import stat
+import threading
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING
+
+from lib import tracing
+
+if TYPE_CHECKING:
+    from lib.backup_store import BackupStore
+
+# From linux/fs.h: _IOW(0x94, 9, int)
+FICLONE: int = 0x40049409
+COPY_CHUNK_SIZE: int = 16 * 1024 * 1024
+
+# Errors meaning the filesystem can not do a kernel-side copy between these files.
+UNSUPPORTED_COPY_ERRORS: tuple[int, ...] = (
+    errno.EXDEV,
+    errno.EINVAL,
+    errno.ENOSYS,
+    errno.EOPNOTSUPP,
+    errno.ETXTBSY,
+    errno.EBADF,
+    errno.EPERM,
+)
+
+def __clone_file(source_fd: int, destination_fd: int) -> bool:
+    """
+    Shares the extents of the source with the destination (btrfs, xfs).
+    """
+    try:
+        fcntl.ioctl(destination_fd, FICLONE, source_fd)
+        return True
+    except OSError as e:
+        if e.errno in UNSUPPORTED_COPY_ERRORS or e.errno == errno.ENOTTY:
+            return False
+        raise e
+
+def __copy_file_range(source_fd: int, destination_fd: int, size: int) -> bool:
+    """
+    Copies the whole file inside the kernel, without bouncing it through user space.
+    """
+    if not hasattr(os, "copy_file_range"):
+        return False
+
+    copied: int = 0
+
+    try:
+        while copied < size:
+            written: int = os.copy_file_range(source_fd, destination_fd,
+                                              min(COPY_CHUNK_SIZE, size - copied))
+            if written == 0:
+                break
+            copied += written
+    except OSError as e:
+        if copied == 0 and e.errno in UNSUPPORTED_COPY_ERRORS:
+            return False
+        raise e
+
+    return True
+
+def copy_file(source: str, destination: str) -> int:
+    """
+    Copies a file preferring a reflink clone, then copy_file_range and
+    finally a buffered copy. Returns the amount of bytes copied.
+
+    Existing destinations keep their permissions like shutil.copyfile does,
+    new ones get the permissions of the source.
+    """
+    with tracing.span(f"copy {source} to {destination}", "file") as current_span, \
+            open(source, "rb") as source_file:
+        source_stat: os.stat_result = os.fstat(source_file.fileno())
+        current_span.set("bytes", source_stat.st_size)
+        flags: int = os.O_WRONLY | os.O_CREAT | os.O_TRUNC | os.O_CLOEXEC
+        destination_fd: int = os.open(destination, flags, stat.S_IMODE(source_stat.st_mode))
+
+        with open(destination_fd, "wb") as destination_file:
+            if __clone_file(source_file.fileno(), destination_fd):
+                current_span.set("method", "reflink")
+                return source_stat.st_size
+
+            if __copy_file_range(source_file.fileno(), destination_fd, source_stat.st_size):
+                current_span.set("method", "copy_file_range")
+                return source_stat.st_size
+
+            current_span.set("method", "buffered")
+            shutil.copyfileobj(source_file, destination_file, COPY_CHUNK_SIZE)
+
+    return source_stat.st_size
+
+def install_file(source: str, destination: str) -> int:
+    """
+    Atomically replaces the destination with a copy of the source.
+    The new file keeps the permissions and owner of the one it replaces.
+    Returns the amount of bytes copied.
+    """
+    temporary_path: str = os.path.join(os.path.dirname(destination),
+                                       f".{os.path.basename(destination)}.linux-config.tmp")
+
+    try:
+        destination_stat: os.stat_result | None = os.stat(destination)
+    except FileNotFoundError:
+        destination_stat = None
+
+    try:
+        size: int = copy_file(source, temporary_path)
+
+        if destination_stat is not None:
+            os.chmod(temporary_path, stat.S_IMODE(destination_stat.st_mode))
+            if os.getuid() == 0:
+                os.chown(temporary_path, destination_stat.st_uid, destination_stat.st_gid)
+
+        os.replace(temporary_path, destination)
+    finally:
+        if os.path.lexists(temporary_path):
+            os.remove(temporary_path)
+
+    return size
+
+class CopyJob():
+    """
+    A file to install, optionally backing up what it replaces first.
+    """
+    def __init__(self, source: str, destination: str, backup: bool = False):
+        self.source: str = source
+        self.destination: str = destination
+        self.backup: bool = backup
+
+class FileCopier():
+    """
+    Copies files on a bounded thread pool.
+
+    Jobs are grouped by destination directory, each group is handled by a
+    single worker in the order it was given, so files in the same directory
+    are still installed one after another like before.
+
+    `quiet` hides the progress line, which would be garbled by several
+    copiers running at the same time.
+    """
+    def __init__(self, max_workers: int | None = None, verbose: bool = False,
+                 backup_store: "BackupStore | None" = None, quiet: bool = False):
+        self.max_workers: int = max_workers or min(32, (os.cpu_count() or 1) + 4)
+        self.backup_store: "BackupStore | None" = backup_store
+        self.verbose: bool = verbose
+        self.quiet: bool = quiet
+        self.bytes_copied: int = 0
+        self.__completed: int = 0
+        self.__total: int = 0
+        self.__lock = threading.Lock()
+
+    def __report_progress(self, job: CopyJob, size: int) -> None:
+        with self.__lock:
+            self.__completed += 1
+            self.bytes_copied += size
+            if self.verbose:
+                print(f"[VERBOSE] Copied '{job.source}' to '{job.destination}'" + \
+                      f" ({self.__completed}/{self.__total})")
+            elif not self.quiet:
+                print(f"\r[INFO] Copied {self.__completed}/{self.__total} files", end="",
+                      flush=True)
+
+    def __run_group(self, jobs: list[CopyJob]) -> None:
+        for job in jobs:
+            size: int = 0
+
+            if job.backup and self.backup_store is not None:
+                # The destination is replaced rather than rewritten, so the
+                # store can keep the old inode as the backup instead of copying it.
+                self.backup_store.store(job.destination, hardlink=True)
+            size += install_file(job.source, job.destination)
+
+            self.__report_progress(job, size)
+
+    def run(self, jobs: list[CopyJob]) -> None:
+        """
+        Runs every job, raising the first error once all the groups are done.
+        """
+        if not jobs:
+            return
+
+        groups: dict[str, list[CopyJob]] = {}
+
+        for job in jobs:
+            groups.setdefault(os.path.dirname(job.destination), []).append(job)
+
+        self.__completed = 0
+        self.__total = len(jobs)
+
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(groups))) as executor:
+            futures = [executor.submit(self.__run_group, group) for group in groups.values()]
+
+        if not self.verbose and not self.quiet:
+            print()
+
+        for future in futures:
+            exception = future.exception()
+            if exception is not None:
+                raise exception
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+
+"""
+Module containing the Manifest class.
+"""
+
+if __name__ == "__main__":
+    raise RuntimeError("This module is not meant to be run directly. Please use the main script.")
+
+import fcntl
+import hashlib
+import json
+import os
+
+MANIFEST_PATH: str = "/var/lib/linux-config/manifest.json"
+HASH_CHUNK_SIZE: int = 1024 * 1024
+
+def hash_file(file: str) -> str:
+    """
+    Returns the SHA-256 digest of a file.
+    """
+    digest = hashlib.sha256()
+
+    with open(file, "rb") as f:
+        while chunk := f.read(HASH_CHUNK_SIZE):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+class Manifest():
+    """
+    Keeps track of the files installed by the script so reruns only have
+    to stat each destination instead of copying it again.
+
+    Every entry is keyed by the destination path and records the size,
+    mtime and hash of the source, along with the size and mtime the
+    destination had right after it was installed.
+    """
+    def __init__(self, path: str = MANIFEST_PATH):
+        self.path: str = path
+        self.entries: dict[str, dict[str, str | int]] = {}
+        self.changed_entries: set[str] = set()
+
+    def load(self) -> None:
+        """
+        Loads the manifest from disk, starting empty if it does not exist
+        or can not be parsed.
+        """
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.entries = json.load(f)
+        except (FileNotFoundError, ValueError):
+            self.entries = {}
+
+    def save(self) -> None:
+        """
+        Atomically writes the manifest back to disk if it has changed.
+        Only the entries changed here are written over the ones on disk, so
+        manifests saved at the same time do not lose each other's changes.
+        """
+        if not self.changed_entries:
+            return
+
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        temporary_path: str = f"{self.path}.{os.getpid()}.{id(self)}.tmp"
+
+        with open(f"{self.path}.lock", "w", encoding="utf-8") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+
+            changes = {key: self.entries[key] for key in self.changed_entries}
+            self.load()
+            self.entries.update(changes)
+
+            with open(temporary_path, "w", encoding="utf-8") as f:
+                json.dump(self.entries, f, indent=1, sort_keys=True)
+            os.replace(temporary_path, self.path)
+
+        self.changed_entries.clear()
+
+    def source_hash(self, destination: str, source: str, source_stat: os.stat_result) -> str:
+        """
+        Returns the hash of the source file, reusing the recorded one
+        when the size and mtime of the source have not changed.
+        """
+        entry = self.entries.get(destination)
+
+        if entry is not None and \
+                entry["size"] == source_stat.st_size and \
+                entry["mtime_ns"] == source_stat.st_mtime_ns:
+            return str(entry["hash"])
+
+        return hash_file(source)
+
+    def is_up_to_date(self, destination: str, source_digest: str,
+                      destination_stat: os.stat_result) -> bool:
+        """
+        Checks if the destination still holds what was installed last time,
+        judging only by its size and mtime.
+        """
+        entry = self.entries.get(destination)
+
+        if entry is None:
+            return False
+
+        return entry["hash"] == source_digest and \
+            entry["dest_size"] == destination_stat.st_size and \
+            entry["dest_mtime_ns"] == destination_stat.st_mtime_ns
+
+    def update(self, destination: str, source: str, source_digest: str,
+               source_stat: os.stat_result, destination_stat: os.stat_result) -> None:
+        """
+        Records the state of an installed file.
+        """
+        entry: dict[str, str | int] = {
+            "source": source,
+            "size": source_stat.st_size,
+            "mtime_ns": source_stat.st_mtime_ns,
+            "hash": source_digest,
+            "dest_size": destination_stat.st_size,
+            "dest_mtime_ns": destination_stat.st_mtime_ns,
+        }
+
+        if self.entries.get(destination) != entry:
+            self.entries[destination] = entry
+            self.changed_entries.add(destination)
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+
+"""
+Module containing the FileAction class and the plan reports.
+"""
+
+if __name__ == "__main__":
+    raise RuntimeError("This module is not meant to be run directly. Please use the main script.")
+
+import difflib
+import json
+import os
+
+class FileAction():
+    """
+    What installing a single file of the root filesystem would do.
+    """
+    CREATE: str = "create"
+    OVERWRITE: str = "overwrite"
+    SKIP: str = "skip"
+    MISSING_PARENT: str = "missing-parent"
+
+    def __init__(self, action: str, source: str, destination: str,
+                 source_stat: os.stat_result | None = None):
+        self.action: str = action
+        self.source: str = source
+        self.destination: str = destination
+        self.source_stat: os.stat_result | None = source_stat
+
+    def is_pending(self) -> bool:
+        """
+        Checks if the file has to be copied.
+        """
+        return self.action in (FileAction.CREATE, FileAction.OVERWRITE)
+
+    def diff(self) -> str:
+        """
+        Returns a unified diff between the destination and the source.
+        """
+        if not self.is_pending():
+            return ""
+
+        old_lines: list[str] = []
+        old_name: str = "/dev/null"
+
+        try:
+            if self.action == FileAction.OVERWRITE:
+                old_name = self.destination
+                with open(self.destination, "r", encoding="utf-8") as f:
+                    old_lines = f.readlines()
+            with open(self.source, "r", encoding="utf-8") as f:
+                new_lines: list[str] = f.readlines()
+        except UnicodeDecodeError:
+            return f"Binary files {old_name} and {self.source} differ\n"
+        except PermissionError:
+            return f"Can not read {old_name}, permission denied\n"
+
+        return "".join(difflib.unified_diff(old_lines, new_lines, old_name, self.source))
+
+    def to_dict(self, show_diff: bool = True) -> dict[str, str]:
+        """
+        Returns the action as a dictionary.
+        """
+        action: dict[str, str] = {
+            "action": self.action,
+            "source": self.source,
+            "destination": self.destination,
+        }
+
+        if show_diff and self.is_pending():
+            action["diff"] = self.diff()
+
+        return action
+
+def render_text(actions: list[FileAction], show_diff: bool = True) -> str:
+    """
+    Returns a human readable report of the plan.
+    """
+    lines: list[str] = []
+    counts: dict[str, int] = {}
+
+    for action in actions:
+        counts[action.action] = counts.get(action.action, 0) + 1
+
+        if action.action == FileAction.SKIP:
+            continue
+
+        lines.append(f"{action.action:>14} {action.destination}")
+        if show_diff and action.is_pending():
+            lines.append(action.diff())
+
+    summary: str = ", ".join(f"{count} {name}" for name, count in sorted(counts.items()))
+    lines.append(f"[INFO] Plan: {summary or 'nothing to do'}.")
+
+    return "\n".join(lines)
+
+def render_json(actions: list[FileAction], show_diff: bool = True) -> str:
+    """
+    Returns the plan as a JSON document.
+    """
+    return json.dumps({"actions": [action.to_dict(show_diff) for action in actions]}, indent=2)
@@ -4,24 +4,93 @@
 Module containing the Platform class.
 """
 
+import sys
+
 if __name__ == "__main__":
     print("This module is not meant to be run directly.")
     sys.exit(1)
 
-import sys
-import distro
+import functools
 import getpass
+import os
 import platform
 
+# Shared with the scripts of the root filesystem, which can not import lib.
+CPU_TOPOLOGY_DIR: str = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                     "modules/rootfs/usr/local/lib/linux-config")
+sys.path.insert(0, CPU_TOPOLOGY_DIR)
+
+# pylint: disable-next=wrong-import-position,unused-import
+from cpu_topology import CpuTopology, format_cpu_list, parse_cpu_list, parse_size
+
+OS_RELEASE_FILES: tuple[str, ...] = ("/etc/os-release", "/usr/lib/os-release")
+
+CPU_VENDORS: dict[str, str] = {
+    "GenuineIntel": "intel",
+    "AuthenticAMD": "amd",
+}
+
+def read_os_release(files: tuple[str, ...] = OS_RELEASE_FILES) -> dict[str, str]:
+    """
+    Parses the first os-release file found into a dictionary.
+    """
+    for file in files:
+        try:
+            with open(file, "r", encoding="utf-8") as f:
+                lines: list[str] = f.read().splitlines()
+        except OSError:
+            continue
+
+        fields: dict[str, str] = {}
+
+        for line in lines:
+            if "=" not in line or line.lstrip().startswith("#"):
+                continue
+            key, value = line.split("=", 1)
+            fields[key.strip()] = value.strip().strip("\"'")
+
+        return fields
+
+    return {}
+
 class Platform():
     """
     Class for detecting the current platform and distribution.
+
+    Detection only happens once per process, every Platform() after the
+    first one returns the same instance.
     """
-    def __init__(self) -> None:
-        self.CURRENT_DISTRO: str = distro.lsb_release_info().get("distributor_id", "unknown").lower()
+    __instance: "Platform | None" = None
+
+    def __new__(cls) -> "Platform":
+        if cls.__instance is None:
+            instance: Platform = super().__new__(cls)
+            instance.__detect()
+            cls.__instance = instance
+        return cls.__instance
+
+    def __detect(self) -> None:
+        self.CURRENT_DISTRO: str = self.__detect_distro()
         self.CURRENT_PLATFORM: str = platform.system().lower()
         self.CURRENT_USER = getpass.getuser()
 
+    def __detect_distro(self) -> str:
+        """
+        Reads the distribution from os-release, only asking lsb_release
+        when the system does not have one.
+        """
+        distro_id: str | None = read_os_release().get("ID")
+
+        if distro_id:
+            return distro_id.lower()
+
+        try:
+            import distro # pylint: disable=import-outside-toplevel
+        except ImportError:
+            return "unknown"
+
+        return distro.lsb_release_info().get("distributor_id", "unknown").lower()
+
     def __get_current_distro(self) -> str:
         return self.CURRENT_DISTRO
 
@@ -48,3 +117,38 @@ class Platform():
         Returns the current user.
         """
         return self.__get_current_user()
+
+    @functools.cached_property
+    def cpu_vendor(self) -> str:
+        """
+        The vendor of the CPU, such as "intel" or "amd".
+        """
+        try:
+            with open("/proc/cpuinfo", "r", encoding="utf-8") as f:
+                for line in f:
+                    if line.startswith("vendor_id"):
+                        vendor: str = line.split(":", 1)[1].strip()
+                        return CPU_VENDORS.get(vendor, vendor.lower())
+        except OSError:
+            pass
+
+        return "unknown"
+
+    @functools.cached_property
+    def cpu_topology(self) -> CpuTopology:
+        """
+        The layout of the online CPUs.
+        """
+        return CpuTopology()
+
+    def get_cpu_vendor(self) -> str:
+        """
+        Returns the vendor of the CPU.
+        """
+        return self.cpu_vendor
+
+    def get_cpu_topology(self) -> CpuTopology:
+        """
+        Returns the layout of the online CPUs.
+        """
+        return self.cpu_topology
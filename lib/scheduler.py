@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+
+"""
+Module containing the Scheduler class.
+"""
+
+if __name__ == "__main__":
+    raise RuntimeError("This module is not meant to be run directly. Please use the main script.")
+
+import logging
+
+from collections.abc import Callable
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+
+from lib import tracing
+
+class Step():
+    """
+    A unit of work, with the resources it needs and the ones it provides.
+    Resources are plain names such as "packages" or "unit-files".
+    """
+    def __init__(self, name: str, action: Callable[[], None],
+                 requires: tuple[str, ...] = (), provides: tuple[str, ...] = (),
+                 error_message: str | None = None):
+        self.name: str = name
+        self.action: Callable[[], None] = action
+        self.requires: tuple[str, ...] = requires
+        self.provides: tuple[str, ...] = provides
+        self.error_message: str = error_message or f"An error has occurred while running {name}: %s"
+
+class Scheduler():
+    """
+    Runs steps on a thread pool as soon as what they require is provided.
+
+    A step that fails is logged and still counts as finished, so like the
+    phases always did, a failure never stops the steps after it. Resources
+    that no scheduled step provides are assumed to be already there.
+    """
+    def __init__(self, max_workers: int | None = None, verbose: bool = False):
+        self.max_workers: int | None = max_workers
+        self.verbose: bool = verbose
+        self.steps: list[Step] = []
+        self.results: dict[str, str] = {}
+
+    def add(self, step: Step) -> None:
+        """
+        Adds a step to the schedule.
+        """
+        if any(scheduled.name == step.name for scheduled in self.steps):
+            raise ValueError(f"A step named '{step.name}' is already scheduled.")
+
+        self.steps.append(step)
+
+    def __run_step(self, step: Step) -> None:
+        if self.verbose:
+            print(f"[VERBOSE] Starting {step.name}...")
+
+        try:
+            with tracing.span(step.name, "phase"):
+                step.action()
+            self.results[step.name] = "done"
+        except Exception as e: # pylint: disable=broad-exception-caught
+            logging.error(step.error_message, e)
+            self.results[step.name] = "failed"
+
+        if self.verbose:
+            print(f"[VERBOSE] Finished {step.name}: {self.results[step.name]}")
+
+    def run(self) -> dict[str, str]:
+        """
+        Runs every step and returns whether each of them is "done" or "failed".
+        """
+        # How many scheduled steps still have to finish before a resource is ready.
+        providers: dict[str, int] = {}
+
+        for step in self.steps:
+            for resource in step.provides:
+                providers[resource] = providers.get(resource, 0) + 1
+
+        pending: list[Step] = list(self.steps)
+        running: dict[Future[None], Step] = {}
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while pending or running:
+                ready: list[Step] = [step for step in pending
+                                     if all(providers.get(resource, 0) == 0
+                                            for resource in step.requires)]
+
+                for step in ready:
+                    pending.remove(step)
+                    running[executor.submit(self.__run_step, step)] = step
+
+                if not running:
+                    names: str = ", ".join(step.name for step in pending)
+                    raise RuntimeError(f"The steps {names} depend on each other.")
+
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+
+                for future in finished:
+                    for resource in running.pop(future).provides:
+                        providers[resource] -= 1
+
+        return self.results
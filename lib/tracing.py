@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+
+"""
+Module containing the Tracer class and the helpers recording spans with it.
+
+Tracing is disabled until enable() is called, until then span() hands out a
+shared no-op span and run() is a plain subprocess.run().
+"""
+
+if __name__ == "__main__":
+    raise RuntimeError("This module is not meant to be run directly. Please use the main script.")
+
+import json
+import os
+import subprocess
+import threading
+import time
+
+from typing import Any
+
+class Span():
+    """
+    A timed operation, recorded by the tracer when it ends.
+    """
+    def __init__(self, tracer: "Tracer | None", name: str, category: str,
+                 args: dict[str, Any]):
+        self.tracer: "Tracer | None" = tracer
+        self.name: str = name
+        self.category: str = category
+        self.args: dict[str, Any] = args
+        self.thread_id: int = 0
+        self.start_ns: int = 0
+        self.duration_ns: int = 0
+
+    def set(self, key: str, value: Any) -> None:
+        """
+        Attaches a value to the span, such as an exit code or an amount of bytes.
+        """
+        if self.tracer is not None:
+            self.args[key] = value
+
+    def __enter__(self) -> "Span":
+        if self.tracer is not None:
+            self.thread_id = threading.get_ident()
+            self.start_ns = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type: Any, exc_value: Any, traceback: Any) -> None:
+        if self.tracer is None:
+            return
+
+        self.duration_ns = time.perf_counter_ns() - self.start_ns
+        if exc_value is not None:
+            self.args["error"] = str(exc_value)
+        self.tracer.record(self)
+
+NULL_SPAN: Span = Span(None, "", "", {})
+
+class Tracer():
+    """
+    Collects the spans of a run and exports them.
+    """
+    def __init__(self):
+        self.spans: list[Span] = []
+        self.origin_ns: int = time.perf_counter_ns()
+        self.__lock = threading.Lock()
+
+    def record(self, span: Span) -> None:
+        """
+        Adds a finished span.
+        """
+        with self.__lock:
+            self.spans.append(span)
+
+    def export_chrome_trace(self, path: str) -> None:
+        """
+        Writes the spans in the Chrome trace event format, which can be opened
+        with chrome://tracing or https://ui.perfetto.dev.
+        """
+        pid: int = os.getpid()
+        thread_ids: dict[int, int] = {}
+        events: list[dict[str, Any]] = []
+
+        for span in self.spans:
+            events.append({
+                "name": span.name,
+                "cat": span.category,
+                "ph": "X",
+                "ts": (span.start_ns - self.origin_ns) / 1000,
+                "dur": span.duration_ns / 1000,
+                "pid": pid,
+                "tid": thread_ids.setdefault(span.thread_id, len(thread_ids) + 1),
+                "args": span.args,
+            })
+
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+    def summary(self, limit: int = 10) -> str:
+        """
+        Returns a table of the slowest spans.
+        """
+        slowest: list[Span] = sorted(self.spans, key=lambda span: span.duration_ns,
+                                     reverse=True)[:limit]
+        lines: list[str] = [f"{'Duration':>12}  {'Category':<10}  Name"]
+
+        for span in slowest:
+            details: str = ""
+            if "exit_code" in span.args:
+                details += f" (exit code {span.args['exit_code']})"
+            if "bytes" in span.args:
+                details += f" ({span.args['bytes']} bytes)"
+            lines.append(f"{span.duration_ns / 1e6:>10.2f}ms  {span.category:<10}  " + \
+                         f"{span.name}{details}")
+
+        return "\n".join(lines)
+
+TRACER: Tracer | None = None
+
+def enable() -> Tracer:
+    """
+    Starts recording spans.
+    """
+    global TRACER # pylint: disable=global-statement
+
+    if TRACER is None:
+        TRACER = Tracer()
+
+    return TRACER
+
+def span(name: str, category: str = "step", **args: Any) -> Span:
+    """
+    Returns a span to time a block of code with.
+    """
+    if TRACER is None:
+        return NULL_SPAN
+
+    return Span(TRACER, name, category, args)
+
+def run(command: list[str] | str, **kwargs: Any) -> subprocess.CompletedProcess[Any]:
+    """
+    subprocess.run() recording the command and its exit code when tracing.
+    """
+    if TRACER is None:
+        return subprocess.run(command, **kwargs) # pylint: disable=subprocess-run-check
+
+    name: str = command if isinstance(command, str) else " ".join(command)
+
+    with span(name, "subprocess", command=command) as current_span:
+        try:
+            process = subprocess.run(command, **kwargs) # pylint: disable=subprocess-run-check
+        except subprocess.CalledProcessError as e:
+            current_span.set("exit_code", e.returncode)
+            raise e
+        current_span.set("exit_code", process.returncode)
+
+    return process
@@ -4,11 +4,28 @@
 Module containing the PackageManager class.
 """
 
-import subprocess
+import os
 import shutil
 
+from lib import tracing
 from lib.platform import Platform
 
+# Commands listing every installed package, one per line,
+# keyed by the package manager that installs them.
+INSTALLED_PACKAGES_QUERIES: dict[str, list[str]] = {
+    "apt": ["dpkg-query", "-W", "-f=${Package} ${db:Status-Status}\n"],
+    "pacman": ["pacman", "-Qq"],
+    "dnf": ["rpm", "-qa", "--qf", "%{NAME}\n"],
+    "zypper": ["rpm", "-qa", "--qf", "%{NAME}\n"],
+}
+
+INSTALL_ARGUMENTS: dict[str, list[str]] = {
+    "apt": ["install", "-y"],
+    "pacman": ["-S", "--needed", "--noconfirm"],
+    "dnf": ["install", "-y"],
+    "zypper": ["--non-interactive", "install"],
+}
+
 class PackageManager():
     """
     Manages the installation of packages.
@@ -22,11 +39,19 @@ class PackageManager():
         """
         Returns the package manager based on the current distribution.
         """
-        PACKAGE_MANAGER: str | None = shutil.which("apt")
+        PACKAGE_MANAGER: str | None = None
+
+        for name in INSTALL_ARGUMENTS:
+            PACKAGE_MANAGER = shutil.which(name)
+            if PACKAGE_MANAGER is not None:
+                break
 
         if PACKAGE_MANAGER is None:
             raise ValueError("No package manager could be set.")
 
+        if verbose:
+            print("[VERBOSE] Found package manager:", PACKAGE_MANAGER)
+
         return PACKAGE_MANAGER
 
     def convert_list_to_str(self, list: list[str]) -> str:
@@ -52,20 +77,76 @@ class PackageManager():
             case _:
                 raise ValueError(self.CURRENT_DISTRO, "unsupported distro")
 
-    def install_packages(self, package_manager: str) -> None:
+    def get_installed_packages(self, package_manager: str) -> set[str]:
+        """
+        Returns the names of every installed package with a single query.
+        """
+        name: str = os.path.basename(package_manager)
+
+        if name not in INSTALLED_PACKAGES_QUERIES:
+            raise ValueError(name, "unsupported package manager")
+
+        output: str = tracing.run(INSTALLED_PACKAGES_QUERIES[name],
+                                  capture_output=True,
+                                  text=True,
+                                  check=True).stdout
+        installed: set[str] = set()
+
+        for line in output.splitlines():
+            fields: list[str] = line.split()
+
+            if not fields:
+                continue
+
+            # dpkg also lists removed packages that still have configuration files.
+            if name == "apt" and fields[-1] != "installed":
+                continue
+
+            installed.add(fields[0])
+
+        return installed
+
+    def get_missing_packages(self, package_manager: str, packages: list[str]) -> list[str]:
+        """
+        Returns the packages of the list that are not installed yet.
+        """
+        installed: set[str] = self.get_installed_packages(package_manager)
+
+        return [package for package in packages if package not in installed]
+
+    def install_packages(self, package_manager: str, packages: list[str] | None = None,
+                         verbose: bool = False) -> None:
         """
         Installs packages based on the current distribution.
+        Packages that are already installed are left out, and the package
+        manager is not run at all when nothing is missing.
         """
-        packages: list[str] = self.get_package_list()
+        if packages is None:
+            packages = self.get_package_list()
+
+        name: str = os.path.basename(package_manager)
+
+        if name not in INSTALL_ARGUMENTS:
+            raise ValueError(name, "unsupported package manager")
+
+        missing_packages: list[str] = self.get_missing_packages(package_manager, packages)
+
+        if not missing_packages:
+            print("[INFO] All packages are already installed.")
+            return
+
+        if verbose:
+            print("[VERBOSE] Missing packages:", self.convert_list_to_str(missing_packages))
+
         command: list[str] = []
 
         if not self.CURRENT_USER == "root":
             command.append("sudo")
         command.append(package_manager)
-        command.extend(["install", "-y"])
-        command.extend(packages)
+        command.extend(INSTALL_ARGUMENTS[name])
+        command.extend(missing_packages)
 
         try:
-            subprocess.run(command)
+            tracing.run(command)
         except Exception as e:
             raise e
@@ -1,122 +1,536 @@
 #!/bin/env python3
 
 """
-Module containing the RepositoryManager class.
+Module containing the RepositoryManager and RepositoryPool classes.
 """
 
-import subprocess
+import fcntl
+import hashlib
 import os
+import re
+import subprocess
+import threading
+import time
+
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+
+from lib import tracing
+
+SHARED_STORE_NAME: str = ".shared.git"
+# Serializes creating the stores between the threads of this process, the file lock
+# between processes.
+SHARED_STORE_LOCK = threading.Lock()
+
+# Loose objects worth packing into a pack of their own.
+LOOSE_OBJECTS_LIMIT: int = 100
+# Packs worth rolling up geometrically.
+PACKS_LIMIT: int = 8
+# Packs past which only recompressing everything again helps.
+FULL_REPACK_PACKS_LIMIT: int = 50
+# Seconds after which a temporary pack no git process is writing anymore is removed.
+GARBAGE_EXPIRY: int = 3600
 
 class RepositoryManager():
     """
     Handles tasks such as cloning and updating repositories.
+
+    Git always runs inside the repository through `git -C`, the working
+    directory of the process is never changed, so several managers can
+    work at the same time from different threads.
+
+    Clones can borrow their objects from a bare repository shared by every
+    repository in `repositories_dir` cloned with the same blob filter, so forks
+    and related repositories only download and store what they do not have in
+    common. `blob_filter` and
+    `depth` make partial and shallow clones, for repositories only read from.
     """
-    def __init__(self, repo_url: str, repo_dir: str):
+    def __init__(self, repo_url: str, repo_dir: str, repositories_dir: str | None = None,
+                 capture_output: bool = False, shared: bool = False,
+                 blob_filter: str | None = None, depth: int | None = None):
         self.REPO_URL: str = repo_url
         self.REPO_DIR: str = repo_dir
-        self.REPOSITORIES_DIR = os.path.join(os.getcwd(), "modules/repositories")
+        self.REPOSITORIES_DIR: str = repositories_dir or \
+            os.path.join(os.getcwd(), "modules/repositories")
+        self.FULL_REPOSITORY_PATH: str = os.path.join(self.REPOSITORIES_DIR, self.REPO_DIR)
+        self.SHARED_STORE_PATH: str = os.path.join(self.REPOSITORIES_DIR,
+                                                   get_shared_store_name(blob_filter))
+        self.CAPTURE_OUTPUT: bool = capture_output
+        self.SHARED: bool = shared
+        self.BLOB_FILTER: str | None = blob_filter
+        self.DEPTH: int | None = depth
+
+    def __git(self, arguments: list[str], check: bool = True,
+              capture_output: bool | None = None) -> subprocess.CompletedProcess[Any]:
+        """
+        Runs a git command inside the repository.
+        """
+        command: list[str] = ["git", "-C", self.FULL_REPOSITORY_PATH, *arguments]
 
-    def stash_repository_changes(self):
+        if capture_output is None:
+            capture_output = self.CAPTURE_OUTPUT
+
+        return tracing.run(command, check=check, capture_output=capture_output, text=True)
+
+    def __is_repository_valid(self) -> bool:
+        return self.__git(["rev-parse", "--is-inside-work-tree"],
+                          check=False,
+                          capture_output=True).stdout.strip() == "true"
+
+    def stash_repository_changes(self, check_repository: bool = True):
         """
         Stash any changes in the repository.
         Args:
-            repository_path (str): The path to the repository.
+            check_repository (bool): Check that the path is a repository first.
         Raises:
-            AssertionError: If the provided path is not a valid git repository.
-            Exception: If the git stash command fails.
+            AssertionError: If the repository is not a valid git repository.
+            CalledProcessError: If the git stash command fails.
         """
-        GIT_STASH_COMMAND: list[str] = ["git", "stash", "--include-untracked"]
-        IS_GIT_INSIDE_WORK_TREE_COMMAND: list[str] = ["git", "rev-parse", "--is-inside-work-tree"]
-        IS_REPOSITORY_VALID: bool = subprocess.run(IS_GIT_INSIDE_WORK_TREE_COMMAND,
-                                                   capture_output=True) \
-                                                    .stdout.decode("utf-8").strip() == "true"
-        
-        assert IS_REPOSITORY_VALID, "The provided path is not a valid git repository."
+        if check_repository:
+            assert self.__is_repository_valid(), "The provided path is not a valid git repository."
 
         try:
-            print("[INFO] Stashing any local changes...")
-            exit_code = subprocess.run(GIT_STASH_COMMAND, check=True)
-
-            if exit_code.returncode == 0:
-                print("[INFO] Successfully stashed local changes.")
-            else:
-                print("[INFO] No local changes to stash.")
+            print(f"[INFO] Stashing any local changes in {self.REPO_DIR}...")
+            self.__git(["stash", "--include-untracked"])
+            print(f"[INFO] Successfully stashed local changes in {self.REPO_DIR}.")
         except Exception as e:
             raise e
 
-    def restore_repository_changes(self):
+    def restore_repository_changes(self, check_repository: bool = True):
         """
         Restores any stashed changes in the repository.
         Args:
-            repository_path (str): The path to the repository.
+            check_repository (bool): Check that the path is a repository first.
         Raises:
-            AssertionError: If the provided path is not a valid git repository.
-            Exception: If the git stash command fails.
+            AssertionError: If the repository is not a valid git repository.
+            CalledProcessError: If there is no stash or it does not apply cleanly.
         """
-        GIT_UNSTASH_COMMAND: list[str] = ["git", "restore", "--staged", "."]
-        GIT_IS_INSIDE_WORK_TREE_COMMAND: list[str] = ["git", "rev-parse", "--is-inside-work-tree"]
-        IS_REPOSITORY_VALID: bool = subprocess.run(GIT_IS_INSIDE_WORK_TREE_COMMAND,
-                                                   capture_output=True) \
-                                                    .stdout.decode("utf-8").strip() == "true"
-
-        assert IS_REPOSITORY_VALID, "The provided path is not a valid git repository."
+        if check_repository:
+            assert self.__is_repository_valid(), "The provided path is not a valid git repository."
 
         try:
-            print("[INFO] Restoring any stashed changes...")
-            exit_code = subprocess.run(GIT_UNSTASH_COMMAND, check=True)
-            if exit_code.returncode == 0:
-                print("[INFO] Successfully restored stashed changes.")
-            else:
-                print("[INFO] No stashed changes to restore.")
+            print(f"[INFO] Restoring any stashed changes in {self.REPO_DIR}...")
+            self.__git(["stash", "pop"])
+            print(f"[INFO] Successfully restored stashed changes in {self.REPO_DIR}.")
         except Exception as e:
             raise e
 
+    def get_status(self) -> dict[str, str | bool]:
+        """
+        Reads the branch, its upstream and whether the work tree has changes
+        with a single `git status` call.
+        Raises:
+            CalledProcessError: If the path is not a valid git repository.
+        """
+        output: str = self.__git(["status", "--porcelain=v2", "--branch", "--untracked-files=all"],
+                                 capture_output=True).stdout
+        status: dict[str, str | bool] = {
+            "head": "",
+            "upstream": "",
+            "dirty": False,
+        }
+
+        for line in output.splitlines():
+            if line.startswith("# branch.oid "):
+                status["head"] = line.removeprefix("# branch.oid ")
+            elif line.startswith("# branch.upstream "):
+                status["upstream"] = line.removeprefix("# branch.upstream ")
+            elif not line.startswith("#"):
+                status["dirty"] = True
+
+        return status
+
     def update_repo(self):
         """
         Pulls the latest changes from the repository, if any.
-        """
-        PREVIOUS_DIR: str = os.getcwd()
-        FULL_REPOSITORY_PATH: str = os.path.join(self.REPOSITORIES_DIR, self.REPO_DIR)
-        COMMAND: list[str] = ["git", "pull"]
 
-        assert os.path.isdir(FULL_REPOSITORY_PATH), "Could not find any repository to update."
+        Nothing but a fetch happens when the upstream has not moved, local
+        changes are only stashed when there are any and the upstream has to
+        be merged, which is only done when it can be fast-forwarded.
+        """
+        assert os.path.isdir(self.FULL_REPOSITORY_PATH), "Could not find any repository to update."
 
-        os.chdir(FULL_REPOSITORY_PATH)
+        status: dict[str, str | bool] = self.get_status()
 
-        self.stash_repository_changes()
+        if not status["upstream"]:
+            print(f"[!] {self.REPO_DIR} has no upstream branch, skipping.")
+            return
 
         try:
-            subprocess.run(COMMAND, check=True)
+            self.__git(["fetch", "--quiet"])
         except Exception as e:
             raise e
 
-        self.restore_repository_changes()
+        counts: list[str] = self.__git(["rev-list", "--left-right", "--count", "HEAD...@{upstream}"],
+                                       capture_output=True).stdout.split()
+        ahead, behind = int(counts[0]), int(counts[1])
+
+        if behind == 0:
+            print(f"[INFO] {self.REPO_DIR} is already up to date.")
+            return
+
+        if ahead > 0:
+            raise RuntimeError(f"{self.REPO_DIR} has diverged from {status['upstream']}," + \
+                               " it can not be fast-forwarded.")
+
+        if status["dirty"]:
+            self.stash_repository_changes(check_repository=False)
 
-        os.chdir(PREVIOUS_DIR)
+        try:
+            self.__git(["merge", "--ff-only", "@{upstream}"])
+        finally:
+            if status["dirty"]:
+                self.restore_repository_changes(check_repository=False)
+
+    def __create_shared_store(self) -> None:
+        """
+        Creates the shared store if it does not exist yet, the clones of a
+        RepositoryPool would otherwise all try to create it at the same time.
+        """
+        os.makedirs(self.REPOSITORIES_DIR, exist_ok=True)
+
+        with SHARED_STORE_LOCK, \
+                open(f"{self.SHARED_STORE_PATH}.lock", "w", encoding="utf-8") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+
+            if os.path.isdir(self.SHARED_STORE_PATH):
+                return
+
+            tracing.run(["git", "init", "--quiet", "--bare", self.SHARED_STORE_PATH],
+                        check=True, capture_output=True, text=True)
+            # Clones only point at the store, a gc would not know their objects are used.
+            tracing.run(["git", "-C", self.SHARED_STORE_PATH, "config", "gc.auto", "0"],
+                        check=True, capture_output=True, text=True)
+
+    def __update_shared_store(self) -> None:
+        """
+        Fetches the repository into the shared store, creating it if needed.
+        Every URL gets its own namespace of refs, which keep the objects the
+        clones borrow from being pruned. Partial clones use a store fetched
+        with their blob filter, complete clones one with every blob.
+
+        Only the fetches of the same URL wait for each other, the others
+        write different refs and run at the same time.
+        """
+        self.__create_shared_store()
+
+        namespace: str = hashlib.sha256(self.REPO_URL.encode()).hexdigest()[:16]
+        FETCH_COMMAND: list[str] = ["git", "-C", self.SHARED_STORE_PATH, "fetch", "--quiet",
+                                    "--no-tags", "--no-write-fetch-head"]
+
+        if self.BLOB_FILTER:
+            FETCH_COMMAND += [f"--filter={self.BLOB_FILTER}"]
+
+        FETCH_COMMAND += [self.REPO_URL, f"+refs/heads/*:refs/remotes/{namespace}/*"]
+
+        with open(os.path.join(self.SHARED_STORE_PATH, f"fetch-{namespace}.lock"), "w",
+                  encoding="utf-8") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            tracing.run(FETCH_COMMAND, check=True, capture_output=self.CAPTURE_OUTPUT, text=True)
 
     def clone_repo(self):
         """
         Clone a repository if it does not exist.
         """
-        REPOSITORY_TO_CLONE: str = os.path.join(self.REPOSITORIES_DIR, self.REPO_DIR)
-        COMMAND: list[str] = ["git", "clone", self.REPO_URL]
+        COMMAND: list[str] = ["git", "clone"]
+
+        assert not os.path.isdir(self.FULL_REPOSITORY_PATH), "Repository already exists."
 
-        assert not os.path.isdir(REPOSITORY_TO_CLONE), "Repository already exists."
+        os.makedirs(self.REPOSITORIES_DIR, exist_ok=True)
 
-        if not os.path.exists(self.REPOSITORIES_DIR):
-            os.mkdir(self.REPOSITORIES_DIR)
+        # git refuses to borrow from a shallow store, and a complete one would
+        # download the whole history a shallow clone is meant to avoid.
+        if self.SHARED and self.DEPTH:
+            print(f"[!] {self.REPO_DIR} is a shallow clone, it does not use the shared store.")
+        elif self.SHARED:
+            self.__update_shared_store()
+            COMMAND += ["--reference", self.SHARED_STORE_PATH]
+
+        if self.BLOB_FILTER:
+            COMMAND += [f"--filter={self.BLOB_FILTER}"]
+
+        if self.DEPTH:
+            COMMAND += ["--depth", str(self.DEPTH)]
+
+        COMMAND += [self.REPO_URL, self.FULL_REPOSITORY_PATH]
 
         try:
-            os.chdir(self.REPOSITORIES_DIR)
+            tracing.run(COMMAND, check=True, capture_output=self.CAPTURE_OUTPUT, text=True)
         except Exception as e:
             raise e
 
+    def sync_repo(self) -> str:
+        """
+        Clones the repository, or updates it if it was already cloned.
+        Returns the action that was taken.
+        """
+        if os.path.isdir(self.FULL_REPOSITORY_PATH):
+            self.update_repo()
+            return "update"
+
+        self.clone_repo()
+        return "clone"
+
+    def __get_git_dir(self) -> str:
+        git_dir: str = os.path.join(self.FULL_REPOSITORY_PATH, ".git")
+        return git_dir if os.path.isdir(git_dir) else self.FULL_REPOSITORY_PATH
+
+    def __get_newest_ref(self) -> float:
+        """
+        Returns when a ref last changed, which is when new commits became reachable.
+        """
+        git_dir: str = self.__get_git_dir()
+        newest_ref: float = 0.0
+
+        for file in ("HEAD", "packed-refs"):
+            try:
+                newest_ref = max(newest_ref, os.stat(os.path.join(git_dir, file)).st_mtime)
+            except FileNotFoundError:
+                pass
+
+        for directory, _, files in os.walk(os.path.join(git_dir, "refs")):
+            for file in files:
+                newest_ref = max(newest_ref, os.stat(os.path.join(directory, file)).st_mtime)
+
+        return newest_ref
+
+    def __remove_garbage(self) -> int:
+        """
+        Removes the temporary packs left behind by interrupted fetches and
+        repacks, which no repack ever deletes. Returns how many were removed.
+        """
+        pack_dir: str = os.path.join(self.__get_git_dir(), "objects", "pack")
+        expiry: float = time.time() - GARBAGE_EXPIRY
+        removed: int = 0
+
+        if not os.path.isdir(pack_dir):
+            return removed
+
+        for entry in os.scandir(pack_dir):
+            # Recent ones may still be written by a running git process.
+            if entry.name.startswith("tmp_") and entry.stat().st_mtime < expiry:
+                os.remove(entry.path)
+                removed += 1
+
+        return removed
+
+    def get_object_stats(self) -> dict[str, int | bool]:
+        """
+        Measures the state of the object database: loose objects, packs
+        and whether the commit-graph and multi-pack-index are up to date.
+        The commit-graph is stale when packs or refs changed after it was written.
+        """
+        output: str = self.__git(["count-objects", "-v"], capture_output=True).stdout
+        counts: dict[str, int] = {}
+
+        for line in output.splitlines():
+            key, _, value = line.partition(": ")
+            if value.isdigit():
+                counts[key] = int(value)
+
+        objects_dir: str = os.path.join(self.__get_git_dir(), "objects")
+        pack_dir: str = os.path.join(objects_dir, "pack")
+        newest_pack: float = max((entry.stat().st_mtime for entry in os.scandir(pack_dir)
+                                  if entry.name.endswith(".pack")), default=0.0) \
+            if os.path.isdir(pack_dir) else 0.0
+        multi_pack_index: float = 0.0
+        commit_graph: float = 0.0
+
         try:
-            subprocess.run(COMMAND, check=True)
-        except Exception as e:
-            raise e
+            multi_pack_index = os.stat(os.path.join(pack_dir, "multi-pack-index")).st_mtime
+        except FileNotFoundError:
+            pass
+
+        for graph in ("info/commit-graph", "info/commit-graphs/commit-graph-chain"):
+            try:
+                commit_graph = max(commit_graph,
+                                   os.stat(os.path.join(objects_dir, graph)).st_mtime)
+            except FileNotFoundError:
+                pass
+
+        return {
+            "loose": counts.get("count", 0),
+            "packs": counts.get("packs", 0),
+            "garbage": counts.get("garbage", 0),
+            "multi_pack_index_stale": multi_pack_index < newest_pack,
+            "commit_graph_stale": commit_graph < max(newest_pack, self.__get_newest_ref()),
+        }
+
+    def optimize(self, aggressive: bool = False, threads: int | None = None) -> list[str]:
+        """
+        Runs the maintenance tasks the repository needs and returns their names.
+
+        The cheap incremental tasks are picked from the state of the object
+        database. Recompressing everything again with a full repack only
+        happens when asked to, or once there are too many packs for anything
+        else to help.
+        Args:
+            aggressive (bool): Always do a full repack.
+            threads (int): Number of threads git may use, every core by default.
+        """
+        assert os.path.isdir(self.FULL_REPOSITORY_PATH), "Could not find any repository to optimize."
+        # Repacking would drop the objects only the clones borrowing from the store use.
+        assert not is_shared_store(os.path.basename(os.path.normpath(self.REPO_DIR))), \
+            "The shared store can not be optimized, its clones depend on every object in it."
+
+        stats: dict[str, int | bool] = self.get_object_stats()
+        config: list[str] = ["-c", f"pack.threads={threads}"] if threads else []
+        tasks: list[str] = []
+
+        if stats["garbage"] and self.__remove_garbage():
+            tasks.append("garbage")
+
+        # -l leaves alone the objects borrowed from the shared store.
+        if aggressive or stats["packs"] >= FULL_REPACK_PACKS_LIMIT:
+            tasks.append("full-repack")
+            self.__git([*config, "repack", "-a", "-d", "-l", "-f", "--depth=250", "--window=250"])
+        elif stats["packs"] >= PACKS_LIMIT:
+            tasks.append("geometric-repack")
+            self.__git([*config, "repack", "-d", "-l", "--geometric=2", "--write-midx"])
+        else:
+            if stats["loose"] > LOOSE_OBJECTS_LIMIT:
+                tasks.append("loose-objects")
+                self.__git([*config, "repack", "-d", "-l"])
+                stats["packs"] = int(stats["packs"]) + 1
+
+            if stats["packs"] > 1 and (stats["multi_pack_index_stale"] or tasks):
+                tasks.append("multi-pack-index")
+                self.__git(["multi-pack-index", "write"])
+
+        if stats["commit_graph_stale"]:
+            tasks.append("commit-graph")
+            self.__git(["commit-graph", "write", "--reachable", "--split"])
+
+        if tasks:
+            print(f"[INFO] Optimized {self.REPO_DIR}: {', '.join(tasks)}.")
+        else:
+            print(f"[INFO] {self.REPO_DIR} is already optimized.")
+
+        return tasks
+
+class RepositoryResult():
+    """
+    The outcome of syncing a single repository.
+    """
+    def __init__(self, repo_url: str, repo_dir: str):
+        self.repo_url: str = repo_url
+        self.repo_dir: str = repo_dir
+        self.action: str = ""
+        self.success: bool = False
+        self.duration: float = 0.0
+        self.error: str = ""
+
+    def __str__(self) -> str:
+        status: str = "ok" if self.success else f"failed: {self.error}"
+        return f"{self.repo_dir:<30} {self.action or '-':<8} {self.duration:>8.2f}s  {status}"
+
+class RepositoryPool():
+    """
+    Clones or updates several repositories at the same time.
+    """
+    def __init__(self, repositories: list[tuple[str, str]], max_workers: int | None = None,
+                 repositories_dir: str | None = None, **clone_options: Any):
+        self.repositories: list[tuple[str, str]] = repositories
+        self.max_workers: int = max_workers or min(16, len(repositories) or 1)
+        self.repositories_dir: str = repositories_dir or \
+            os.path.join(os.getcwd(), "modules/repositories")
+        self.clone_options: dict[str, Any] = clone_options
+
+    def __run(self, repo_url: str, repo_dir: str,
+              action: Callable[[RepositoryManager], str]) -> RepositoryResult:
+        result = RepositoryResult(repo_url, repo_dir)
+        manager = RepositoryManager(repo_url, repo_dir, self.repositories_dir,
+                                    capture_output=True, **self.clone_options)
+        start: float = time.perf_counter()
 
         try:
-            os.chdir(self.REPOSITORIES_DIR)
-        except Exception as e:
-            raise e
+            result.action = action(manager)
+            result.success = True
+        except subprocess.CalledProcessError as e:
+            output: list[str] = (e.stderr or "").strip().splitlines()
+            result.error = output[-1] if output else str(e)
+        except Exception as e: # pylint: disable=broad-exception-caught
+            result.error = str(e)
+
+        result.duration = time.perf_counter() - start
+
+        return result
+
+    def sync(self) -> list[RepositoryResult]:
+        """
+        Clones or updates every repository, returning the results in the same order.
+        A repository failing does not stop the others.
+        """
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            return list(executor.map(
+                lambda repository: self.__run(*repository, lambda manager: manager.sync_repo()),
+                self.repositories))
+
+    def optimize(self, cpus: int | None = None, aggressive: bool = False) -> list[RepositoryResult]:
+        """
+        Optimizes every repository, splitting `cpus` between the repositories
+        optimized at the same time and the threads git uses for each of them.
+        """
+        cpus = cpus or len(os.sched_getaffinity(0))
+        max_workers: int = max(1, min(self.max_workers, cpus))
+        threads: int = max(1, cpus // max_workers)
+
+        def optimize(manager: RepositoryManager) -> str:
+            return ",".join(manager.optimize(aggressive, threads)) or "none"
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(lambda repository: self.__run(*repository, optimize),
+                                     self.repositories))
+
+def get_shared_store_name(blob_filter: str | None = None) -> str:
+    """
+    Returns the name of the store shared by the clones made with `blob_filter`.
+    A complete clone can not check out its work tree from the objects of a
+    store missing blobs, so each filter gets a store of its own.
+    """
+    if not blob_filter:
+        return SHARED_STORE_NAME
+
+    return f".shared-{re.sub(r'[^A-Za-z0-9]+', '-', blob_filter)}.git"
+
+def is_shared_store(name: str) -> bool:
+    """
+    Checks if a directory name is the one of a shared store.
+    """
+    return re.fullmatch(r"\.shared(-[A-Za-z0-9-]+)?\.git", name) is not None
+
+def read_repository_list(file: str) -> list[tuple[str, str]]:
+    """
+    Reads a list of repositories, one "<url> [directory]" per line.
+    Empty lines and lines starting with # are ignored.
+    """
+    repositories: list[tuple[str, str]] = []
+
+    with open(file, "r", encoding="utf-8") as f:
+        for line in f:
+            fields: list[str] = line.split()
+
+            if not fields or fields[0].startswith("#"):
+                continue
+
+            repo_url: str = fields[0]
+            repo_dir: str = fields[1] if len(fields) > 1 else \
+                os.path.basename(repo_url.rstrip("/")).removesuffix(".git")
+            repositories.append((repo_url, repo_dir))
+
+    return repositories
+
+def list_repositories(repositories_dir: str | None = None) -> list[tuple[str, str]]:
+    """
+    Lists the repositories cloned in `repositories_dir`. The shared store is
+    left out, it is not a repository of its own.
+    """
+    repositories_dir = repositories_dir or os.path.join(os.getcwd(), "modules/repositories")
+
+    if not os.path.isdir(repositories_dir):
+        return []
+
+    return [("", entry.name) for entry in sorted(os.scandir(repositories_dir),
+                                                 key=lambda entry: entry.name)
+            if os.path.isdir(os.path.join(entry.path, ".git"))]
@@ -6,30 +6,48 @@ Module containing the RootFSManager class.
 
 import os
 import getpass
-import shutil
 import sys
+import tempfile
 
+from lib.backup_store import BACKUP_STORE_PATH, BackupStore, new_run_id
+from lib.file_copier import CopyJob, FileCopier
+from lib.manifest import Manifest, hash_file
+from lib.plan import FileAction
 from lib.platform import Platform
 
 class RootFSManager():
     """
     Handles files customized by the user.
+
+    The files are installed from `rootfs_dir` into `target_dir`, keeping the
+    manifest and the backups in `state_dir`. Root is only required when
+    installing into the real root filesystem.
     """
-    def __init__(self):
+    def __init__(self, rootfs_dir: str | None = None, target_dir: str = "/",
+                 state_dir: str = BACKUP_STORE_PATH):
+        rootfs_dir = rootfs_dir or os.path.join(os.getcwd(), "modules/rootfs")
         self.local_dirs: dict[str, str] = {
-            "etc_dir": os.path.join(os.getcwd() + '/modules/rootfs/etc'),
-            "home_dir": os.path.join(os.getcwd() + '/modules/rootfs/home'),
-            "usr_dir": os.path.join(os.getcwd() + '/modules/rootfs/usr'),
+            "etc_dir": os.path.join(rootfs_dir, "etc"),
+            "home_dir": os.path.join(rootfs_dir, "home"),
+            "usr_dir": os.path.join(rootfs_dir, "usr"),
         }
+        self.TARGET_DIR: str = target_dir
+        self.STATE_DIR: str = state_dir
         self.CURRENT_USER: str = getpass.getuser()
-        self.CURRENT_DISTRO = Platform().get_distro()
-        self.CURRENT_PLATFORM = Platform().get_platform()
+        self.RUN_ID: str = new_run_id()
+        self.PLATFORM: Platform = Platform()
+        self.CURRENT_DISTRO = self.PLATFORM.get_distro()
+        self.CURRENT_PLATFORM = self.PLATFORM.get_platform()
 
         if not self.CURRENT_PLATFORM == "linux":
             print(f"[!] This script is only meant to run on Linux, not {self.CURRENT_PLATFORM}.")
             sys.exit(1)
 
-        if not self.__is_admin():
+    def __require_admin(self) -> None:
+        """
+        Raises an error if the current user can not modify system files.
+        """
+        if os.path.realpath(self.TARGET_DIR) == "/" and not self.__is_admin():
             raise PermissionError("You must run this module as root to modify system files.")
 
     def __is_admin(self) -> bool:
@@ -75,7 +93,9 @@ class RootFSManager():
         """
         file_list: list[str] = []
 
-        for path, _, files in os.walk(from_directory):
+        for path, directories, files in os.walk(from_directory):
+            # Bytecode left by lib/platform.py importing the shared modules of usr/local/lib.
+            directories[:] = [directory for directory in directories if directory != "__pycache__"]
             for file in files:
                 try:
                     file_path = os.path.join(path, file)
@@ -86,10 +106,12 @@ class RootFSManager():
                     raise e
         return file_list
 
-    def __copy_files(self, source: str, destination: str,
-                    verbose: bool = False) -> None:
+    def __plan_files(self, source: str, destination: str, verbose: bool = False,
+                     manifest: Manifest | None = None) -> list[FileAction]:
         """
-        Copies the files to their respective directories.
+        Decides what has to be done for every file of the source directory.
+        Without a manifest every existing destination is overwritten, with one
+        the destination is compared by size first and hashed only on ties.
         """
         if not source:
             raise ValueError("No source was provided.")
@@ -104,6 +126,7 @@ class RootFSManager():
             raise ValueError("Source and destination cannot be the same.")
 
         file_list: list[str] = self.__create_list(source, verbose)
+        actions: list[FileAction] = []
 
         for file in file_list:
             source_path: str = os.path.relpath(file)
@@ -121,35 +144,212 @@ is_dir={is_dir}""")
                 assert self.__is_file(source_path), f"{source_path} is not a file."
 
                 if not is_dir:
-                    print(f"[!] Skipped directory '{os.path.dirname(destination_path)}'" + \
-                           " since it does not exist.")
-                    file_list.remove(file)
+                    actions.append(FileAction(FileAction.MISSING_PARENT, source_path,
+                                              destination_path))
+                    continue
 
-                if verbose:
-                    print(f"[VERBOSE] Backing up '{destination_path}' to '{destination_path}.backup'...")
-                shutil.copyfile(destination_path, f"{destination_path}.backup")
+                try:
+                    destination_stat: os.stat_result = os.stat(destination_path)
+                except FileNotFoundError:
+                    actions.append(FileAction(FileAction.CREATE, source_path, destination_path))
+                    continue
+
+                if manifest is None:
+                    actions.append(FileAction(FileAction.OVERWRITE, source_path,
+                                              destination_path))
+                    continue
 
-                if verbose:
-                    print(f"[VERBOSE] Copying '{source_path}' to '{destination_path}'...")
-                shutil.copyfile(source_path, destination_path)
+                source_stat: os.stat_result = os.stat(source_path)
+
+                if self.__is_unchanged(destination_path, source_path, source_stat,
+                                       destination_stat, manifest):
+                    actions.append(FileAction(FileAction.SKIP, source_path, destination_path,
+                                              source_stat))
+                else:
+                    actions.append(FileAction(FileAction.OVERWRITE, source_path,
+                                              destination_path, source_stat))
             except Exception as e:
                 raise e
 
-    def install_files(self, verbose: bool = False) -> None:
+        return actions
+
+    def __is_unchanged(self, destination_path: str, source_path: str,
+                       source_stat: os.stat_result, destination_stat: os.stat_result,
+                       manifest: Manifest) -> bool:
+        """
+        Checks if the destination already has the same content as the source.
+        Files of different sizes are never hashed, a single stat is enough when
+        the destination matches the manifest, otherwise both files are hashed.
+        """
+        if destination_stat.st_size != source_stat.st_size:
+            return False
+
+        source_digest: str = manifest.source_hash(destination_path, source_path, source_stat)
+
+        if manifest.is_up_to_date(destination_path, source_digest, destination_stat):
+            return True
+
+        if hash_file(destination_path) != source_digest:
+            return False
+
+        manifest.update(destination_path, source_path, source_digest,
+                        source_stat, destination_stat)
+        return True
+
+    def __copy_files(self, actions: list[FileAction], copier: FileCopier,
+                     verbose: bool = False, manifest: Manifest | None = None) -> None:
+        """
+        Copies the files to their respective directories.
+        When a manifest is given the installed files are recorded in it.
+        """
+        copy_jobs: list[CopyJob] = []
+
+        for action in actions:
+            match action.action:
+                case FileAction.MISSING_PARENT:
+                    print(f"[!] Skipped directory '{os.path.dirname(action.destination)}'" + \
+                           " since it does not exist.")
+                case FileAction.SKIP:
+                    if verbose:
+                        print(f"[VERBOSE] '{action.destination}' is up to date, skipping...")
+                case FileAction.OVERWRITE:
+                    if verbose:
+                        print(f"[VERBOSE] Backing up '{action.destination}'...")
+                    copy_jobs.append(CopyJob(action.source, action.destination, True))
+                case FileAction.CREATE:
+                    copy_jobs.append(CopyJob(action.source, action.destination))
+                case _:
+                    raise ValueError(f"Unknown action: {action.action}")
+
+        copier.run(copy_jobs)
+
+        if manifest is not None:
+            for job in copy_jobs:
+                source_stat: os.stat_result = os.stat(job.source)
+                source_digest: str = manifest.source_hash(job.destination, job.source,
+                                                          source_stat)
+                manifest.update(job.destination, job.source, source_digest,
+                                source_stat, os.stat(job.destination))
+
+    def __get_directories(self, names: list[str] | None = None) -> list[tuple[str, str]]:
+        """
+        Returns the local directories paired with the directory they are installed to.
+        Only the directories in `names` ("home", "etc" or "usr") are returned if given.
+        """
+        directories: dict[str, tuple[str, str]] = {}
+
+        if not self.CURRENT_USER == "root":
+            directories["home"] = (self.local_dirs["home_dir"],
+                                   os.path.join(self.TARGET_DIR, "home", self.CURRENT_USER))
+        directories["etc"] = (self.local_dirs["etc_dir"], os.path.join(self.TARGET_DIR, "etc"))
+        directories["usr"] = (self.local_dirs["usr_dir"], os.path.join(self.TARGET_DIR, "usr"))
+
+        return [(source, destination) for name, (source, destination) in directories.items()
+                if (names is None or name in names) and self.__is_directory(source)]
+
+    def plan_files(self, verbose: bool = False) -> list[FileAction]:
+        """
+        Returns what installing the files would do, without touching anything.
+        It does not need to be run as root.
+        """
+        manifest = Manifest(os.path.join(self.STATE_DIR, "manifest.json"))
+        manifest.load()
+        actions: list[FileAction] = []
+
+        try:
+            for source, destination in self.__get_directories():
+                actions.extend(self.__plan_files(source, destination, verbose, manifest))
+        except Exception as e:
+            raise e
+
+        return actions
+
+    def install_files(self, verbose: bool = False, incremental: bool = False,
+                      jobs: int | None = None, directories: list[str] | None = None,
+                      quiet: bool = False) -> None:
         """
         Installs the files to the respective directories.
+        In incremental mode files that have not changed since the last run are skipped.
+        Up to `jobs` directories are copied in parallel.
+
+        `directories` limits the install to some of "home", "etc" and "usr". It can
+        be called for each of them at the same time, the backups of every call made
+        on the same RootFSManager are recorded as a single run; pass `quiet` then,
+        the caller reports the run once every call is done.
         """
-        paths: dict[str, str] = {
-            "boot": "/boot",
-            "etc": "/etc",
-            "home": os.path.join("/home", os.path.sep, self.CURRENT_USER),
-            "usr": "/usr"
-        }
+        self.__require_admin()
+
+        backup_store = BackupStore(self.STATE_DIR, self.RUN_ID)
+        copier = FileCopier(jobs, verbose, backup_store, quiet)
+        manifest: Manifest | None = None
+
+        if incremental:
+            manifest = Manifest(os.path.join(self.STATE_DIR, "manifest.json"))
+            manifest.load()
+
+        try:
+            for source, destination in self.__get_directories(directories):
+                actions: list[FileAction] = self.__plan_files(source, destination,
+                                                              verbose, manifest)
+                self.__copy_files(actions, copier, verbose, manifest)
+        except Exception as e:
+            raise e
+        finally:
+            backup_store.save()
+            if manifest is not None:
+                manifest.save()
+
+        if backup_store.files and not quiet:
+            print(f"[INFO] Overwritten files were backed up as run '{backup_store.run_id}'.")
+
+    def install_generated_files(self, files: dict[str, str], verbose: bool = False) -> None:
+        """
+        Installs files generated at runtime, keyed by their path relative to
+        the root filesystem such as "etc/systemd/zram-generator.conf". They
+        are backed up and skipped when unchanged like the other files.
+        """
+        self.__require_admin()
+
+        backup_store = BackupStore(self.STATE_DIR, self.RUN_ID)
+        copier = FileCopier(None, verbose, backup_store)
+        manifest = Manifest(os.path.join(self.STATE_DIR, "manifest.json"))
+        manifest.load()
+
+        with tempfile.TemporaryDirectory(prefix="linux-config-") as staging_dir:
+            for relative_path, content in files.items():
+                path: str = os.path.join(staging_dir, relative_path)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, "w", encoding="utf-8") as f:
+                    f.write(content)
+
+            try:
+                actions: list[FileAction] = self.__plan_files(staging_dir, self.TARGET_DIR,
+                                                              verbose, manifest)
+                self.__copy_files(actions, copier, verbose, manifest)
+            except Exception as e:
+                raise e
+            finally:
+                backup_store.save()
+                manifest.save()
+
+        if backup_store.files:
+            print(f"[INFO] Overwritten files were backed up as run '{backup_store.run_id}'.")
+
+    def list_backups(self) -> list[str]:
+        """
+        Returns the runs that have backed up files.
+        """
+        return BackupStore(self.STATE_DIR).list_runs()
+
+    def restore_files(self, run_id: str, verbose: bool = False) -> None:
+        """
+        Restores the files overwritten by a previous run.
+        """
+        self.__require_admin()
 
         try:
-            if not self.CURRENT_USER == "root":
-                self.__copy_files(self.local_dirs["home_dir"], paths["home"], verbose)
-            self.__copy_files(self.local_dirs["etc_dir"], paths["etc"], verbose)
-            self.__copy_files(self.local_dirs["usr_dir"], paths["usr"], verbose)
+            restored: list[str] = BackupStore(self.STATE_DIR).restore(run_id, verbose)
         except Exception as e:
             raise e
+
+        print(f"[INFO] Restored {len(restored)} files from run '{run_id}'.")
@@ -1,51 +1,190 @@
-#!/bin/sh
+#!/usr/bin/env python3
 
+import argparse
+import ctypes
+import ctypes.util
+import errno
+import fcntl
 import getpass
+import math
 import os
+import struct
 import subprocess
 import sys
 
 SWAP_FILE_LOCATION: str ="/swapfile"
 SWAP_LABEL: str ="swap"
-SWAP_FILE_SIZE: int = 32768
 SWAPON_ARGS: list[str] = ["--priority", "60"]
 
-IS_SWAP_FILE_PRESENT: bool = os.path.exists(SWAP_FILE_LOCATION)
+# Filesystems where a file allocated without writing it can be used as swap.
+FALLOCATE_FILESYSTEMS: tuple[str, ...] = ("ext4", "xfs", "btrfs")
+WRITE_CHUNK_SIZE: int = 8 * 1024 * 1024
+MEBIBYTE: int = 1024 * 1024
+GIBIBYTE: int = 1024 * MEBIBYTE
+
+# From linux/fs.h, swap files on btrfs must not be copy-on-write.
+FS_IOC_GETFLAGS: int = 0x80086601
+FS_IOC_SETFLAGS: int = 0x40086602
+FS_NOCOW_FL: int = 0x00800000
 
-CREATE_SWAP_FILE_COMMAND: list[str] = ["dd", "if=/dev/zero", f"of={SWAP_FILE_LOCATION}",
-                                       "bs=1M", f"count={SWAP_FILE_SIZE}", "conv=fsync",
-                                       "status=progress"]
-SECURE_SWAP_FILE_COMMAND: list[str] = ["chmod", "0600", SWAP_FILE_LOCATION]
 FORMAT_SWAP_FILE_COMMAND: list[str] = ["mkswap", "-L", SWAP_LABEL, SWAP_FILE_LOCATION]
 ENABLE_SWAP_FILE_COMMAND: list[str] = ["swapon", *SWAPON_ARGS, SWAP_FILE_LOCATION]
 
 CURRENT_USER: str = getpass.getuser()
 
+def get_memory_size(meminfo: str = "/proc/meminfo") -> int:
+    """
+    Returns the installed RAM in bytes.
+    """
+    with open(meminfo, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.startswith("MemTotal:"):
+                return int(line.split()[1]) * 1024
+
+    raise RuntimeError(f"Could not find the amount of memory in {meminfo}.")
+
+def get_swap_file_size(memory_size: int, hibernation: bool = False) -> int:
+    """
+    Returns the size of the swap file in bytes: the square root of the RAM
+    in GiB rounded up, plus the whole RAM when hibernating to the swap file.
+    """
+    size: int = max(1, math.ceil(math.sqrt(memory_size / GIBIBYTE))) * GIBIBYTE
+
+    if hibernation:
+        size += math.ceil(memory_size / MEBIBYTE) * MEBIBYTE
+
+    return size
+
+def get_filesystem_type(path: str, mounts: str = "/proc/self/mounts") -> str:
+    """
+    Returns the type of the filesystem the path is on.
+    """
+    path = os.path.realpath(path)
+    mount_point: str = ""
+    filesystem_type: str = ""
+
+    with open(mounts, "r", encoding="utf-8") as f:
+        for line in f:
+            fields: list[str] = line.split()
+            # Spaces and other characters are escaped as octal in the mount points.
+            point: str = fields[1].encode().decode("unicode_escape")
+
+            if (path == point or path.startswith(point.rstrip("/") + "/")) and \
+                    len(point) >= len(mount_point):
+                mount_point, filesystem_type = point, fields[2]
+
+    return filesystem_type
+
+def disable_copy_on_write(fd: int) -> None:
+    """
+    Sets the No_COW attribute, like `chattr +C`. It only has an effect while
+    the file is empty.
+    """
+    flags: int = struct.unpack("i", fcntl.ioctl(fd, FS_IOC_GETFLAGS, struct.pack("i", 0)))[0]
+    fcntl.ioctl(fd, FS_IOC_SETFLAGS, struct.pack("i", flags | FS_NOCOW_FL))
+
+def allocate(fd: int, size: int) -> bool:
+    """
+    Reserves the blocks of the file without writing them. Returns False when
+    the filesystem can not do it; os.posix_fallocate() would silently fall
+    back to writing every block instead.
+    """
+    libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+    libc.fallocate.argtypes = [ctypes.c_int, ctypes.c_int, ctypes.c_int64, ctypes.c_int64]
+
+    if libc.fallocate(fd, 0, 0, size) == 0:
+        return True
+
+    error: int = ctypes.get_errno()
+    if error in (errno.EOPNOTSUPP, errno.ENOSYS):
+        return False
+
+    raise OSError(error, os.strerror(error))
+
+def write_zeros(fd: int, size: int) -> None:
+    """
+    Writes the file chunk by chunk, showing the progress.
+    """
+    chunk: bytes = bytes(WRITE_CHUNK_SIZE)
+    written: int = 0
+
+    while written < size:
+        written += os.write(fd, memoryview(chunk)[:min(WRITE_CHUNK_SIZE, size - written)])
+        print(f"\rWriting swap file... {written // MEBIBYTE}/{size // MEBIBYTE} MiB " + \
+              f"({written * 100 // size}%)", end="", flush=True)
+
+    print()
+
+def create_swap_file(path: str, size: int) -> str:
+    """
+    Creates a swap file only readable by root, allocating it where the
+    filesystem supports it and writing it otherwise. Returns how it was created.
+    """
+    directory: str = os.path.dirname(path) or "."
+    filesystem_type: str = get_filesystem_type(directory)
+    stats = os.statvfs(directory)
+    free_space: int = stats.f_bavail * stats.f_frsize
+
+    if size > free_space:
+        raise RuntimeError(f"{size // MEBIBYTE} MiB are needed but only " + \
+                           f"{free_space // MEBIBYTE} MiB are free.")
+
+    fd: int = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+
+    try:
+        os.fchmod(fd, 0o600)
+
+        if filesystem_type == "btrfs":
+            disable_copy_on_write(fd)
+
+        if filesystem_type in FALLOCATE_FILESYSTEMS and allocate(fd, size):
+            method: str = "allocated"
+        else:
+            write_zeros(fd, size)
+            method = "written"
+
+        os.fsync(fd)
+    except BaseException:
+        os.close(fd)
+        os.unlink(path)
+        raise
+
+    os.close(fd)
+
+    return method
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Create and enable a swap file.")
+    parser.add_argument("--size",
+                        type=int,
+                        default=None,
+                        help="Size of the swap file in MiB, picked from the installed RAM by default")
+    parser.add_argument("--hibernation",
+                        action="store_true",
+                        default=False,
+                        help="Make the swap file large enough to hibernate to it")
+    return parser.parse_args()
+
 if __name__ == "__main__":
+    args = parse_args()
+
     if not CURRENT_USER == "root":
         print("This script must be run as root.")
         sys.exit(1)
 
-    if IS_SWAP_FILE_PRESENT:
+    if os.path.exists(SWAP_FILE_LOCATION):
         print(f"{SWAP_FILE_LOCATION} already exists, creation skipped.")
         sys.exit(2)
 
     try:
-        print("Creating swap file...")
-        process = subprocess.run(CREATE_SWAP_FILE_COMMAND, check=True)
-        process.check_returncode()
+        swap_file_size: int = args.size * MEBIBYTE if args.size else \
+            get_swap_file_size(get_memory_size(), args.hibernation)
+        print(f"Creating a {swap_file_size // MEBIBYTE} MiB swap file...")
+        print(f"The swap file was {create_swap_file(SWAP_FILE_LOCATION, swap_file_size)}.")
     except Exception as e:
         print(f"An error occurred while creating the swap file: {e}")
         sys.exit(3)
 
-    try:
-        print("Securing swap file...")
-        process = subprocess.run(SECURE_SWAP_FILE_COMMAND, check=True)
-        process.check_returncode()
-    except Exception as e:
-        print(f"An error occurred while securing the swap file: {e}")
-        sys.exit(4)
-
     try:
         print("Formatting swap file...")
         process = subprocess.run(FORMAT_SWAP_FILE_COMMAND, check=True)
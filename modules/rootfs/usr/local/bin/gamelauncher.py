@@ -1,17 +1,750 @@
 #!/usr/bin/env python3
+import collections
+import configparser
+import getpass
+import glob
+import json
+import math
 import os
+import platform
+import sqlite3
+import time
 import sys
 import subprocess
 import shutil
 from typing import Any
 
+# The helpers shared with lib, installed next to the launcher by the rootfs module.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))),
+                                "lib/linux-config"))
+# pylint: disable-next=wrong-import-position
+from cpu_topology import CpuTopology, format_cpu_list
+
+TOOLS: tuple[str, ...] = ("gamescope", "mangohud", "mangoapp", "gamemoderun")
+
+# Where the output of the game goes: a rotating log file, the terminal the
+# launcher runs in, or the launcher process is replaced by the game.
+OUTPUT_MODES: tuple[str, ...] = ("log", "inherit", "exec")
+LOG_MAX_SIZE: int = 16 * 1024 * 1024
+LOG_BACKUP_COUNT: int = 2
+# Lines of output kept in memory to show when the game crashes.
+CRASH_REPORT_LINES: int = 50
+# Longer lines are split, so a single line can not take all the memory either.
+MAX_LINE_LENGTH: int = 64 * 1024
+
+# Frame times percentiles kept for every session, in milliseconds.
+FRAMETIME_PERCENTILES: tuple[float, ...] = (50.0, 90.0, 95.0, 99.0, 99.9)
+
+# ioprio_set(2) has no wrapper in Python, its number depends on the architecture.
+IOPRIO_SET_SYSCALLS: dict[str, int] = {
+    "x86_64": 251,
+    "i686": 289,
+    "aarch64": 30,
+    "riscv64": 30,
+    "armv7l": 314,
+    "ppc64le": 273,
+}
+IOPRIO_WHO_PROCESS: int = 1
+IOPRIO_CLASS_BE: int = 2
+IOPRIO_CLASS_SHIFT: int = 13
+
+# Slices moved off the CPUs of the game during the session, with the
+# systemctl command of the manager they belong to.
+BACKGROUND_SLICES: tuple[tuple[tuple[str, ...], str], ...] = (
+    (("systemctl", "--no-ask-password"), "system.slice"),
+    (("systemctl", "--user"), "background.slice"),
+)
+# polkit action needed to change the units of the system manager.
+MANAGE_UNITS_ACTION: str = "org.freedesktop.systemd1.manage-units"
+
+# How every setting of a profile is read, settings left out are detected or use the default.
+PROFILE_SETTINGS: dict[str, type] = {
+    "width": int,
+    "height": int,
+    "refresh_rate": int,
+    "fullscreen": bool,
+    "grab_cursor": bool,
+    "mangohud": bool,
+    "dlsym": bool,
+    "gamemode": bool,
+    "mangohud_log": bool,
+    "cpu_pinning": bool,
+    "isolate_cpus": bool,
+    "nice": int,
+    "ioprio": int,
+}
+
+DEFAULT_PROFILE: dict[str, Any] = {
+    "width": 1920,
+    "height": 1080,
+    "refresh_rate": 60,
+    "fullscreen": False,
+    "grab_cursor": True,
+    "mangohud": True,
+    "dlsym": False,
+    "gamemode": True,
+    "mangohud_log": False,
+    "cpu_pinning": True,
+    "isolate_cpus": False,
+    # Lowering it needs privileges most users do not have, profiles can still ask for it.
+    "nice": 0,
+    # Best effort class level, from 0 (highest) to 7.
+    "ioprio": 0,
+}
+
+# Profiles shipped with the launcher, the user's own ones take precedence.
+BUILTIN_PROFILES: dict[str, dict[str, Any]] = {
+    "255710": {"dlsym": True},
+}
+
+def get_config_dir() -> str:
+    """
+    Returns the directory the launcher reads its profiles from.
+    """
+    return os.path.join(os.environ.get("XDG_CONFIG_HOME") or os.path.expanduser("~/.config"),
+                        "gamelauncher")
+
+def get_state_dir() -> str:
+    """
+    Returns the directory the launcher keeps the game logs in.
+    """
+    return os.path.join(os.environ.get("XDG_STATE_HOME") or os.path.expanduser("~/.local/state"),
+                        "gamelauncher")
+
+def get_data_dir() -> str:
+    """
+    Returns the directory the launcher keeps the session database in.
+    """
+    return os.path.join(os.environ.get("XDG_DATA_HOME") or os.path.expanduser("~/.local/share"),
+                        "gamelauncher")
+
+def get_cache_dir() -> str:
+    """
+    Returns the directory the launcher keeps its cache in.
+    """
+    return os.path.join(os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"),
+                        "gamelauncher")
+
+def get_game_cpus(topology: CpuTopology) -> list[int]:
+    """
+    Returns the CPUs to run a game on: the cache domain with the largest
+    cache (the V-Cache CCD of X3D CPUs), then the most performance CPUs
+    and the highest clock, keeping only its performance CPUs.
+    SMT siblings are kept, they share the core and its caches.
+    """
+    def score(domain: int) -> tuple[int, int, int]:
+        cpus: list[int] = topology.cache_domains[domain]
+        return (topology.cache_sizes[domain],
+                sum(1 for cpu in cpus if cpu in topology.performance_cpus),
+                max(topology.max_frequencies.get(cpu, 0) for cpu in cpus))
+
+    domain: list[int] = topology.cache_domains[max(topology.cache_domains, key=score)]
+
+    return [cpu for cpu in domain if cpu in topology.performance_cpus] or domain
+
+def can_manage_system_units() -> bool:
+    """
+    Checks if polkit lets the launcher change system units without asking
+    for a password.
+    """
+    try:
+        return subprocess.run(["pkcheck", "--action-id", MANAGE_UNITS_ACTION,
+                               "--process", str(os.getpid())],
+                              capture_output=True, check=False).returncode == 0
+    except OSError:
+        return False
+
+def set_io_priority(level: int) -> None:
+    """
+    Sets the best effort I/O priority of the process, inherited by its children.
+    """
+    import ctypes # pylint: disable=import-outside-toplevel
+
+    syscall_number: int | None = IOPRIO_SET_SYSCALLS.get(platform.machine())
+
+    if syscall_number is None:
+        raise OSError(f"ioprio_set is not known on {platform.machine()}.")
+
+    libc = ctypes.CDLL(None, use_errno=True)
+    if libc.syscall(syscall_number, IOPRIO_WHO_PROCESS, 0,
+                    IOPRIO_CLASS_BE << IOPRIO_CLASS_SHIFT | level) != 0:
+        error: int = ctypes.get_errno()
+        raise OSError(error, os.strerror(error))
+
+class RotatingLog():
+    """
+    A log file that is rotated once it reaches `max_size`, keeping
+    `backup_count` older files as log.1, log.2...
+    """
+    def __init__(self, path: str, max_size: int = LOG_MAX_SIZE,
+                 backup_count: int = LOG_BACKUP_COUNT):
+        self.path: str = path
+        self.max_size: int = max_size
+        self.backup_count: int = backup_count
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.file = open(path, "ab") # pylint: disable=consider-using-with
+        self.size: int = self.file.tell()
+
+    def __rotate(self) -> None:
+        self.file.close()
+
+        for index in range(self.backup_count - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{index}"):
+                os.replace(f"{self.path}.{index}", f"{self.path}.{index + 1}")
+
+        if self.backup_count > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.unlink(self.path)
+
+        self.file = open(self.path, "ab") # pylint: disable=consider-using-with
+        self.size = 0
+
+    def write(self, data: bytes) -> None:
+        """
+        Appends data to the log, rotating it first if it would grow too large.
+        """
+        if self.size and self.size + len(data) > self.max_size:
+            self.__rotate()
+
+        self.file.write(data)
+        self.size += len(data)
+
+    def close(self) -> None:
+        """
+        Closes the log file.
+        """
+        self.file.close()
+
+class CapabilityCache():
+    """
+    Remembers where the tools are and what they support between launches.
+
+    The tools found are valid as long as PATH and the mtime of its directories
+    do not change, installing or removing a binary changes the mtime of its
+    directory. The result of a probe is valid as long as the binary it ran
+    keeps the same path, inode and mtime, so it is only run again on upgrades.
+    """
+    def __init__(self, path: str | None = None):
+        self.path: str = path or os.path.join(get_cache_dir(), "capabilities.json")
+        self.data: dict[str, Any] = {}
+        self.changed: bool = False
+
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.data = json.load(f)
+        except (OSError, ValueError):
+            self.data = {}
+
+    @staticmethod
+    def __get_path_state() -> dict[str, Any]:
+        directories: dict[str, int] = {}
+
+        for directory in os.environ.get("PATH", os.defpath).split(os.pathsep):
+            try:
+                directories[directory] = os.stat(directory).st_mtime_ns
+            except OSError:
+                directories[directory] = 0
+
+        return {"PATH": os.environ.get("PATH", os.defpath), "directories": directories}
+
+    @staticmethod
+    def __get_file_key(path: str) -> str:
+        stat: os.stat_result = os.stat(path)
+        return f"{path}:{stat.st_ino}:{stat.st_mtime_ns}"
+
+    def find_tools(self, tools: tuple[str, ...] = TOOLS) -> dict[str, str | None]:
+        """
+        Returns the path of every tool, None for the ones that are not installed.
+        """
+        path_state: dict[str, Any] = self.__get_path_state()
+        cached: dict[str, str | None] = self.data.get("tools", {})
+
+        if self.data.get("path_state") == path_state and all(tool in cached for tool in tools):
+            return {tool: cached[tool] for tool in tools}
+
+        found: dict[str, str | None] = {tool: shutil.which(tool) for tool in tools}
+        self.data["path_state"] = path_state
+        self.data["tools"] = found
+        self.changed = True
+
+        return found
+
+    def probe(self, command: list[str]) -> bool:
+        """
+        Returns whether the command succeeds, running it only when its
+        binary changed since the last time.
+        """
+        file_key: str = self.__get_file_key(command[0])
+        key: str = file_key + " " + " ".join(command[1:])
+        probes: dict[str, bool] = self.data.setdefault("probes", {})
+
+        if key not in probes:
+            # Drop the results of older versions of the binary, not the other probes of this one.
+            for old_key in [old_key for old_key in probes
+                            if old_key.startswith(f"{command[0]}:")
+                            and not old_key.startswith(f"{file_key} ")]:
+                del probes[old_key]
+            probes[key] = subprocess.run(command,
+                                         stdout=subprocess.DEVNULL,
+                                         stderr=subprocess.DEVNULL,
+                                         check=False).returncode == 0
+            self.changed = True
+
+        return probes[key]
+
+    def save(self) -> None:
+        """
+        Writes the cache if anything changed, atomically so that launching
+        several games at once can not corrupt it.
+        """
+        if not self.changed:
+            return
+
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        temporary_path: str = f"{self.path}.{os.getpid()}.tmp"
+
+        with open(temporary_path, "w", encoding="utf-8") as f:
+            json.dump(self.data, f)
+        os.replace(temporary_path, self.path)
+        self.changed = False
+
+def __parse_displayid_timings(block: bytes) -> list[tuple[int, int, float]]:
+    """
+    Returns the Type I (DisplayID 1.3) and Type VII (DisplayID 2.0) detailed
+    timings of a DisplayID extension block. Modes with a pixel clock too high
+    for an EDID detailed timing descriptor, such as 1440p at 200 Hz, are only
+    listed there.
+    """
+    timings: list[tuple[int, int, float]] = []
+    offset: int = 5
+    end: int = min(len(block), 5 + block[2])
+
+    while offset + 3 <= end:
+        tag, length = block[offset], block[offset + 2]
+        payload: bytes = block[offset + 3:offset + 3 + length]
+
+        # Type I counts the pixel clock in 10 kHz units, Type VII in 1 kHz units.
+        if tag in (0x03, 0x22):
+            unit: int = 10000 if tag == 0x03 else 1000
+
+            for index in range(0, len(payload) - 19, 20):
+                descriptor: bytes = payload[index:index + 20]
+                pixel_clock: int = (int.from_bytes(descriptor[0:3], "little") + 1) * unit
+                width: int = int.from_bytes(descriptor[4:6], "little") + 1
+                horizontal_blank: int = int.from_bytes(descriptor[6:8], "little") + 1
+                height: int = int.from_bytes(descriptor[12:14], "little") + 1
+                vertical_blank: int = int.from_bytes(descriptor[14:16], "little") + 1
+                timings.append((width, height, pixel_clock / \
+                                ((width + horizontal_blank) * (height + vertical_blank))))
+
+        offset += 3 + length
+
+    return timings
+
+def parse_edid_timings(edid: bytes) -> list[tuple[int, int, float]]:
+    """
+    Returns the width, height and refresh rate of every detailed timing of an
+    EDID, from the base block, its CTA-861 and its DisplayID extensions.
+    The first one is the preferred mode.
+    """
+    offsets: list[int] = list(range(54, 126, 18))
+    timings: list[tuple[int, int, float]] = []
+    extra_timings: list[tuple[int, int, float]] = []
+
+    for block in range(128, len(edid) - 127, 128):
+        # CTA-861 extension, the descriptors start where the data blocks end.
+        if edid[block] == 0x02 and edid[block + 2] >= 4:
+            offsets.extend(range(block + edid[block + 2], block + 110, 18))
+        elif edid[block] == 0x70:
+            extra_timings.extend(__parse_displayid_timings(edid[block:block + 128]))
+
+    for offset in offsets:
+        descriptor: bytes = edid[offset:offset + 18]
+        pixel_clock: int = int.from_bytes(descriptor[0:2], "little") * 10000 \
+            if len(descriptor) == 18 else 0
+
+        # Display descriptors (monitor name, range limits...) have no pixel clock.
+        if pixel_clock == 0:
+            continue
+
+        width: int = descriptor[2] | (descriptor[4] & 0xf0) << 4
+        horizontal_blank: int = descriptor[3] | (descriptor[4] & 0x0f) << 8
+        height: int = descriptor[5] | (descriptor[7] & 0xf0) << 4
+        vertical_blank: int = descriptor[6] | (descriptor[7] & 0x0f) << 8
+        total: int = (width + horizontal_blank) * (height + vertical_blank)
+
+        if total:
+            timings.append((width, height, pixel_clock / total))
+
+    return timings + extra_timings
+
+def read_displays(drm_root: str = "/sys/class/drm") -> list[dict[str, Any]]:
+    """
+    Returns the native mode of every connected display: the preferred
+    resolution, at the highest refresh rate the EDID lists for it.
+    """
+    displays: list[dict[str, Any]] = []
+
+    for connector in sorted(glob.glob(os.path.join(drm_root, "card*-*"))):
+        try:
+            with open(os.path.join(connector, "status"), "r", encoding="utf-8") as f:
+                if f.read().strip() != "connected":
+                    continue
+            with open(os.path.join(connector, "edid"), "rb") as f:
+                timings: list[tuple[int, int, float]] = parse_edid_timings(f.read())
+        except OSError:
+            continue
+
+        if not timings:
+            continue
+
+        width, height, _ = timings[0]
+        refresh_rate: float = max(rate for timing_width, timing_height, rate in timings
+                                  if (timing_width, timing_height) == (width, height))
+        displays.append({
+            "connector": os.path.basename(connector),
+            "width": width,
+            "height": height,
+            "refresh_rate": round(refresh_rate),
+        })
+
+    return displays
+
+def get_display_defaults(drm_root: str = "/sys/class/drm") -> dict[str, Any]:
+    """
+    Returns the resolution and refresh rate of the largest and
+    fastest connected display, nothing if none was found.
+    """
+    displays: list[dict[str, Any]] = read_displays(drm_root)
+
+    if not displays:
+        return {}
+
+    display: dict[str, Any] = max(displays, key=lambda display: (
+        display["width"] * display["height"], display["refresh_rate"]))
+
+    return {key: display[key] for key in ("width", "height", "refresh_rate")}
+
+class ProfileStore():
+    """
+    Launch settings for every game, one file per AppId such as
+    ~/.config/gamelauncher/profiles/255710.conf:
+
+        [profile]
+        width = 1920
+        height = 1080
+        refresh_rate = 144
+        mangohud = no
+
+    A lookup opens a single file no matter how many profiles there are.
+    default.conf applies to every game.
+    """
+    def __init__(self, directory: str | None = None):
+        self.directory: str = directory or os.path.join(get_config_dir(), "profiles")
+
+    def __get_path(self, name: str) -> str:
+        if not name or os.path.basename(name) != name or name.startswith("."):
+            raise ValueError(f"'{name}' is not a valid profile name.")
+        return os.path.join(self.directory, f"{name}.conf")
+
+    def load(self, name: str) -> dict[str, Any]:
+        """
+        Returns the settings of a profile, nothing if there is no such profile.
+        """
+        parser = configparser.ConfigParser()
+
+        if not parser.read(self.__get_path(name)) or not parser.has_section("profile"):
+            return {}
+
+        profile: dict[str, Any] = {}
+
+        for key, value_type in PROFILE_SETTINGS.items():
+            if not parser.has_option("profile", key):
+                continue
+            if value_type is bool:
+                profile[key] = parser.getboolean("profile", key)
+            else:
+                profile[key] = parser.getint("profile", key)
+
+        return profile
+
+    def save(self, name: str, profile: dict[str, Any]) -> None:
+        """
+        Writes the settings of a profile.
+        """
+        parser = configparser.ConfigParser()
+        parser["profile"] = {key: ("yes" if value else "no") if isinstance(value, bool)
+                             else str(value)
+                             for key, value in profile.items() if key in PROFILE_SETTINGS}
+
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self.__get_path(name), "w", encoding="utf-8") as f:
+            parser.write(f)
+
+    def resolve(self, app_id: str, drm_root: str = "/sys/class/drm") -> dict[str, Any]:
+        """
+        Returns the settings to launch a game with, from the lowest precedence
+        to the highest: the defaults, the connected display, default.conf, the
+        built-in profile of the game and the profile of the game.
+        """
+        profile: dict[str, Any] = dict(DEFAULT_PROFILE)
+        profile.update(get_display_defaults(drm_root))
+        profile.update(self.load("default"))
+
+        if app_id:
+            profile.update(BUILTIN_PROFILES.get(app_id, {}))
+            profile.update(self.load(app_id))
+
+        return profile
+
+def __parse_frametimes(rows: list[str], column: int) -> list[float]:
+    """
+    Converts the frametime column of the rows one value at a time,
+    dropping the values that are not numbers.
+    """
+    frametimes: list[float] = []
+
+    for row in rows:
+        try:
+            frametime: float = float(row.split(",", column + 1)[column])
+        except ValueError:
+            continue
+        if not math.isnan(frametime):
+            frametimes.append(frametime)
+
+    return frametimes
+
+def read_mangohud_log(path: str) -> tuple[dict[str, str], Any]:
+    """
+    Reads a MangoHud CSV log: a line of system information names, their
+    values, the names of the columns and then a row per frame. Returns the
+    system information and the frame times in milliseconds, as a numpy array
+    if numpy is installed and a list otherwise.
+    """
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        system: dict[str, str] = dict(zip(f.readline().strip().split(","),
+                                          f.readline().strip().split(",")))
+        columns: list[str] = f.readline().strip().split(",")
+        data: str = f.read()
+
+    if "frametime" not in columns:
+        raise ValueError(f"{path} is not a MangoHud log, it has no frametime column.")
+
+    column: int = columns.index("frametime")
+    separators: int = len(columns) - 1
+    # Rows without every column are dropped, like the last one when the game was killed.
+    rows: list[str] = [line for line in data.splitlines() if line.count(",") == separators]
+
+    try:
+        import numpy # pylint: disable=import-outside-toplevel
+    except ImportError:
+        return system, __parse_frametimes(rows, column)
+
+    # The C parser of loadtxt converts the whole column at once, it only gives
+    # up on values that are not numbers, which are then dropped one by one.
+    try:
+        values = numpy.loadtxt(rows, delimiter=",", usecols=(column,), dtype=float, ndmin=1)
+    except ValueError:
+        values = numpy.array(__parse_frametimes(rows, column), dtype=float)
+
+    return system, values[~numpy.isnan(values)]
+
+def __percentile(sorted_values: list[float], percentile: float) -> float:
+    """
+    Interpolates linearly between the closest ranks, like numpy.percentile.
+    """
+    position: float = (len(sorted_values) - 1) * percentile / 100
+    lower: int = math.floor(position)
+    upper: int = min(lower + 1, len(sorted_values) - 1)
+
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * \
+        (position - lower)
+
+def summarize_frametimes(frametimes: Any) -> dict[str, float]:
+    """
+    Returns the average FPS, the 1% and 0.1% lows and the frame time
+    percentiles. The lows are the FPS of the 99th and 99.9th percentile
+    frame times, how fast the game runs apart from its slowest frames.
+    """
+    try:
+        import numpy # pylint: disable=import-outside-toplevel
+    except ImportError:
+        values: list[float] = sorted(frametime for frametime in frametimes if frametime > 0)
+        total: float = math.fsum(values)
+        percentiles: list[float] = [__percentile(values, percentile)
+                                    for percentile in FRAMETIME_PERCENTILES] if values else []
+    else:
+        array = numpy.asarray(frametimes, dtype=float)
+        array = array[array > 0]
+        values = array
+        total = float(array.sum())
+        percentiles = [float(value) for value in
+                       numpy.percentile(array, FRAMETIME_PERCENTILES)] if len(array) else []
+
+    if not percentiles:
+        raise ValueError("The log does not have any frame.")
+
+    summary: dict[str, float] = {
+        "frames": len(values),
+        "duration": total / 1000,
+        "avg_fps": 1000 * len(values) / total,
+    }
+
+    for percentile, value in zip(FRAMETIME_PERCENTILES, percentiles):
+        summary[f"frametime_p{percentile:g}".replace(".", "_")] = value
+
+    summary["low_1"] = 1000 / summary["frametime_p99"]
+    summary["low_0_1"] = 1000 / summary["frametime_p99_9"]
+
+    return summary
+
+# Metrics of a session, and whether a higher value is better.
+SESSION_METRICS: dict[str, bool] = {
+    "avg_fps": True,
+    "low_1": True,
+    "low_0_1": True,
+    **{f"frametime_p{percentile:g}".replace(".", "_"): False
+       for percentile in FRAMETIME_PERCENTILES},
+}
+
+class SessionStore():
+    """
+    The summaries of the frame times of every session, in a SQLite database.
+    """
+    def __init__(self, path: str | None = None):
+        self.path: str = path or os.path.join(get_data_dir(), "sessions.db")
+
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.connection = sqlite3.connect(self.path)
+        self.connection.row_factory = sqlite3.Row
+        metrics: str = ", ".join(f"{metric} REAL" for metric in SESSION_METRICS)
+        self.connection.executescript(f"""
+            CREATE TABLE IF NOT EXISTS sessions (
+                id INTEGER PRIMARY KEY,
+                app_id TEXT NOT NULL,
+                started REAL NOT NULL,
+                log TEXT,
+                profile TEXT,
+                system TEXT,
+                frames INTEGER,
+                duration REAL,
+                {metrics}
+            );
+            CREATE INDEX IF NOT EXISTS sessions_app_id ON sessions (app_id, started);
+        """)
+
+    def add(self, app_id: str, started: float, summary: dict[str, float], log: str = "",
+            profile: dict[str, Any] | None = None, system: dict[str, str] | None = None) -> int:
+        """
+        Stores the summary of a session and returns its id.
+        """
+        row: dict[str, Any] = {
+            "app_id": app_id,
+            "started": started,
+            "log": log,
+            "profile": json.dumps(profile or {}, sort_keys=True),
+            "system": json.dumps(system or {}, sort_keys=True),
+            "frames": summary["frames"],
+            "duration": summary["duration"],
+            **{metric: summary[metric] for metric in SESSION_METRICS},
+        }
+
+        with self.connection:
+            cursor = self.connection.execute(
+                f"INSERT INTO sessions ({', '.join(row)}) VALUES ({', '.join('?' * len(row))})",
+                list(row.values()))
+
+        return int(cursor.lastrowid or 0)
+
+    def get(self, session_id: int) -> dict[str, Any] | None:
+        """
+        Returns a session.
+        """
+        row = self.connection.execute("SELECT * FROM sessions WHERE id = ?",
+                                      (session_id,)).fetchone()
+        return dict(row) if row is not None else None
+
+    def get_latest(self, app_id: str, count: int = 2) -> list[dict[str, Any]]:
+        """
+        Returns the latest sessions of a game, the most recent last.
+        """
+        rows = self.connection.execute("SELECT * FROM sessions WHERE app_id = ?" + \
+                                       " ORDER BY started DESC LIMIT ?",
+                                       (app_id, count)).fetchall()
+        return [dict(row) for row in reversed(rows)]
+
+    def close(self) -> None:
+        """
+        Closes the database.
+        """
+        self.connection.close()
+
+def format_comparison(before: dict[str, Any], after: dict[str, Any]) -> str:
+    """
+    Returns a table comparing the metrics of two sessions, followed by the
+    profile settings and system information that changed between them.
+    """
+    lines: list[str] = [f"{'':<18} {'#' + str(before['id']):>10} {'#' + str(after['id']):>10}" + \
+                        f" {'Change':>9}"]
+
+    for metric, higher_is_better in SESSION_METRICS.items():
+        change: float = (after[metric] - before[metric]) / before[metric] * 100 \
+            if before[metric] else 0.0
+        verdict: str = ""
+        if abs(change) >= 1:
+            verdict = "better" if (change > 0) == higher_is_better else "worse"
+        lines.append(f"{metric:<18} {before[metric]:>10.2f} {after[metric]:>10.2f}" + \
+                     f" {change:>+8.1f}% {verdict}".rstrip())
+
+    for field in ("profile", "system"):
+        old: dict[str, Any] = json.loads(before[field] or "{}")
+        new: dict[str, Any] = json.loads(after[field] or "{}")
+        for key in sorted(set(old) | set(new)):
+            if old.get(key) != new.get(key):
+                lines.append(f"{field} {key}: {old.get(key)} -> {new.get(key)}")
+
+    return "\n".join(lines)
+
+def compare_sessions(args: list[str]) -> None:
+    """
+    Compares two sessions of a game, the latest two by default:
+
+        gamelauncher.py compare <AppId> [<session id> <session id>]
+    """
+    if len(args) not in (1, 3):
+        raise ValueError("Usage: compare <AppId> [<session id> <session id>]")
+
+    store = SessionStore()
+
+    try:
+        if len(args) == 3:
+            sessions: list[dict[str, Any] | None] = [store.get(int(args[1])),
+                                                     store.get(int(args[2]))]
+        else:
+            sessions = list(store.get_latest(args[0]))
+    finally:
+        store.close()
+
+    if len(sessions) != 2 or None in sessions:
+        raise ValueError(f"There are not two sessions of {args[0]} to compare.")
+
+    print(format_comparison(sessions[0], sessions[1])) # type: ignore[arg-type]
+
 class GameLauncher():
     """
     A class for optimizing the launching of games
     with the use of tools like gamescope, mangohud and gamemode.
     """
-    def __init__(self, args: list[str]) -> None:
+    def __init__(self, args: list[str], cache: CapabilityCache | None = None,
+                 profiles: ProfileStore | None = None,
+                 topology: CpuTopology | None = None) -> None:
         self.args: list[str] = args
+        self.cache: CapabilityCache = cache or CapabilityCache()
+        self.profiles: ProfileStore = profiles or ProfileStore()
+        self.topology: CpuTopology | None = topology
+        self.game_cpus: list[int] = []
 
         self.app_id: str = ""
         self.resolution: dict[str, int] = {
@@ -21,31 +754,40 @@ class GameLauncher():
         self.refresh_rate: int = -1
         self.fullscreen_mode: bool = False
         self.always_grab_cursor: bool = True
+        self.use_mangohud: bool = True
+        self.use_mangohud_dlsym: bool = False
+        self.use_gamemode: bool = True
+        self.use_mangohud_log: bool = False
+        self.profile: dict[str, Any] = {}
+        self.environment: dict[str, str] = dict(os.environ)
+
+        tools: dict[str, str | None] = self.cache.find_tools()
 
-        self.gamescope_path: str = str(shutil.which("gamescope"))
-        self.mangohud_path: str = str(shutil.which("mangohud"))
-        self.mangoapp_path: str = str(shutil.which("mangoapp"))
-        self.gamemoderun_path: str = str(shutil.which("gamemoderun"))
+        self.gamescope_path: str = str(tools["gamescope"])
+        self.mangohud_path: str = str(tools["mangohud"])
+        self.mangoapp_path: str = str(tools["mangoapp"])
+        self.gamemoderun_path: str = str(tools["gamemoderun"])
         self.is_wayland_available: bool = os.environ.get("XDG_SESSION_TYPE") == "wayland"
-        self.is_gamescope_available: bool = bool(shutil.which("gamescope"))
-        self.is_mangohud_available: bool = bool(shutil.which("mangohud"))
-        self.is_mangoapp_available: bool = bool(shutil.which("mangoapp"))
-        self.is_gamemoderun_available: bool = bool(shutil.which("gamemoderun"))
+        self.is_gamescope_available: bool = tools["gamescope"] is not None
+        self.is_mangohud_available: bool = tools["mangohud"] is not None
+        self.is_mangoapp_available: bool = tools["mangoapp"] is not None
+        self.is_gamemoderun_available: bool = tools["gamemoderun"] is not None
         self.is_mangohud_dlsym_available: bool = False
 
         if self.is_mangohud_available:
-            self.is_mangohud_dlsym_available = True if \
-                    subprocess.run([self.mangohud_path, "--dlsym"],
-                                   stdout=subprocess.PIPE,
-                                   stderr=subprocess.PIPE).returncode == 0 \
-                else False
+            self.is_mangohud_dlsym_available = self.cache.probe([self.mangohud_path, "--dlsym"])
+
+        try:
+            self.cache.save()
+        except OSError as e:
+            print(f"[!] Could not save the capability cache: {e}")
 
         for arg in args:
             if arg.startswith("AppId="):
                 self.app_id = arg.split("=")[1]
                 break
 
-        self.CURRENT_USER: str = os.getlogin()
+        self.CURRENT_USER: str = getpass.getuser()
         self.CURRENT_PLATFORM: str = sys.platform.lower()
 
     def set_display_resolution(self, width: int, height: int) -> None:
@@ -87,20 +829,18 @@ class GameLauncher():
                 command_line.append("--expose-wayland")
             if self.fullscreen_mode:
                 command_line.append("--fullscreen")
-            if self.is_mangohud_available and self.is_mangoapp_available:
+            if self.use_mangohud and self.is_mangohud_available and self.is_mangoapp_available:
                 command_line.append("--mangoapp")
-            if self.fullscreen_mode:
-                command_line.append("--fullscreen")
             if self.always_grab_cursor:
                 command_line.append("--force-grab-cursor")
             command_line.append("--")
         else:
-            if self.is_mangohud_available:
+            if self.use_mangohud and self.is_mangohud_available:
                 command_line.append(self.mangohud_path)
-                if self.is_mangohud_dlsym_available and self.app_id == "255710":
+                if self.use_mangohud_dlsym and self.is_mangohud_dlsym_available:
                     command_line.append("--dlsym")
 
-        if self.is_gamemoderun_available:
+        if self.use_gamemode and self.is_gamemoderun_available:
             command_line.append(self.gamemoderun_path)
 
         command_line.extend(self.args)
@@ -121,29 +861,45 @@ class GameLauncher():
         if self.CURRENT_USER == "root":
             raise PermissionError("Do not run this script as root.")
 
-        user_overrides: dict[str, int] = {
-            "refresh_rate": -1,
-            "resolution_width": -1,
-            "resolution_height": -1
-        }
+        profile: dict[str, Any] = self.profiles.resolve(self.app_id)
+
+        self.fullscreen_mode = profile["fullscreen"]
+        self.always_grab_cursor = profile["grab_cursor"]
+        self.use_mangohud = profile["mangohud"]
+        self.use_mangohud_dlsym = profile["dlsym"]
+        self.use_gamemode = profile["gamemode"]
+        self.use_mangohud_log = profile["mangohud_log"] and profile["mangohud"] and \
+            self.is_mangohud_available
+        self.profile = profile
 
-        user_overrides["refresh_rate"] = 200
-        user_overrides["resolution_width"] = 2560
-        user_overrides["resolution_height"] = 1440
+        if self.use_mangohud_log:
+            os.makedirs(self.get_mangohud_log_dir(), exist_ok=True)
+            # Without read_cfg, MangoHud ignores its config file when MANGOHUD_CONFIG is set.
+            options: str = self.environment.get("MANGOHUD_CONFIG") or "read_cfg"
+            self.environment["MANGOHUD_CONFIG"] = f"{options},autostart_log=1,log_interval=0," + \
+                f"output_folder={self.get_mangohud_log_dir()}"
 
         try:
-            return self.__build_cmdline(user_overrides["refresh_rate"],
-                                        user_overrides["resolution_width"],
-                                        user_overrides["resolution_height"])
+            return self.__build_cmdline(profile["refresh_rate"],
+                                        profile["width"],
+                                        profile["height"])
         except Exception as e:
             raise e
 
-    def run(self, show_debug_info: bool = False) -> int:
+    def run(self, show_debug_info: bool = False, output_mode: str = "log") -> int:
         """
         Run the game with the specified arguments.
+        Args:
+            show_debug_info (bool): Print the settings the game is launched with.
+            output_mode (str): "log" to stream the output to a rotating log file,
+                "inherit" to leave it on the terminal or "exec" to replace the
+                launcher with the game.
         Returns:
             int: The exit code of the game process.
         """
+        if output_mode not in OUTPUT_MODES:
+            raise ValueError(f"Unknown output mode: {output_mode}")
+
         cmdline: list[str] = []
         exit_code: int = 0
 
@@ -151,6 +907,7 @@ class GameLauncher():
             cmdline = self.__prepare()
         except Exception as e:
             print("An error occurred:", e)
+            raise e
 
         if show_debug_info:
             debug_info: dict[str, Any] = {
@@ -161,6 +918,13 @@ class GameLauncher():
                 "refresh_rate": self.refresh_rate,
                 "fullscreen_mode": self.fullscreen_mode,
                 "always_grab_cursor": self.always_grab_cursor,
+                "use_mangohud": self.use_mangohud,
+                "use_mangohud_dlsym": self.use_mangohud_dlsym,
+                "use_gamemode": self.use_gamemode,
+                "cpu_pinning": self.profile.get("cpu_pinning"),
+                "isolate_cpus": self.profile.get("isolate_cpus"),
+                "nice": self.profile.get("nice"),
+                "ioprio": self.profile.get("ioprio"),
                 "is_wayland_available": self.is_wayland_available,
                 "is_gamescope_available": self.is_gamescope_available,
                 "is_mangohud_available": self.is_mangohud_available,
@@ -173,25 +937,192 @@ class GameLauncher():
 
         print(f"Running command: {' '.join(cmdline)}")
 
+        self.__set_scheduling()
+
+        if output_mode == "exec":
+            if self.profile.get("isolate_cpus"):
+                print("[!] The slices can not be restored after exec, they are left alone.")
+            sys.stdout.flush()
+            os.execvpe(cmdline[0], cmdline, self.environment)
+
+        started: float = time.time()
+        isolated_slices: list[tuple[tuple[str, ...], str, str]] = []
+
         try:
-            process = subprocess.run(
-                cmdline,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-            )
+            if self.profile.get("isolate_cpus") and self.game_cpus:
+                isolated_slices = self.__isolate_cpus(self.game_cpus)
+            if output_mode == "inherit":
+                process = subprocess.run(cmdline, env=self.environment, check=False)
+            else:
+                process = self.__run_logged(cmdline)
             exit_code: int = process.returncode
-            process.check_returncode()
-        except Exception as e:
-            raise e
+        finally:
+            self.__restore_slices(isolated_slices)
+            if self.use_mangohud_log:
+                self.__ingest_mangohud_logs(started)
+
+        process.check_returncode()
 
         return exit_code
 
+    def __set_scheduling(self) -> None:
+        """
+        Pins the launcher to the best CPUs for the game and sets its nice
+        value and I/O priority, the game inherits all of them.
+        """
+        if self.profile.get("cpu_pinning"):
+            self.topology = self.topology or CpuTopology()
+            cpus: list[int] = get_game_cpus(self.topology)
+
+            if set(cpus) != set(self.topology.cpus):
+                try:
+                    os.sched_setaffinity(0, cpus)
+                    self.game_cpus = cpus
+                    print(f"Running on CPUs {format_cpu_list(cpus)}")
+                except OSError as e:
+                    print(f"[!] Could not pin the game to CPUs {format_cpu_list(cpus)}: {e}")
+
+        if self.profile.get("nice"):
+            try:
+                os.setpriority(os.PRIO_PROCESS, 0, self.profile["nice"])
+            except OSError as e:
+                print(f"[!] Could not set the nice value to {self.profile['nice']}: {e}")
+
+        if self.profile.get("ioprio") is not None:
+            try:
+                set_io_priority(self.profile["ioprio"])
+            except OSError as e:
+                print(f"[!] Could not set the I/O priority to {self.profile['ioprio']}: {e}")
+
+    def __isolate_cpus(self, cpus: list[int]) -> list[tuple[tuple[str, ...], str, str]]:
+        """
+        Moves the background slices off the CPUs of the game. Returns the
+        slices that were moved with the CPUs they were allowed before.
+        """
+        assert self.topology is not None
+        other_cpus: list[int] = [cpu for cpu in self.topology.cpus if cpu not in cpus]
+        isolated_slices: list[tuple[tuple[str, ...], str, str]] = []
+
+        if not other_cpus:
+            return isolated_slices
+
+        for systemctl, unit in BACKGROUND_SLICES:
+            if "--user" not in systemctl and not can_manage_system_units():
+                print(f"[!] Not allowed to manage system units, {unit} stays on every CPU.")
+                continue
+
+            try:
+                previous = subprocess.run([*systemctl, "show", "--property=AllowedCPUs",
+                                           "--value", unit],
+                                          capture_output=True, text=True, check=False)
+            except OSError:
+                break
+            if previous.returncode != 0:
+                continue
+
+            process = subprocess.run([*systemctl, "set-property", "--runtime", unit,
+                                      f"AllowedCPUs={format_cpu_list(other_cpus)}"], check=False)
+            if process.returncode == 0:
+                isolated_slices.append((systemctl, unit, previous.stdout.strip()))
+            else:
+                print(f"[!] Could not move {unit} off CPUs {format_cpu_list(cpus)}.")
+
+        return isolated_slices
+
+    def __restore_slices(self, isolated_slices: list[tuple[tuple[str, ...], str, str]]) -> None:
+        """
+        Allows the slices on the CPUs they were allowed before, every CPU if
+        they were not restricted.
+        """
+        for systemctl, unit, allowed_cpus in isolated_slices:
+            process = subprocess.run([*systemctl, "set-property", "--runtime", unit,
+                                      f"AllowedCPUs={allowed_cpus}"], check=False)
+            if process.returncode != 0:
+                print(f"[!] Could not restore the CPUs of {unit}.")
+
+    def get_mangohud_log_dir(self) -> str:
+        """
+        Returns the directory MangoHud writes the frame times of the game to.
+        """
+        return os.path.join(get_state_dir(), "mangohud",
+                            self.app_id or os.path.basename(self.args[0]))
+
+    def __ingest_mangohud_logs(self, started: float) -> None:
+        """
+        Summarizes the MangoHud logs written since the game started and
+        stores them as sessions of the game.
+        """
+        log_dir: str = self.get_mangohud_log_dir()
+        store = SessionStore()
+
+        try:
+            for entry in sorted(os.scandir(log_dir), key=lambda entry: entry.name):
+                if not entry.name.endswith(".csv") or entry.name.endswith("_summary.csv") or \
+                        entry.stat().st_mtime < started:
+                    continue
+
+                try:
+                    system, frametimes = read_mangohud_log(entry.path)
+                    summary: dict[str, float] = summarize_frametimes(frametimes)
+                except ValueError as e:
+                    print(f"[!] Skipped {entry.path}: {e}")
+                    continue
+
+                session_id: int = store.add(self.app_id or os.path.basename(self.args[0]),
+                                            started, summary, entry.path, self.profile, system)
+                print(f"Session #{session_id}: {summary['avg_fps']:.1f} FPS on average, " + \
+                      f"{summary['low_1']:.1f} 1% low, {summary['low_0_1']:.1f} 0.1% low " + \
+                      f"over {summary['duration']:.0f}s")
+        finally:
+            store.close()
+
+    def get_log_path(self) -> str:
+        """
+        Returns the log file of the game, named after its AppId.
+        """
+        name: str = self.app_id or os.path.basename(self.args[0])
+        return os.path.join(get_state_dir(), "logs", f"{name}.log")
+
+    def __run_logged(self, cmdline: list[str]) -> subprocess.CompletedProcess[bytes]:
+        """
+        Runs the game streaming its output to a rotating log file as it comes,
+        so that a full pipe never blocks it and memory use stays the same no
+        matter how long it runs. The last lines are shown if it fails.
+        """
+        log = RotatingLog(self.get_log_path())
+        last_lines: collections.deque[bytes] = collections.deque(maxlen=CRASH_REPORT_LINES)
+
+        print(f"Logging the output to {log.path}")
+
+        try:
+            with subprocess.Popen(cmdline, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                  env=self.environment) as process:
+                assert process.stdout is not None
+                for line in iter(lambda: process.stdout.readline(MAX_LINE_LENGTH), b""):
+                    log.write(line)
+                    last_lines.append(line)
+        finally:
+            log.close()
+
+        if process.returncode != 0 and last_lines:
+            print(f"The game exited with code {process.returncode}, last lines of its output:",
+                  file=sys.stderr)
+            for line in last_lines:
+                print(line.decode(errors="replace").rstrip("\n"), file=sys.stderr)
+
+        return subprocess.CompletedProcess(cmdline, process.returncode)
+
 if __name__ == "__main__":
     if len(sys.argv[1:]) == 0:
         raise ValueError("No program was specified.")
 
+    if sys.argv[1] == "compare":
+        compare_sessions(sys.argv[2:])
+        sys.exit(0)
+
     try:
         launcher = GameLauncher(sys.argv[1:])
-        launcher.run(show_debug_info=True)
+        launcher.run(show_debug_info=True,
+                     output_mode=os.environ.get("GAMELAUNCHER_OUTPUT", "log"))
     except Exception as e:
         raise e
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+
+"""
+CPU topology read from sysfs, shared by lib/platform.py, gamelauncher.py and
+the qemu hook. It is installed in /usr/local/lib/linux-config, the scripts of
+the root filesystem add that directory to their path since they can not
+import lib.
+"""
+
+import os
+
+def parse_cpu_list(cpu_list: str) -> list[int]:
+    """
+    Parses a kernel CPU list such as "0-3,8,10-11".
+    """
+    cpus: list[int] = []
+
+    for part in cpu_list.strip().split(","):
+        if not part:
+            continue
+        if "-" in part:
+            first, last = part.split("-", 1)
+            cpus.extend(range(int(first), int(last) + 1))
+        else:
+            cpus.append(int(part))
+
+    return cpus
+
+def format_cpu_list(cpus: list[int]) -> str:
+    """
+    Formats CPUs as a kernel CPU list, the reverse of parse_cpu_list.
+    """
+    ranges: list[str] = []
+    sorted_cpus: list[int] = sorted(set(cpus))
+    index: int = 0
+
+    while index < len(sorted_cpus):
+        first: int = sorted_cpus[index]
+        while index + 1 < len(sorted_cpus) and sorted_cpus[index + 1] == sorted_cpus[index] + 1:
+            index += 1
+        last: int = sorted_cpus[index]
+        ranges.append(str(first) if first == last else f"{first}-{last}")
+        index += 1
+
+    return ",".join(ranges)
+
+def parse_size(size: str) -> int:
+    """
+    Parses a size such as "32768K" from sysfs into bytes.
+    """
+    units: dict[str, int] = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+
+    if size and size[-1].upper() in units:
+        return int(size[:-1]) * units[size[-1].upper()]
+
+    return int(size or 0)
+
+class CpuTopology():
+    """
+    Layout of the online CPUs as reported by sysfs: the SMT siblings, the
+    CPUs sharing a last level cache and, on hybrid CPUs, the performance ones.
+    """
+    def __init__(self, sysfs_root: str = "/sys"):
+        self.sysfs_root: str = sysfs_root
+        self.cpu_dir: str = os.path.join(sysfs_root, "devices/system/cpu")
+        self.cpus: list[int] = []
+        # Logical CPUs sharing a physical core, keyed by the first of them.
+        self.cores: dict[int, list[int]] = {}
+        # Logical CPUs sharing a last level cache and its size, keyed by the first of them.
+        self.cache_domains: dict[int, list[int]] = {}
+        self.cache_sizes: dict[int, int] = {}
+        self.performance_cpus: list[int] = []
+        self.max_frequencies: dict[int, int] = {}
+        self.__read()
+
+    def __read_file(self, *path: str) -> str | None:
+        try:
+            with open(os.path.join(self.cpu_dir, *path), "r", encoding="utf-8") as f:
+                return f.read().strip()
+        except OSError:
+            return None
+
+    def __read_last_level_cache(self, cpu: int) -> tuple[list[int], int] | None:
+        cache_dir: str = os.path.join(self.cpu_dir, f"cpu{cpu}", "cache")
+        highest_level: int = -1
+        last_level_cache: tuple[list[int], int] | None = None
+
+        try:
+            indexes: list[str] = os.listdir(cache_dir)
+        except OSError:
+            return None
+
+        for index in indexes:
+            if not index.startswith("index"):
+                continue
+            level: str | None = self.__read_file(f"cpu{cpu}", "cache", index, "level")
+            cpu_list: str | None = self.__read_file(f"cpu{cpu}", "cache", index,
+                                                    "shared_cpu_list")
+            if level is None or cpu_list is None:
+                continue
+            if int(level) > highest_level:
+                highest_level = int(level)
+                size: str = self.__read_file(f"cpu{cpu}", "cache", index, "size") or "0"
+                last_level_cache = (parse_cpu_list(cpu_list), parse_size(size))
+
+        return last_level_cache
+
+    def __read_performance_cpus(self) -> list[int]:
+        """
+        Returns the P-cores of hybrid Intel CPUs, the CPUs with the highest
+        capacity on other heterogeneous ones and every CPU otherwise.
+        """
+        try:
+            with open(os.path.join(self.sysfs_root, "devices/cpu_core/cpus"), "r",
+                      encoding="utf-8") as f:
+                return [cpu for cpu in parse_cpu_list(f.read()) if cpu in self.cpus]
+        except OSError:
+            pass
+
+        capacities: dict[int, int] = {}
+
+        for cpu in self.cpus:
+            capacity: str | None = self.__read_file(f"cpu{cpu}", "cpu_capacity")
+            if capacity is not None:
+                capacities[cpu] = int(capacity)
+
+        if capacities:
+            return [cpu for cpu, capacity in capacities.items()
+                    if capacity == max(capacities.values())]
+
+        return list(self.cpus)
+
+    def __read(self) -> None:
+        online: str | None = self.__read_file("online")
+        self.cpus = parse_cpu_list(online) if online else list(range(os.cpu_count() or 1))
+
+        for cpu in self.cpus:
+            siblings: str | None = self.__read_file(f"cpu{cpu}", "topology",
+                                                    "thread_siblings_list")
+            core: list[int] = parse_cpu_list(siblings) if siblings else [cpu]
+            core = [sibling for sibling in core if sibling in self.cpus]
+            self.cores.setdefault(core[0], core)
+
+            cache, size = self.__read_last_level_cache(cpu) or (self.cpus, 0)
+            cache = [sibling for sibling in cache if sibling in self.cpus]
+            self.cache_domains.setdefault(cache[0], cache)
+            self.cache_sizes.setdefault(cache[0], size)
+
+            frequency: str | None = self.__read_file(f"cpu{cpu}", "cpufreq", "cpuinfo_max_freq")
+            self.max_frequencies[cpu] = int(frequency) if frequency else 0
+
+        self.performance_cpus = self.__read_performance_cpus()
+
+    def get_core(self, cpu: int) -> list[int]:
+        """
+        Returns the logical CPUs of the physical core a CPU belongs to.
+        """
+        for core in self.cores.values():
+            if cpu in core:
+                return core
+        return [cpu]
+
+    def get_core_count(self) -> int:
+        """
+        Returns the amount of physical cores.
+        """
+        return len(self.cores)
+
+    def get_thread_count(self) -> int:
+        """
+        Returns the amount of logical CPUs.
+        """
+        return len(self.cpus)
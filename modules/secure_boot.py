@@ -5,9 +5,10 @@ Module containing the SecureBootManager class.
 """
 
 import getpass
-import subprocess
 import os
 
+from lib import tracing
+from lib.backup_store import BackupStore
 from modules.packages import PackageManager
 
 class SecureBootManager():
@@ -17,7 +18,7 @@ class SecureBootManager():
     def __init__(self):
         self.current_user: str = getpass.getuser()
 
-    def install_dependencies(self, desktop_environment: str, verbose: bool = False):
+    def install_dependencies(self, verbose: bool = False):
         """
         Installs the necessary packages to setup secure boot.
         """
@@ -31,7 +32,7 @@ class SecureBootManager():
         if verbose:
             print("[VERBOSE] The package manager has been set to:", pm_bin)
 
-        pm.install_packages(pm_bin, desktop_environment, custom_pkglist=pkglist)
+        pm.install_packages(pm_bin, pkglist, verbose)
 
     def _check_file_access(self, file: str) -> None:
         if not os.access(file, os.R_OK):
@@ -53,18 +54,25 @@ class SecureBootManager():
                     command = f"sudo cp {source} {destination}"
 
         try:
-            subprocess.run(command, shell=True, universal_newlines=True,
-                           check=True, text=True)
+            tracing.run(command, shell=True, universal_newlines=True,
+                        check=True, text=True)
         except Exception as e:
             raise e
 
-    def backup_boot_files(self, verbose: bool = False) -> None:
+    def backup_boot_files(self, verbose: bool = False) -> str:
         """
-        Backs up the boot files.
+        Backs up the boot files into the backup store.
+        Returns the identifier of the run they were recorded under.
+
+        Reading the boot files and writing to the backup store both need root.
         """
+        if not self.current_user == "root":
+            raise PermissionError("You must run this module as root to back up the boot files.")
+
         boot_files: list[str] = [
             "/boot/EFI/BOOT/BOOTX64.EFI",
         ]
+        backup_store = BackupStore()
 
         for file in boot_files:
             try:
@@ -72,14 +80,18 @@ class SecureBootManager():
                     case "/boot/EFI/BOOT/BOOTX64.EFI":
                         self._check_file_access(file)
                         if verbose:
-                            self._copy_file(file, f"{file}.backup", verbose=True)
-                        else:
-                            self._copy_file(file, f"{file}.backup")
+                            print(f"[VERBOSE] Backing up '{file}'...")
+                        # The shim is installed over the file in place, so it can not be hardlinked.
+                        backup_store.store(file)
                     case _:
                         raise FileNotFoundError(file)
             except Exception as e:
                 raise e
 
+        backup_store.save()
+
+        return backup_store.run_id
+
     def install_shim(self, verbose: bool = False):
         """
         Installs the shim packages.
@@ -5,64 +5,105 @@ Module containing the ServicesManager class.
 """
 
 import getpass
-import subprocess
+
+from lib import tracing
 
 class ServicesManager():
     """
     Manages services using systemctl.
     """
-    def __init__(self):
+    def __init__(self, services: list[str] | None = None):
         self.current_user = getpass.getuser()
+        self.services: list[str] | None = services
 
     def __get_services_list(self) -> list[str]:
         """
         Returns a list of services based on the desktop environment.
         """
+        if self.services is not None:
+            return self.services
+
         services: list[str] = [
             "ufw.service"
         ]
 
         return services
 
+    def __query_services(self, services: list[str]) -> dict[str, str]:
+        """
+        Retrieves the status of every service with a single systemctl call.
+        The status is the one `systemctl is-enabled` would report.
+        """
+        command: list[str] = [
+            "systemctl",
+            "show",
+            "--property=LoadState,UnitFileState",
+            "--",
+            *services
+        ]
+
+        output: str = tracing.run(command,
+                                  capture_output=True,
+                                  text=True).stdout.strip()
+
+        # One block of properties per unit, in the same order they were requested.
+        blocks: list[str] = output.split("\n\n") if output else []
+
+        if len(blocks) != len(services):
+            raise RuntimeError(f"Expected the status of {len(services)} services" + \
+                               f" but systemctl returned {len(blocks)}.")
+
+        statuses: dict[str, str] = {}
+
+        for service_name, block in zip(services, blocks):
+            properties: dict[str, str] = dict(line.split("=", 1)
+                                              for line in block.splitlines() if "=" in line)
+
+            if properties.get("LoadState") == "not-found":
+                statuses[service_name] = "not-found"
+            else:
+                statuses[service_name] = properties.get("UnitFileState", "")
+
+        return statuses
+
     def __get_disabled_services(self, services: list[str], verbose: bool = False) -> dict[str, str]:
         """
         Retrieves a dictionary with all the services that are disabled.
         """
         disabled_services: dict[str, str] = {}
-        command: list[str] = []
 
-        for service_name in services:
-            command.clear()
-            command.extend([
-                "systemctl",
-                "is-enabled",
-                service_name
-            ])
+        if not services:
+            return disabled_services
 
-            service_status: str = subprocess.run(command,
-                                                 capture_output=True,
-                                                 text=True).stdout.strip()
+        statuses: dict[str, str] = self.__query_services(services)
+        not_found: list[str] = [name for name, status in statuses.items() if status == "not-found"]
+
+        if not_found:
+            if verbose:
+                print(f"[!] {', '.join(not_found)} not found, reloading systemd daemon...")
+
+            try:
+                tracing.run(["systemctl", "daemon-reload"], check=True).check_returncode()
+            except Exception as e:
+                raise RuntimeError("An error has occurred:", e)
 
+            statuses.update(self.__query_services(not_found))
+
+        for service_name, service_status in statuses.items():
             match service_status:
                 case "disabled":
                     if verbose:
                         print("service:", service_name, "status:", service_status)
-                    try:
-                        disabled_services[service_name] = service_status
-                    except Exception as e:
-                        raise RuntimeError("An error has occurred:", e)
+                    disabled_services[service_name] = service_status
                 case "enabled":
                     if verbose:
                         print(f"{service_name} is already {service_status}")
                 case "not-found":
-                    if verbose:
-                        print(f"[!] {service_name} was not found, reloading systemd daemon...")
-
-                    try:
-                        subprocess.run(["systemctl", "daemon-reload"], check=True).check_returncode()
-                    except Exception as e:
-                        raise RuntimeError("An error has occurred:", e)
-
+                    print(f"[!] {service_name} was not found even after reloading systemd.")
+                case "" | "static" | "generated" | "transient" | "masked":
+                    # Transient and generated units have no unit file state at all.
+                    print(f"[!] {service_name} can not be enabled" + \
+                          f" (state: {service_status or 'none'}), skipping...")
                 case _:
                     raise ValueError(f"{service_name} has an unknown status: {service_status}.")
 
@@ -72,16 +113,22 @@ class ServicesManager():
         """
         Enable a service using systemctl.
         """
+        self.enable_service_list([service])
+
+    def enable_service_list(self, services: list[str]) -> None:
+        """
+        Enable several services with a single systemctl call.
+        """
         cmd: list[str] = []
 
         match self.current_user:
             case "root":
-                cmd.extend(["systemctl", "enable", service])
+                cmd.extend(["systemctl", "enable", "--", *services])
             case _:
-                cmd.extend(["sudo", "systemctl", "enable", service])
+                cmd.extend(["sudo", "systemctl", "enable", "--", *services])
 
         try:
-            subprocess.run(cmd).check_returncode()
+            tracing.run(cmd).check_returncode()
         except Exception as e:
             raise RuntimeError("An error has occurred:", e)
 
@@ -91,15 +138,23 @@ class ServicesManager():
         """
         services_list = self.__get_services_list()
         services_to_enable = self.__get_disabled_services(services_list, verbose)
+        names: list[str] = []
 
         for name, status in services_to_enable.items():
-            try:
-                match status:
-                    case "disabled":
-                        if verbose:
-                            print(f"[VERBOSE] {name}, status: {status}")
-                        self.enable_service(name)
-                    case _:
-                        print(f"An error occurred with the service {name}. Status: {status}.")
-            except Exception as e:
-                raise e
+            match status:
+                case "disabled":
+                    if verbose:
+                        print(f"[VERBOSE] {name}, status: {status}")
+                    names.append(name)
+                case _:
+                    print(f"An error occurred with the service {name}. Status: {status}.")
+
+        if not names:
+            if verbose:
+                print("[VERBOSE] No services need to be enabled.")
+            return
+
+        try:
+            self.enable_service_list(names)
+        except Exception as e:
+            raise e
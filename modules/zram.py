@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+
+"""
+Module containing the ZramManager class.
+"""
+
+import os
+
+from lib import tracing
+
+ZRAM_GENERATOR_CONFIG: str = "etc/systemd/zram-generator.conf"
+ZSWAP_TMPFILES_CONFIG: str = "etc/tmpfiles.d/zswap.conf"
+ZRAM_DEVICE: str = "/dev/zram0"
+ZRAM_SETUP_SERVICE: str = "systemd-zram-setup@zram0.service"
+ZRAM_GENERATOR_PATHS: tuple[str, ...] = (
+    "/usr/lib/systemd/system-generators/zram-generator",
+    "/lib/systemd/system-generators/zram-generator",
+)
+
+# Best compression for the CPU time first, the kernel always has lzo.
+COMPRESSORS: tuple[str, ...] = ("zstd", "lz4", "lzo-rle", "lzo")
+# Types /proc/crypto gives the compression algorithms.
+CRYPTO_COMPRESSION_TYPES: tuple[str, ...] = ("compression", "scomp", "acomp")
+
+# The disk swap file is enabled with priority 60, compressed memory is used before it.
+ZRAM_PRIORITY: int = 100
+# Half of the RAM, compressed about 3:1 it holds about 1.5 times as much.
+ZRAM_FRACTION: float = 0.5
+ZRAM_MAX_SIZE: int = 16384
+# Share of the RAM zswap may use for its compressed pool.
+ZSWAP_MAX_POOL_PERCENT: int = 20
+
+class ZramManager():
+    """
+    Sets up compressed memory, either as a zram swap device through
+    zram-generator or as zswap in front of the swap file.
+
+    Everything is read from `sysfs_root`, `meminfo`, `swaps`, `crypto` and
+    `modules_dir`, so the configs can be generated against a fake tree.
+    """
+    def __init__(self, sysfs_root: str = "/sys", meminfo: str = "/proc/meminfo",
+                 swaps: str = "/proc/swaps", crypto: str = "/proc/crypto",
+                 modules_dir: str | None = None):
+        self.SYSFS_ROOT: str = sysfs_root
+        self.MEMINFO: str = meminfo
+        self.SWAPS: str = swaps
+        self.CRYPTO: str = crypto
+        self.MODULES_DIR: str = modules_dir or os.path.join("/lib/modules", os.uname().release)
+
+    def get_memory_size(self) -> int:
+        """
+        Returns the installed RAM in MiB.
+        """
+        with open(self.MEMINFO, "r", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("MemTotal:"):
+                    return int(line.split()[1]) // 1024
+
+        raise RuntimeError(f"Could not find the amount of memory in {self.MEMINFO}.")
+
+    def get_zram_size(self) -> int:
+        """
+        Returns the size of the zram device in MiB.
+        """
+        return min(int(self.get_memory_size() * ZRAM_FRACTION), ZRAM_MAX_SIZE)
+
+    def __read_available_compressors(self, path: str) -> list[str]:
+        """
+        Reads a list such as "lzo lzo-rle [zstd]", the current one in brackets.
+        """
+        try:
+            with open(os.path.join(self.SYSFS_ROOT, path), "r", encoding="utf-8") as f:
+                return [name.strip("[]") for name in f.read().split()]
+        except FileNotFoundError:
+            return []
+
+    def __read_crypto_compressors(self) -> list[str]:
+        """
+        Reads the compressors of the crypto API: the loaded ones from
+        /proc/crypto, the built in and loadable ones from the module lists.
+        """
+        compressors: list[str] = []
+
+        try:
+            with open(self.CRYPTO, "r", encoding="utf-8") as f:
+                for block in f.read().split("\n\n"):
+                    fields: dict[str, str] = {key.strip(): value.strip() for key, _, value in
+                                              (line.partition(":") for line in block.splitlines())}
+                    if fields.get("type") in CRYPTO_COMPRESSION_TYPES:
+                        compressors.append(fields.get("name", ""))
+        except FileNotFoundError:
+            pass
+
+        for modules_list in ("modules.builtin", "modules.dep"):
+            try:
+                with open(os.path.join(self.MODULES_DIR, modules_list), "r",
+                          encoding="utf-8") as f:
+                    for line in f:
+                        module: str = line.split(":", 1)[0].strip()
+                        if module.startswith("kernel/crypto/"):
+                            compressors.append(os.path.basename(module).split(".ko", 1)[0])
+            except FileNotFoundError:
+                pass
+
+        return compressors
+
+    def get_compressor(self) -> str:
+        """
+        Returns the preferred compressor the kernel supports. The ones zram
+        lists are used when the device exists, zswap only shows the one it
+        uses so the crypto API is asked otherwise.
+        """
+        available: list[str] = self.__read_available_compressors("block/zram0/comp_algorithm") \
+            or self.__read_crypto_compressors()
+
+        for compressor in COMPRESSORS:
+            if compressor in available:
+                return compressor
+
+        return COMPRESSORS[-1]
+
+    def generate_zram_config(self) -> str:
+        """
+        Returns the zram-generator config of a single zram swap device.
+        """
+        return f"""[zram0]
+zram-size = {self.get_zram_size()}
+compression-algorithm = {self.get_compressor()}
+swap-priority = {ZRAM_PRIORITY}
+fs-type = swap
+"""
+
+    def get_zswap_parameters(self, enabled: bool = True) -> dict[str, str]:
+        """
+        Returns the zswap parameters, in the order they have to be set.
+        zswap is disabled when using zram, it would only compress pages twice.
+        """
+        if not enabled:
+            return {"enabled": "N"}
+
+        return {
+            "compressor": self.get_compressor(),
+            "max_pool_percent": str(ZSWAP_MAX_POOL_PERCENT),
+            "enabled": "Y",
+        }
+
+    def generate_zswap_config(self, enabled: bool = True) -> str:
+        """
+        Returns the tmpfiles.d config setting the zswap parameters at boot.
+        """
+        return "".join(f"w- /sys/module/zswap/parameters/{name} - - - - {value}\n"
+                       for name, value in self.get_zswap_parameters(enabled).items())
+
+    def generate_configs(self, zswap: bool = False) -> dict[str, str]:
+        """
+        Returns the contents of the config files keyed by their path
+        relative to the root filesystem.
+        """
+        # A config without devices keeps zram-generator from using its default one.
+        return {
+            ZSWAP_TMPFILES_CONFIG: self.generate_zswap_config(zswap),
+            ZRAM_GENERATOR_CONFIG: "# zswap is used instead of zram.\n" if zswap \
+                else self.generate_zram_config(),
+        }
+
+    def apply_zswap(self, enabled: bool = True) -> None:
+        """
+        Sets the zswap parameters right away instead of waiting for a reboot.
+        Enabling it turns the zram device off first, both would be used otherwise.
+        """
+        parameters_dir: str = os.path.join(self.SYSFS_ROOT, "module/zswap/parameters")
+
+        if not os.path.isdir(parameters_dir):
+            if not enabled:
+                return
+            raise FileNotFoundError(f"{parameters_dir} does not exist, zswap is not available.")
+
+        if enabled:
+            self.disable_zram()
+
+        for name, value in self.get_zswap_parameters(enabled).items():
+            with open(os.path.join(parameters_dir, name), "w", encoding="utf-8") as f:
+                f.write(value)
+
+    def is_zram_swap_active(self) -> bool:
+        """
+        Checks if the zram device is in use as swap.
+        """
+        try:
+            with open(self.SWAPS, "r", encoding="utf-8") as f:
+                return any(line.split()[0] == ZRAM_DEVICE for line in f.readlines()[1:]
+                           if line.strip())
+        except FileNotFoundError:
+            return False
+
+    def disable_zram(self) -> None:
+        """
+        Stops swapping to the zram device and stops the unit that created it.
+        Pages swapped to it are moved back to memory or to the swap file.
+        """
+        if self.is_zram_swap_active():
+            tracing.run(["swapoff", ZRAM_DEVICE], check=True)
+
+        # Fails when zram-generator is not installed, there is nothing to stop then.
+        tracing.run(["systemctl", "stop", ZRAM_SETUP_SERVICE], check=False)
+
+    def apply_zram(self) -> None:
+        """
+        Creates the zram device right away through zram-generator.
+        """
+        if not any(os.path.isfile(path) for path in ZRAM_GENERATOR_PATHS):
+            raise FileNotFoundError("zram-generator is not installed.")
+
+        tracing.run(["systemctl", "daemon-reload"], check=True)
+        tracing.run(["systemctl", "restart", ZRAM_SETUP_SERVICE], check=True)
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+
+"""
+Helpers shared by the tests: loading the standalone scripts, which are not
+importable modules, and writing fake sysfs and procfs trees.
+"""
+
+import importlib.machinery
+import importlib.util
+import os
+import sys
+
+from types import ModuleType
+
+REPOSITORY_ROOT: str = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+GAMELAUNCHER_PATH: str = os.path.join(REPOSITORY_ROOT, "modules/rootfs/usr/local/bin/gamelauncher.py")
+QEMU_HOOK_PATH: str = os.path.join(REPOSITORY_ROOT, "modules/rootfs/etc/libvirt/hooks/qemu")
+
+# 8 cores with SMT split in two 4 core CCDs, the first one with 3D V-Cache.
+X3D_CORES: list[list[int]] = [[core, core + 8] for core in range(8)]
+X3D_CACHES: list[tuple[list[int], str]] = [
+    ([0, 1, 2, 3, 8, 9, 10, 11], "98304K"),
+    ([4, 5, 6, 7, 12, 13, 14, 15], "32768K"),
+]
+
+def load_script(name: str, path: str) -> ModuleType:
+    """
+    Loads a script as a module, even without a .py extension, registering
+    it in sys.modules like an import would.
+    """
+    loader = importlib.machinery.SourceFileLoader(name, path)
+    spec = importlib.util.spec_from_loader(name, loader)
+    assert spec is not None
+    module: ModuleType = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+def write_file(root: str, path: str, content: str) -> None:
+    """
+    Writes a file of a fake tree, creating its directories.
+    """
+    full_path: str = os.path.join(root, path)
+    os.makedirs(os.path.dirname(full_path), exist_ok=True)
+
+    with open(full_path, "w", encoding="utf-8") as f:
+        f.write(content)
+
+def read_file(root: str, path: str) -> str:
+    """
+    Reads a file of a fake tree.
+    """
+    with open(os.path.join(root, path), "r", encoding="utf-8") as f:
+        return f.read().strip()
+
+def write_cpu_tree(sysfs_root: str, cores: list[list[int]],
+                   cache_domains: list[tuple[list[int], str]],
+                   capacities: dict[int, int] | None = None,
+                   frequencies: dict[int, int] | None = None) -> None:
+    """
+    Writes the sysfs files CpuTopology reads: the online CPUs, the SMT
+    siblings of every core and its L2 and last level (L3) caches.
+    """
+    cpu_dir: str = os.path.join(sysfs_root, "devices/system/cpu")
+    cpus: list[int] = sorted(cpu for core in cores for cpu in core)
+    write_file(cpu_dir, "online", f"{cpus[0]}-{cpus[-1]}\n")
+
+    for core in cores:
+        for cpu in core:
+            siblings: str = ",".join(str(sibling) for sibling in core)
+            write_file(cpu_dir, f"cpu{cpu}/topology/thread_siblings_list", f"{siblings}\n")
+            write_file(cpu_dir, f"cpu{cpu}/cache/index2/level", "2\n")
+            write_file(cpu_dir, f"cpu{cpu}/cache/index2/shared_cpu_list", f"{siblings}\n")
+            write_file(cpu_dir, f"cpu{cpu}/cache/index2/size", "1024K\n")
+
+    for domain, size in cache_domains:
+        for cpu in domain:
+            shared: str = ",".join(str(sibling) for sibling in domain)
+            write_file(cpu_dir, f"cpu{cpu}/cache/index3/level", "3\n")
+            write_file(cpu_dir, f"cpu{cpu}/cache/index3/shared_cpu_list", f"{shared}\n")
+            write_file(cpu_dir, f"cpu{cpu}/cache/index3/size", f"{size}\n")
+
+    for cpu, capacity in (capacities or {}).items():
+        write_file(cpu_dir, f"cpu{cpu}/cpu_capacity", f"{capacity}\n")
+
+    for cpu, frequency in (frequencies or {}).items():
+        write_file(cpu_dir, f"cpu{cpu}/cpufreq/cpuinfo_max_freq", f"{frequency}\n")
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+
+"""
+Tests for the CPU list helpers and CpuTopology, against fake sysfs trees.
+"""
+
+import tempfile
+import unittest
+
+from lib import platform
+from tests.helpers import X3D_CACHES, X3D_CORES, write_cpu_tree, write_file
+
+class TestCpuList(unittest.TestCase):
+    """
+    parse_cpu_list, format_cpu_list and parse_size.
+    """
+    def test_parse(self) -> None:
+        self.assertEqual(platform.parse_cpu_list("0-3,8,10-11\n"), [0, 1, 2, 3, 8, 10, 11])
+        self.assertEqual(platform.parse_cpu_list(""), [])
+
+    def test_format(self) -> None:
+        self.assertEqual(platform.format_cpu_list([11, 0, 1, 2, 3, 8, 10, 2]), "0-3,8,10-11")
+        self.assertEqual(platform.format_cpu_list([]), "")
+
+    def test_round_trip(self) -> None:
+        for cpu_list in ("0", "0-15", "0,2,4", "1-2,5-7,9"):
+            self.assertEqual(platform.format_cpu_list(platform.parse_cpu_list(cpu_list)), cpu_list)
+
+    def test_parse_size(self) -> None:
+        self.assertEqual(platform.parse_size("32768K"), 32 * 1024 ** 2)
+        self.assertEqual(platform.parse_size("2M"), 2 * 1024 ** 2)
+        self.assertEqual(platform.parse_size("512"), 512)
+        self.assertEqual(platform.parse_size(""), 0)
+
+class TestCpuTopology(unittest.TestCase):
+    """
+    CpuTopology read from fake sysfs trees.
+    """
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory() # pylint: disable=consider-using-with
+        self.sysfs_root: str = self.directory.name
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    def test_smt_and_cache_domains(self) -> None:
+        write_cpu_tree(self.sysfs_root, X3D_CORES, X3D_CACHES)
+        topology = platform.CpuTopology(self.sysfs_root)
+
+        self.assertEqual(topology.cpus, list(range(16)))
+        self.assertEqual(topology.get_core_count(), 8)
+        self.assertEqual(topology.get_thread_count(), 16)
+        self.assertEqual(topology.get_core(13), [5, 13])
+        self.assertEqual(topology.cache_domains, {0: X3D_CACHES[0][0], 4: X3D_CACHES[1][0]})
+        self.assertEqual(topology.cache_sizes, {0: 96 * 1024 ** 2, 4: 32 * 1024 ** 2})
+        self.assertEqual(topology.performance_cpus, list(range(16)))
+
+    def test_offline_cpus_are_left_out(self) -> None:
+        write_cpu_tree(self.sysfs_root, X3D_CORES, X3D_CACHES)
+        write_file(self.sysfs_root, "devices/system/cpu/online", "0-7\n")
+        topology = platform.CpuTopology(self.sysfs_root)
+
+        self.assertEqual(topology.get_core(3), [3])
+        self.assertEqual(topology.cache_domains, {0: [0, 1, 2, 3], 4: [4, 5, 6, 7]})
+
+    def test_hybrid_intel(self) -> None:
+        # 2 P-cores with SMT and 4 E-cores sharing the L3.
+        write_cpu_tree(self.sysfs_root, [[0, 1], [2, 3], [4], [5], [6], [7]],
+                       [(list(range(8)), "24576K")])
+        write_file(self.sysfs_root, "devices/cpu_core/cpus", "0-3\n")
+        topology = platform.CpuTopology(self.sysfs_root)
+
+        self.assertEqual(topology.performance_cpus, [0, 1, 2, 3])
+        self.assertEqual(topology.get_core_count(), 6)
+
+    def test_capacities(self) -> None:
+        write_cpu_tree(self.sysfs_root, [[cpu] for cpu in range(8)],
+                       [(list(range(8)), "2048K")],
+                       capacities={cpu: 1024 if cpu >= 6 else 512 for cpu in range(8)})
+        topology = platform.CpuTopology(self.sysfs_root)
+
+        self.assertEqual(topology.performance_cpus, [6, 7])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+
+"""
+Tests for the EDID parser of the game launcher, against EDIDs built here
+and a fake DRM tree.
+"""
+
+import os
+import tempfile
+import unittest
+
+from tests.helpers import GAMELAUNCHER_PATH, load_script, write_file
+
+gamelauncher = load_script("gamelauncher", GAMELAUNCHER_PATH)
+
+def detailed_timing(pixel_clock: int, width: int, horizontal_blank: int,
+                    height: int, vertical_blank: int) -> bytes:
+    """
+    Returns an EDID detailed timing descriptor, the pixel clock in Hz.
+    """
+    return bytes([
+        *(pixel_clock // 10000).to_bytes(2, "little"),
+        width & 0xff, horizontal_blank & 0xff,
+        (width >> 8) << 4 | horizontal_blank >> 8,
+        height & 0xff, vertical_blank & 0xff,
+        (height >> 8) << 4 | vertical_blank >> 8,
+    ]) + bytes(10)
+
+def monitor_name(name: str) -> bytes:
+    """
+    Returns an EDID display descriptor with the name of the monitor.
+    """
+    return bytes([0, 0, 0, 0xfc, 0]) + f"{name}\n".encode().ljust(13, b" ")
+
+def with_checksum(block: bytes) -> bytes:
+    """
+    Pads a block to 128 bytes, the last one being its checksum.
+    """
+    block = block.ljust(127, b"\0")
+    return block + bytes([-sum(block) % 256])
+
+def base_block(descriptors: list[bytes], extensions: int = 0) -> bytes:
+    """
+    Returns an EDID base block with up to 4 descriptors.
+    """
+    header: bytes = bytes([0, 0xff, 0xff, 0xff, 0xff, 0xff, 0xff, 0]).ljust(54, b"\0")
+    return with_checksum(header + b"".join(descriptors).ljust(72, b"\0") + bytes([extensions]))
+
+def cta_block(descriptors: list[bytes]) -> bytes:
+    """
+    Returns a CTA-861 extension block with no data block, only descriptors.
+    """
+    return with_checksum(bytes([0x02, 3, 4, 0]) + b"".join(descriptors))
+
+def displayid_block(pixel_clock: int, width: int, horizontal_blank: int,
+                    height: int, vertical_blank: int) -> bytes:
+    """
+    Returns a DisplayID 2.0 extension block with a single Type VII timing,
+    the pixel clock in Hz.
+    """
+    timing: bytes = b"".join([
+        (pixel_clock // 1000 - 1).to_bytes(3, "little"), bytes([0]),
+        (width - 1).to_bytes(2, "little"), (horizontal_blank - 1).to_bytes(2, "little"),
+        bytes(4),
+        (height - 1).to_bytes(2, "little"), (vertical_blank - 1).to_bytes(2, "little"),
+        bytes(4),
+    ])
+    data_block: bytes = bytes([0x22, 0, len(timing)]) + timing
+    return with_checksum(bytes([0x70, 0x20, len(data_block), 0, 0]) + data_block)
+
+class TestParseEdidTimings(unittest.TestCase):
+    """
+    parse_edid_timings.
+    """
+    def test_base_block(self) -> None:
+        edid: bytes = base_block([detailed_timing(148500000, 1920, 280, 1080, 45),
+                                  monitor_name("TEST"),
+                                  detailed_timing(74250000, 1280, 370, 720, 30)])
+
+        self.assertEqual(gamelauncher.parse_edid_timings(edid),
+                         [(1920, 1080, 60.0), (1280, 720, 60.0)])
+
+    def test_cta_extension(self) -> None:
+        edid: bytes = base_block([detailed_timing(148500000, 1920, 280, 1080, 45)], 1) + \
+            cta_block([detailed_timing(356400000, 1920, 280, 1080, 45)])
+        timings = gamelauncher.parse_edid_timings(edid)
+
+        self.assertEqual([timing[:2] for timing in timings], [(1920, 1080), (1920, 1080)])
+        self.assertAlmostEqual(timings[1][2], 144.0)
+
+    def test_displayid_extension(self) -> None:
+        edid: bytes = base_block([detailed_timing(241500000, 2560, 160, 1440, 41)], 1) + \
+            displayid_block(972672000, 2560, 160, 1440, 50)
+        timings = gamelauncher.parse_edid_timings(edid)
+
+        self.assertEqual(timings[1], (2560, 1440, 240.0))
+        self.assertAlmostEqual(timings[0][2], 59.95, places=2)
+
+    def test_truncated(self) -> None:
+        self.assertEqual(gamelauncher.parse_edid_timings(b""), [])
+        self.assertEqual(gamelauncher.parse_edid_timings(bytes(64)), [])
+
+class TestReadDisplays(unittest.TestCase):
+    """
+    read_displays and get_display_defaults.
+    """
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory() # pylint: disable=consider-using-with
+        self.drm_root: str = self.directory.name
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    def write_connector(self, name: str, status: str, edid: bytes) -> None:
+        """
+        Writes a connector of the fake DRM tree.
+        """
+        write_file(self.drm_root, f"{name}/status", f"{status}\n")
+
+        with open(os.path.join(self.drm_root, name, "edid"), "wb") as f:
+            f.write(edid)
+
+    def test_native_modes(self) -> None:
+        self.write_connector("card1-DP-1", "connected",
+                             base_block([detailed_timing(148500000, 1920, 280, 1080, 45)], 1) + \
+                             cta_block([detailed_timing(356400000, 1920, 280, 1080, 45),
+                                        detailed_timing(74250000, 1280, 370, 720, 30)]))
+        self.write_connector("card1-DP-2", "connected",
+                             base_block([detailed_timing(241500000, 2560, 160, 1440, 41)]))
+        self.write_connector("card1-HDMI-A-1", "disconnected",
+                             base_block([detailed_timing(533250000, 3840, 160, 2160, 62)]))
+        self.write_connector("card1-eDP-1", "connected", b"")
+
+        self.assertEqual(gamelauncher.read_displays(self.drm_root), [
+            {"connector": "card1-DP-1", "width": 1920, "height": 1080, "refresh_rate": 144},
+            {"connector": "card1-DP-2", "width": 2560, "height": 1440, "refresh_rate": 60},
+        ])
+        self.assertEqual(gamelauncher.get_display_defaults(self.drm_root),
+                         {"width": 2560, "height": 1440, "refresh_rate": 60})
+
+    def test_no_display(self) -> None:
+        self.assertEqual(gamelauncher.get_display_defaults(self.drm_root), {})
+
+if __name__ == "__main__":
+    unittest.main()
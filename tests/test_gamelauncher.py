@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+
+"""
+Tests for the game launcher, against stub tools and fake trees.
+"""
+
+import importlib.util
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+from unittest import mock
+
+from tests.helpers import (GAMELAUNCHER_PATH, X3D_CACHES, X3D_CORES, load_script, write_cpu_tree,
+                           write_file)
+
+gamelauncher = load_script("gamelauncher", GAMELAUNCHER_PATH)
+
+# Counts its runs and only succeeds with --dlsym, PATH only has the stubs.
+MANGOHUD_STUB: str = """#!/bin/sh
+echo run >> "{runs}"
+[ "$1" = "--dlsym" ]
+"""
+
+class TestGameCpus(unittest.TestCase):
+    """
+    gamelauncher.get_game_cpus.
+    """
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory() # pylint: disable=consider-using-with
+        self.sysfs_root: str = self.directory.name
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    def test_largest_cache(self) -> None:
+        write_cpu_tree(self.sysfs_root, X3D_CORES, X3D_CACHES,
+                       frequencies={cpu: 5700000 if cpu % 8 >= 4 else 5250000
+                                    for cpu in range(16)})
+        topology = gamelauncher.CpuTopology(self.sysfs_root)
+
+        self.assertEqual(gamelauncher.get_game_cpus(topology), X3D_CACHES[0][0])
+
+    def test_highest_clock(self) -> None:
+        caches: list[tuple[list[int], str]] = [(X3D_CACHES[0][0], "32768K"), X3D_CACHES[1]]
+        write_cpu_tree(self.sysfs_root, X3D_CORES, caches,
+                       frequencies={cpu: 5700000 if cpu % 8 >= 4 else 5250000
+                                    for cpu in range(16)})
+        topology = gamelauncher.CpuTopology(self.sysfs_root)
+
+        self.assertEqual(gamelauncher.get_game_cpus(topology), X3D_CACHES[1][0])
+
+    def test_performance_cpus_only(self) -> None:
+        write_cpu_tree(self.sysfs_root, [[0, 1], [2, 3], [4], [5], [6], [7]],
+                       [(list(range(8)), "24576K")])
+        write_file(self.sysfs_root, "devices/cpu_core/cpus", "0-3\n")
+        topology = gamelauncher.CpuTopology(self.sysfs_root)
+
+        self.assertEqual(gamelauncher.get_game_cpus(topology), [0, 1, 2, 3])
+
+class TestCapabilityCache(unittest.TestCase):
+    """
+    The tools and probe results the CapabilityCache keeps between launches.
+    """
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory() # pylint: disable=consider-using-with
+        self.bin_dir: str = os.path.join(self.directory.name, "bin")
+        self.cache_path: str = os.path.join(self.directory.name, "cache/capabilities.json")
+        self.environment = mock.patch.dict(os.environ, {"PATH": self.bin_dir})
+        self.environment.start()
+        self.runs: str = os.path.join(self.directory.name, "mangohud.runs")
+        self.install("mangohud", MANGOHUD_STUB.format(runs=self.runs))
+
+    def tearDown(self) -> None:
+        self.environment.stop()
+        self.directory.cleanup()
+
+    def install(self, name: str, content: str = "#!/bin/sh\n") -> str:
+        """
+        Installs a stub tool, replacing the binary like a package upgrade does.
+        """
+        path: str = os.path.join(self.bin_dir, name)
+        write_file(self.bin_dir, f"{name}.new", content)
+        os.chmod(f"{path}.new", 0o755)
+        os.replace(f"{path}.new", path)
+
+        # The mtime of the directory may not change within the same clock tick.
+        stat: os.stat_result = os.stat(self.bin_dir)
+        os.utime(self.bin_dir, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000000))
+
+        return path
+
+    def get_runs(self) -> int:
+        """
+        Returns how many times the mangohud stub ran.
+        """
+        try:
+            with open(self.runs, "r", encoding="utf-8") as f:
+                return len(f.readlines())
+        except FileNotFoundError:
+            return 0
+
+    def reload(self) -> "gamelauncher.CapabilityCache":
+        """
+        Returns the cache as the next launch reads it.
+        """
+        return gamelauncher.CapabilityCache(self.cache_path)
+
+    def test_find_tools(self) -> None:
+        cache = self.reload()
+        tools: dict[str, str | None] = cache.find_tools()
+        cache.save()
+
+        self.assertEqual(tools["mangohud"], os.path.join(self.bin_dir, "mangohud"))
+        self.assertIsNone(tools["gamescope"])
+
+        with mock.patch.object(shutil, "which", side_effect=AssertionError("PATH was searched")):
+            self.assertEqual(self.reload().find_tools(), tools)
+
+    def test_find_new_tools(self) -> None:
+        cache = self.reload()
+        cache.find_tools()
+        cache.save()
+        self.install("gamescope")
+
+        self.assertEqual(self.reload().find_tools()["gamescope"],
+                         os.path.join(self.bin_dir, "gamescope"))
+
+    def test_probe(self) -> None:
+        mangohud: str = os.path.join(self.bin_dir, "mangohud")
+        cache = self.reload()
+
+        self.assertTrue(cache.probe([mangohud, "--dlsym"]))
+        self.assertFalse(cache.probe([mangohud, "--version"]))
+        cache.save()
+        self.assertEqual(self.get_runs(), 2)
+
+        cache = self.reload()
+        self.assertTrue(cache.probe([mangohud, "--dlsym"]))
+        self.assertFalse(cache.changed)
+        self.assertEqual(self.get_runs(), 2)
+
+    def test_probe_after_upgrade(self) -> None:
+        mangohud: str = os.path.join(self.bin_dir, "mangohud")
+        cache = self.reload()
+        cache.probe([mangohud, "--dlsym"])
+        cache.save()
+
+        self.install("mangohud", MANGOHUD_STUB.format(runs=self.runs)
+                     .replace('[ "$1" = "--dlsym" ]', "false"))
+        cache = self.reload()
+
+        self.assertFalse(cache.probe([mangohud, "--dlsym"]))
+        self.assertEqual(self.get_runs(), 2)
+        self.assertEqual(len(cache.data["probes"]), 1)
+
+    def test_unchanged_cache_is_not_written(self) -> None:
+        self.reload().save()
+        self.assertFalse(os.path.exists(self.cache_path))
+
+MANGOHUD_LOG: str = """os,cpu,gpu,ram,kernel,driver,cpuscheduler
+Arch Linux,AMD Ryzen 7 7800X3D,AMD Radeon RX 7900 XTX,32 GB,6.12.1,Mesa 24.3,performance
+fps,frametime,cpu_load,gpu_load,cpu_temp,gpu_temp,elapsed
+144.1,6.94,20,90,60,70,1000
+143.8,6.95,21,91,60,70,7950
+
+96.0,10.41,22,92
+120.2,8.32,23,93,61,71,16270,1
+0,n/a,23,93,61,71,24590
+60.1,16.64,24,94,61,71,41230
+59.9,nan,24,94,61,71,57870
+165.3,6.05,24,94,61,71,63920
+144.0,6.9,2"""
+
+class TestMangoHudLog(unittest.TestCase):
+    """
+    read_mangohud_log with and without numpy.
+    """
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory() # pylint: disable=consider-using-with
+        self.path: str = os.path.join(self.directory.name, "game_2026-10-18_20-00-00.csv")
+        write_file(self.directory.name, os.path.basename(self.path), MANGOHUD_LOG)
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    def read_without_numpy(self) -> tuple[dict[str, str], list[float]]:
+        """
+        Reads the log as if numpy was not installed.
+        """
+        with mock.patch.dict(sys.modules, {"numpy": None}):
+            return gamelauncher.read_mangohud_log(self.path)
+
+    def test_without_numpy(self) -> None:
+        system, frametimes = self.read_without_numpy()
+
+        self.assertEqual(system["cpu"], "AMD Ryzen 7 7800X3D")
+        # The short, long, cut and non numeric rows are dropped.
+        self.assertEqual(frametimes, [6.94, 6.95, 16.64, 6.05])
+
+    @unittest.skipUnless(importlib.util.find_spec("numpy"), "numpy is not installed")
+    def test_numpy_matches(self) -> None:
+        system, frametimes = gamelauncher.read_mangohud_log(self.path)
+
+        self.assertEqual(system, self.read_without_numpy()[0])
+        self.assertEqual(frametimes.tolist(), self.read_without_numpy()[1])
+
+    @unittest.skipUnless(importlib.util.find_spec("numpy"), "numpy is not installed")
+    def test_numpy_well_formed(self) -> None:
+        lines: list[str] = MANGOHUD_LOG.splitlines()
+        write_file(self.directory.name, os.path.basename(self.path),
+                   "\n".join(lines[:5] + [lines[9], lines[11]]) + "\n")
+
+        self.assertEqual(gamelauncher.read_mangohud_log(self.path)[1].tolist(),
+                         [6.94, 6.95, 16.64, 6.05])
+        self.assertEqual(self.read_without_numpy()[1], [6.94, 6.95, 16.64, 6.05])
+
+    def test_not_a_mangohud_log(self) -> None:
+        write_file(self.directory.name, os.path.basename(self.path), "a,b\n1,2\nfps,cpu\n1,2\n")
+
+        with self.assertRaises(ValueError):
+            gamelauncher.read_mangohud_log(self.path)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,398 @@
+#!/usr/bin/env python3
+
+"""
+Tests for the libvirt qemu hook, against fake sysfs and procfs trees.
+"""
+
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import unittest
+
+from unittest import mock
+
+from tests.helpers import (QEMU_HOOK_PATH, X3D_CORES, load_script, read_file, write_cpu_tree,
+                           write_file)
+
+qemu_hook = load_script("qemu_hook", QEMU_HOOK_PATH)
+
+CCDS: list[tuple[list[int], str]] = [
+    ([0, 1, 2, 3, 8, 9, 10, 11], "32768K"),
+    ([4, 5, 6, 7, 12, 13, 14, 15], "32768K"),
+]
+POOL_DIR: str = "kernel/mm/hugepages/hugepages-2048kB"
+
+# Keeps the AllowedCPUs of every unit in a file of its own and logs its calls.
+# Like systemd, the properties of a unit do not come in the order they are asked.
+SYSTEMCTL_STUB: str = """#!{python}
+import os
+import sys
+
+units_dir = {units_dir!r}
+command = sys.argv[1]
+arguments = sys.argv[sys.argv.index("--") + 1:]
+
+with open(os.path.join(units_dir, "calls"), "a", encoding="utf-8") as f:
+    f.write(command + "\\n")
+
+if command == "show":
+    blocks = []
+    for unit in arguments:
+        with open(os.path.join(units_dir, unit), "r", encoding="utf-8") as f:
+            blocks.append(f"AllowedCPUs={{f.read()}}\\nId={{unit}}\\n")
+    print("\\n".join(blocks), end="")
+elif command == "set-property":
+    unit, assignment = arguments
+    with open(os.path.join(units_dir, unit), "w", encoding="utf-8") as f:
+        f.write(assignment.split("=", 1)[1])
+"""
+
+def domain_xml(memory: str = "<memory unit='GiB'>4</memory>", backing: str = "",
+               cputune: str = "") -> str:
+    """
+    Returns a minimal domain XML.
+    """
+    return f"<domain type='kvm'><name>win11</name>{memory}{backing}{cputune}</domain>"
+
+class TestSplitCpus(unittest.TestCase):
+    """
+    split_cpus and get_pinned_cpus.
+    """
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory() # pylint: disable=consider-using-with
+        self.sysfs_root: str = self.directory.name
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    def test_pinned_whole_cores(self) -> None:
+        write_cpu_tree(self.sysfs_root, X3D_CORES, CCDS)
+        topology = qemu_hook.CpuTopology(self.sysfs_root)
+        pinned: list[int] = qemu_hook.get_pinned_cpus(domain_xml(cputune=(
+            "<cputune><vcpupin vcpu='0' cpuset='2'/><vcpupin vcpu='1' cpuset='3'/>"
+            "<emulatorpin cpuset='4'/></cputune>")))
+
+        self.assertEqual(pinned, [2, 3, 4])
+        host, guest = qemu_hook.split_cpus(topology, pinned)
+        self.assertEqual(guest, [2, 3, 4, 10, 11, 12])
+        self.assertEqual(host, [0, 1, 5, 6, 7, 8, 9, 13, 14, 15])
+
+    def test_cache_domains(self) -> None:
+        write_cpu_tree(self.sysfs_root, X3D_CORES, CCDS)
+        topology = qemu_hook.CpuTopology(self.sysfs_root)
+
+        self.assertEqual(qemu_hook.split_cpus(topology, []), (CCDS[0][0], CCDS[1][0]))
+
+    def test_single_cache_domain(self) -> None:
+        write_cpu_tree(self.sysfs_root, X3D_CORES, [(list(range(16)), "32768K")])
+        topology = qemu_hook.CpuTopology(self.sysfs_root)
+
+        self.assertEqual(qemu_hook.split_cpus(topology, []), (CCDS[0][0], CCDS[1][0]))
+
+    def test_no_host_cpu_left(self) -> None:
+        write_cpu_tree(self.sysfs_root, X3D_CORES, CCDS)
+        topology = qemu_hook.CpuTopology(self.sysfs_root)
+
+        with self.assertRaises(ValueError):
+            qemu_hook.split_cpus(topology, list(range(16)))
+
+class TestHostUnits(unittest.TestCase):
+    """
+    The AllowedCPUs of the host units, saved on started and restored on
+    release, against a stub systemctl.
+    """
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory() # pylint: disable=consider-using-with
+        self.sysfs_root: str = os.path.join(self.directory.name, "sys")
+        self.procfs_root: str = os.path.join(self.directory.name, "proc")
+        self.state_dir: str = os.path.join(self.directory.name, "run")
+        self.units_dir: str = os.path.join(self.directory.name, "units")
+        bin_dir: str = os.path.join(self.directory.name, "bin")
+        write_cpu_tree(self.sysfs_root, X3D_CORES, CCDS)
+        write_file(self.procfs_root, "interrupts", "            CPU0       CPU1\n")
+        write_file(bin_dir, "systemctl", SYSTEMCTL_STUB.format(python=sys.executable,
+                                                               units_dir=self.units_dir))
+        os.chmod(os.path.join(bin_dir, "systemctl"), 0o755)
+        self.environment = mock.patch.dict(os.environ, {"PATH": bin_dir})
+        self.environment.start()
+
+        # Only user.slice is restricted, the empty values come first and last.
+        self.original: dict[str, str] = {"system.slice": "", "user.slice": "0-11",
+                                         "init.scope": ""}
+        for unit, cpus in self.original.items():
+            write_file(self.units_dir, unit, cpus)
+
+    def tearDown(self) -> None:
+        self.environment.stop()
+        self.directory.cleanup()
+
+    def get_units(self) -> dict[str, str]:
+        """
+        Returns the AllowedCPUs the stub systemctl holds for every unit.
+        """
+        return {unit: read_file(self.units_dir, unit) for unit in self.original}
+
+    def run_hook(self, domain: str, operation: str) -> int:
+        """
+        Runs an operation of the hook for an unpinned domain, returning its exit code.
+        """
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+            return qemu_hook.main([domain, operation], domain_xml(), self.sysfs_root,
+                                  self.procfs_root, self.state_dir)
+
+    def test_get_allowed_cpus(self) -> None:
+        self.assertEqual(qemu_hook.get_allowed_cpus(), self.original)
+
+    def test_save_and_restore(self) -> None:
+        self.assertEqual(self.run_hook("win11", "started"), 0)
+        self.assertEqual(self.get_units(), {unit: "0-3,8-11" for unit in self.original})
+
+        self.assertEqual(self.run_hook("win11", "release"), 0)
+        self.assertEqual(self.get_units(), self.original)
+        self.assertNotIn("allowed_cpus", read_file(self.state_dir, "state.json"))
+
+    def test_second_guest_keeps_the_saved_cpus(self) -> None:
+        self.run_hook("win11", "started")
+        self.run_hook("linux", "started")
+        self.run_hook("win11", "release")
+
+        self.assertEqual(self.get_units(), {unit: "0-3,8-11" for unit in self.original})
+        self.run_hook("linux", "release")
+        self.assertEqual(self.get_units(), self.original)
+        # The units are read once, when the first guest starts.
+        self.assertEqual(read_file(self.units_dir, "calls").splitlines().count("show"), 1)
+
+class TestHugepages(unittest.TestCase):
+    """
+    get_hugepages, HugepagePool and the prepare operation.
+    """
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory() # pylint: disable=consider-using-with
+        self.sysfs_root: str = os.path.join(self.directory.name, "sys")
+        self.procfs_root: str = os.path.join(self.directory.name, "proc")
+        self.state_dir: str = os.path.join(self.directory.name, "run")
+        write_cpu_tree(self.sysfs_root, X3D_CORES, CCDS)
+        write_file(self.procfs_root, "meminfo", "MemTotal: 65536000 kB\nHugepagesize: 2048 kB\n")
+        write_file(self.procfs_root, "sys/vm/compact_memory", "")
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    def write_pool(self, pages: int, free_pages: int) -> None:
+        """
+        Writes the 2 MiB hugepage pool.
+        """
+        write_file(self.sysfs_root, f"{POOL_DIR}/nr_hugepages", f"{pages}\n")
+        write_file(self.sysfs_root, f"{POOL_DIR}/free_hugepages", f"{free_pages}\n")
+
+    def test_get_hugepages(self) -> None:
+        backing: str = "<memoryBacking><hugepages/></memoryBacking>"
+
+        self.assertIsNone(qemu_hook.get_hugepages(domain_xml(), self.procfs_root))
+        self.assertEqual(qemu_hook.get_hugepages(domain_xml(backing=backing), self.procfs_root),
+                         (2048, 2048))
+        self.assertEqual(qemu_hook.get_hugepages(domain_xml(
+            memory="<memory unit='KiB'>4097</memory>", backing=backing), self.procfs_root),
+                         (2048, 3))
+        self.assertEqual(qemu_hook.get_hugepages(domain_xml(backing=(
+            "<memoryBacking><hugepages><page size='1' unit='G'/></hugepages></memoryBacking>")),
+                                                 self.procfs_root),
+                         (1024 ** 2, 4))
+
+        with self.assertRaises(ValueError):
+            qemu_hook.get_hugepages(domain_xml(backing=(
+                "<memoryBacking><hugepages><page size='0'/></hugepages></memoryBacking>")))
+
+    def test_parse_memory_size(self) -> None:
+        self.assertEqual(qemu_hook.parse_memory_size("1", "GiB"), 1024 ** 2)
+        self.assertEqual(qemu_hook.parse_memory_size("1", "GB"), 976563)
+        self.assertEqual(qemu_hook.parse_memory_size("2048", None), 2048)
+        self.assertEqual(qemu_hook.parse_memory_size("4096", "bytes"), 4)
+
+        with self.assertRaises(ValueError):
+            qemu_hook.parse_memory_size("1", "XiB")
+
+    def test_reserve_grows_by_missing_pages(self) -> None:
+        self.write_pool(4, 4)
+        pool = qemu_hook.HugepagePool(2048, self.sysfs_root, self.procfs_root)
+
+        self.assertEqual(pool.reserve(10), 6)
+        self.assertEqual(read_file(self.sysfs_root, f"{POOL_DIR}/nr_hugepages"), "10")
+        self.assertEqual(read_file(self.procfs_root, "sys/vm/compact_memory"), "1")
+
+        pool.release(6)
+        self.assertEqual(pool.get_pages(), 4)
+
+    def test_reserve_uses_free_pages(self) -> None:
+        self.write_pool(12, 12)
+        pool = qemu_hook.HugepagePool(2048, self.sysfs_root, self.procfs_root)
+
+        self.assertEqual(pool.reserve(10), 0)
+        self.assertEqual(pool.get_pages(), 12)
+
+    def test_reserved_pages_are_not_free(self) -> None:
+        self.write_pool(12, 12)
+        write_file(self.sysfs_root, f"{POOL_DIR}/resv_hugepages", "8\n")
+        pool = qemu_hook.HugepagePool(2048, self.sysfs_root, self.procfs_root)
+
+        self.assertEqual(pool.get_free_pages(), 4)
+        self.assertEqual(pool.reserve(10), 6)
+
+    def test_reserve_on_top_of_promised_pages(self) -> None:
+        self.write_pool(12, 12)
+        pool = qemu_hook.HugepagePool(2048, self.sysfs_root, self.procfs_root)
+
+        self.assertEqual(pool.reserve(10, 8), 6)
+
+    def test_reserve_unsupported_size(self) -> None:
+        pool = qemu_hook.HugepagePool(1024 ** 2, self.sysfs_root, self.procfs_root)
+
+        with self.assertRaises(FileNotFoundError):
+            pool.reserve(4)
+
+    def prepare(self, xml: str, domain: str = "win11", operation: str = "prepare") -> int:
+        """
+        Runs the prepare operation, or another one, returning its exit code.
+        """
+        with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+            return qemu_hook.main([domain, operation], xml, self.sysfs_root, self.procfs_root,
+                                  self.state_dir)
+
+    def test_prepare_with_free_pages(self) -> None:
+        self.write_pool(2048, 2048)
+        xml: str = domain_xml(backing="<memoryBacking><hugepages/></memoryBacking>")
+
+        self.assertEqual(self.prepare(xml), 0)
+        self.assertEqual(read_file(self.sysfs_root, f"{POOL_DIR}/nr_hugepages"), "2048")
+        self.assertNotIn('"hugepages"', read_file(self.state_dir, "state.json"))
+
+    def test_prepare_two_domains(self) -> None:
+        # Enough free pages for one guest, the pool grows for the second one.
+        self.write_pool(3000, 3000)
+        xml: str = domain_xml(backing="<memoryBacking><hugepages/></memoryBacking>")
+
+        with mock.patch.object(qemu_hook.HugepagePool, "get_free_pages",
+                               lambda pool: pool.get_pages()):
+            self.assertEqual(self.prepare(xml, "win11"), 0)
+            self.assertEqual(self.prepare(xml, "linux"), 0)
+            self.assertEqual(read_file(self.sysfs_root, f"{POOL_DIR}/nr_hugepages"), "4096")
+
+            self.assertEqual(self.prepare(xml, "linux", "release"), 0)
+            self.assertEqual(read_file(self.sysfs_root, f"{POOL_DIR}/nr_hugepages"), "3000")
+            self.assertEqual(self.prepare(xml, "win11", "release"), 0)
+
+        with qemu_hook.HookState(self.state_dir) as state:
+            self.assertEqual(state.data["hugepage_promises"], {})
+
+    def test_started_domain_keeps_no_promise(self) -> None:
+        self.write_pool(2048, 2048)
+        xml: str = domain_xml(backing="<memoryBacking><hugepages/></memoryBacking>")
+
+        self.assertEqual(self.prepare(xml), 0)
+        with mock.patch.object(qemu_hook, "isolate_guest"):
+            self.assertEqual(self.prepare(xml, operation="started"), 0)
+
+        with qemu_hook.HookState(self.state_dir) as state:
+            self.assertEqual(state.data["hugepage_promises"], {})
+
+    def test_prepare_without_enough_memory(self) -> None:
+        # The fake pool never gets any free page, as if memory was too fragmented.
+        self.write_pool(0, 0)
+        xml: str = domain_xml(backing="<memoryBacking><hugepages/></memoryBacking>")
+
+        self.assertEqual(self.prepare(xml), 1)
+        self.assertEqual(read_file(self.sysfs_root, f"{POOL_DIR}/nr_hugepages"), "0")
+
+    def test_prepare_unsupported_size(self) -> None:
+        xml: str = domain_xml(backing=(
+            "<memoryBacking><hugepages><page size='1' unit='G'/></hugepages></memoryBacking>"))
+
+        self.assertEqual(self.prepare(xml), 1)
+
+    def test_prepare_zero_page_size(self) -> None:
+        xml: str = domain_xml(backing=(
+            "<memoryBacking><hugepages><page size='0' unit='KiB'/></hugepages></memoryBacking>"))
+
+        self.assertEqual(self.prepare(xml), 1)
+
+    def test_prepare_unknown_unit(self) -> None:
+        xml: str = domain_xml(memory="<memory unit='XiB'>4</memory>",
+                              backing="<memoryBacking><hugepages/></memoryBacking>")
+
+        self.assertEqual(self.prepare(xml), 1)
+
+class TestSteerIrqs(unittest.TestCase):
+    """
+    steer_irqs and read_interrupts.
+    """
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory() # pylint: disable=consider-using-with
+        self.sysfs_root: str = os.path.join(self.directory.name, "sys")
+        self.procfs_root: str = os.path.join(self.directory.name, "proc")
+        self.state_dir: str = os.path.join(self.directory.name, "run")
+        write_cpu_tree(self.sysfs_root, X3D_CORES, CCDS)
+        write_file(self.procfs_root, "interrupts", "\n".join([
+            "            CPU0       CPU1",
+            "   0:         44          0   IO-APIC    2-edge      timer",
+            "   9:          0          0   IO-APIC    9-fasteoi   acpi",
+            "  42:       1200        800   PCI-MSIX-0000:01:00.0    0-edge      nvme0q0",
+            " NMI:          0          0   Non-maskable interrupts",
+            " LOC:     123456     654321   Local timer interrupts",
+        ]) + "\n")
+        write_file(self.procfs_root, "irq/0/smp_affinity_list", "0-15\n")
+        write_file(self.procfs_root, "irq/9/smp_affinity_list", "4\n")
+        write_file(self.procfs_root, "irq/42/smp_affinity_list", "0-3\n")
+        self.topology = qemu_hook.CpuTopology(self.sysfs_root)
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    def affinity(self, irq: str) -> str:
+        """
+        Returns the affinity of an IRQ in the fake procfs.
+        """
+        return read_file(self.procfs_root, f"irq/{irq}/smp_affinity_list")
+
+    def test_read_interrupts(self) -> None:
+        self.assertEqual(qemu_hook.read_interrupts(self.procfs_root), ["0", "9", "42"])
+
+    def test_steer_and_restore(self) -> None:
+        with qemu_hook.HookState(self.state_dir) as state:
+            state.data["domains"] = {"win11": CCDS[1][0]}
+            self.assertEqual(qemu_hook.steer_irqs(state, self.topology, self.procfs_root),
+                             (2, 0))
+
+        self.assertEqual(self.affinity("0"), "0-3,8-11")
+        # Only on guest CPUs, it falls back to every host CPU.
+        self.assertEqual(self.affinity("9"), "0-3,8-11")
+        self.assertEqual(self.affinity("42"), "0-3")
+
+        with qemu_hook.HookState(self.state_dir) as state:
+            state.data["domains"] = {}
+            qemu_hook.steer_irqs(state, self.topology, self.procfs_root)
+            self.assertNotIn("irq_affinity", state.data)
+
+        self.assertEqual(self.affinity("0"), "0-15")
+        self.assertEqual(self.affinity("9"), "4")
+        self.assertEqual(self.affinity("42"), "0-3")
+
+    def test_second_guest_keeps_original_affinity(self) -> None:
+        with qemu_hook.HookState(self.state_dir) as state:
+            state.data["domains"] = {"win11": [4, 12]}
+            qemu_hook.steer_irqs(state, self.topology, self.procfs_root)
+            state.data["domains"]["linux"] = [5, 13]
+            qemu_hook.steer_irqs(state, self.topology, self.procfs_root)
+
+            self.assertEqual(state.data["irq_affinity"]["0"], "0-15")
+            self.assertEqual(self.affinity("0"), "0-3,6-11,14-15")
+
+            state.data["domains"] = {}
+            qemu_hook.steer_irqs(state, self.topology, self.procfs_root)
+
+        self.assertEqual(self.affinity("0"), "0-15")
+        self.assertEqual(self.affinity("9"), "4")
+
+if __name__ == "__main__":
+    unittest.main()
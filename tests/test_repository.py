@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+
+"""
+Tests for the RepositoryManager, against local bare repositories as remotes.
+"""
+
+import contextlib
+import io
+import os
+import subprocess
+import tempfile
+import unittest
+
+from collections.abc import Callable
+from typing import Any
+from unittest import mock
+
+from lib import tracing
+from modules import repository
+from modules.repository import RepositoryManager, RepositoryPool
+
+GIT_ENVIRONMENT: dict[str, str] = {
+    "GIT_AUTHOR_NAME": "Test",
+    "GIT_AUTHOR_EMAIL": "test@example.com",
+    "GIT_COMMITTER_NAME": "Test",
+    "GIT_COMMITTER_EMAIL": "test@example.com",
+    "GIT_CONFIG_GLOBAL": os.devnull,
+    "GIT_CONFIG_NOSYSTEM": "1",
+}
+
+def git(*arguments: str) -> str:
+    """
+    Runs git outside of the code under test, returning its output.
+    """
+    return subprocess.run(["git", *arguments], check=True, capture_output=True, text=True,
+                          env={**os.environ, **GIT_ENVIRONMENT}).stdout.strip()
+
+def commit_file(work_tree: str, name: str, content: str) -> str:
+    """
+    Commits a file, returning the new commit.
+    """
+    with open(os.path.join(work_tree, name), "w", encoding="utf-8") as f:
+        f.write(content)
+
+    git("-C", work_tree, "add", name)
+    git("-C", work_tree, "commit", "--quiet", "-m", f"Update {name}")
+
+    return git("-C", work_tree, "rev-parse", "HEAD")
+
+class RepositoryTestCase(unittest.TestCase):
+    """
+    A bare remote with a single commit, pushed from a work tree of its own.
+    """
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory() # pylint: disable=consider-using-with
+        self.environment = mock.patch.dict(os.environ, GIT_ENVIRONMENT)
+        self.environment.start()
+        self.remote: str = os.path.join(self.directory.name, "remote.git")
+        self.upstream: str = os.path.join(self.directory.name, "upstream")
+        self.repositories_dir: str = os.path.join(self.directory.name, "repositories")
+
+        git("init", "--quiet", "--bare", "--initial-branch=master", self.remote)
+        git("init", "--quiet", "--initial-branch=master", self.upstream)
+        commit_file(self.upstream, "README", "first\n")
+        git("-C", self.upstream, "push", "--quiet", self.remote, "master")
+
+    def tearDown(self) -> None:
+        self.environment.stop()
+        self.directory.cleanup()
+
+    def push(self, name: str, content: str) -> str:
+        """
+        Pushes a new commit to the remote, returning it.
+        """
+        commit: str = commit_file(self.upstream, name, content)
+        git("-C", self.upstream, "push", "--quiet", self.remote, "master")
+        return commit
+
+    def run_quietly(self, action: Callable[[], None]) -> list[str]:
+        """
+        Runs an action without its output, returning the git subcommands it ran.
+        """
+        tracer: tracing.Tracer = tracing.enable()
+        tracer.spans.clear()
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            action()
+
+        return [span.args["command"][3] for span in tracer.spans
+                if span.category == "subprocess" and span.args["command"][:2] == ["git", "-C"]]
+
+class TestUpdateRepo(RepositoryTestCase):
+    """
+    The fast path of update_repo.
+    """
+    def setUp(self) -> None:
+        super().setUp()
+        self.manager = RepositoryManager(f"file://{self.remote}", "clone", self.repositories_dir)
+        self.run_quietly(self.manager.clone_repo)
+        self.clone: str = self.manager.FULL_REPOSITORY_PATH
+
+    def test_up_to_date(self) -> None:
+        head: str = git("-C", self.clone, "rev-parse", "HEAD")
+
+        self.assertEqual(self.run_quietly(self.manager.update_repo), ["status", "fetch", "rev-list"])
+        self.assertEqual(git("-C", self.clone, "rev-parse", "HEAD"), head)
+
+    def test_behind(self) -> None:
+        commit: str = self.push("CHANGELOG", "second\n")
+
+        self.assertEqual(self.run_quietly(self.manager.update_repo),
+                         ["status", "fetch", "rev-list", "merge"])
+        self.assertEqual(git("-C", self.clone, "rev-parse", "HEAD"), commit)
+
+    def test_dirty(self) -> None:
+        commit: str = self.push("CHANGELOG", "second\n")
+
+        with open(os.path.join(self.clone, "README"), "w", encoding="utf-8") as f:
+            f.write("local\n")
+        with open(os.path.join(self.clone, "notes"), "w", encoding="utf-8") as f:
+            f.write("untracked\n")
+
+        self.assertEqual(self.run_quietly(self.manager.update_repo),
+                         ["status", "fetch", "rev-list", "stash", "merge", "stash"])
+        self.assertEqual(git("-C", self.clone, "rev-parse", "HEAD"), commit)
+        self.assertEqual(git("-C", self.clone, "status", "--porcelain"), "M README\n?? notes")
+        self.assertEqual(git("-C", self.clone, "stash", "list"), "")
+
+    def test_dirty_up_to_date(self) -> None:
+        with open(os.path.join(self.clone, "README"), "w", encoding="utf-8") as f:
+            f.write("local\n")
+
+        self.assertEqual(self.run_quietly(self.manager.update_repo), ["status", "fetch", "rev-list"])
+        self.assertEqual(git("-C", self.clone, "status", "--porcelain"), "M README")
+
+    def test_diverged(self) -> None:
+        self.push("CHANGELOG", "second\n")
+        commit_file(self.clone, "LOCAL", "local\n")
+
+        with self.assertRaises(RuntimeError):
+            self.run_quietly(self.manager.update_repo)
+
+class TestSharedStore(RepositoryTestCase):
+    """
+    Clones borrowing their objects from the shared stores.
+    """
+    def clone(self, repo_dir: str, **clone_options: Any) -> str:
+        """
+        Clones the remote with the shared store, returning the path of the clone.
+        """
+        manager = RepositoryManager(f"file://{self.remote}", repo_dir, self.repositories_dir,
+                                    capture_output=True, shared=True, **clone_options)
+        self.run_quietly(manager.clone_repo)
+        return manager.FULL_REPOSITORY_PATH
+
+    def get_alternates(self, clone: str) -> str:
+        """
+        Returns the object directories a clone borrows from.
+        """
+        with open(os.path.join(clone, ".git/objects/info/alternates"), "r",
+                  encoding="utf-8") as f:
+            return f.read().strip()
+
+    def test_partial_then_complete_clone(self) -> None:
+        self.push("CHANGELOG", "second\n")
+        partial: str = self.clone("partial", blob_filter="blob:none")
+        complete: str = self.clone("complete")
+
+        self.assertEqual(self.get_alternates(partial),
+                         os.path.join(self.repositories_dir, ".shared-blob-none.git/objects"))
+        self.assertEqual(self.get_alternates(complete),
+                         os.path.join(self.repositories_dir, ".shared.git/objects"))
+        git("-C", complete, "fsck", "--no-progress")
+        with open(os.path.join(complete, "CHANGELOG"), "r", encoding="utf-8") as f:
+            self.assertEqual(f.read(), "second\n")
+
+    def test_complete_clones_share_objects(self) -> None:
+        first: str = self.clone("first")
+        second: str = self.clone("second")
+
+        self.assertEqual(self.get_alternates(first), self.get_alternates(second))
+        # Every object comes from the store, the clones do not keep any of their own.
+        self.assertEqual(git("-C", second, "count-objects"), "0 objects, 0 kilobytes")
+
+    def test_fetch_without_the_store_lock(self) -> None:
+        run = tracing.run
+        locked_fetches: list[bool] = []
+
+        def check_lock(command: list[str], **kwargs: Any) -> subprocess.CompletedProcess[Any]:
+            if "fetch" in command:
+                locked_fetches.append(repository.SHARED_STORE_LOCK.locked())
+            return run(command, **kwargs)
+
+        repositories: list[tuple[str, str]] = [(f"file://{self.remote}", f"clone{index}")
+                                               for index in range(4)]
+
+        with mock.patch.object(tracing, "run", check_lock):
+            results = RepositoryPool(repositories, repositories_dir=self.repositories_dir,
+                                     shared=True).sync()
+
+        self.assertTrue(all(result.success for result in results), [str(result)
+                                                                    for result in results])
+        self.assertEqual(locked_fetches, [False] * 4)
+
+    def test_store_names(self) -> None:
+        self.assertEqual(repository.get_shared_store_name(), ".shared.git")
+        self.assertEqual(repository.get_shared_store_name("blob:limit=1m"),
+                         ".shared-blob-limit-1m.git")
+        self.assertTrue(repository.is_shared_store(".shared-blob-none.git"))
+        self.assertFalse(repository.is_shared_store("shared.git"))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+
+"""
+Tests for the ZramManager, against fake sysfs and procfs trees.
+"""
+
+import os
+import subprocess
+import tempfile
+import unittest
+
+from typing import Any
+from unittest import mock
+
+from lib import tracing
+from modules import zram
+from modules.zram import ZramManager
+from tests.helpers import read_file, write_file
+
+SWAPS_HEADER: str = "Filename\t\t\t\tType\t\tSize\t\tUsed\t\tPriority\n"
+
+class TestZramManager(unittest.TestCase):
+    """
+    Config generation and zswap setup of the ZramManager.
+    """
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory() # pylint: disable=consider-using-with
+        self.root: str = self.directory.name
+        self.set_memory(16 * 1024 ** 2)
+        write_file(self.root, "proc/swaps", SWAPS_HEADER)
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+
+    def set_memory(self, kib: int) -> None:
+        """
+        Writes the installed RAM to the fake meminfo.
+        """
+        write_file(self.root, "proc/meminfo", f"MemTotal:       {kib} kB\nMemFree: 1024 kB\n")
+
+    def manager(self) -> ZramManager:
+        """
+        Returns a ZramManager reading the fake tree.
+        """
+        return ZramManager(os.path.join(self.root, "sys"),
+                           os.path.join(self.root, "proc/meminfo"),
+                           os.path.join(self.root, "proc/swaps"),
+                           os.path.join(self.root, "proc/crypto"),
+                           os.path.join(self.root, "lib/modules/6.12.0"))
+
+    def test_size(self) -> None:
+        self.assertEqual(self.manager().get_zram_size(), 8192)
+
+        self.set_memory(64 * 1024 ** 2)
+        self.assertEqual(self.manager().get_zram_size(), zram.ZRAM_MAX_SIZE)
+
+        write_file(self.root, "proc/meminfo", "MemFree: 1024 kB\n")
+        with self.assertRaises(RuntimeError):
+            self.manager().get_zram_size()
+
+    def test_compressor_from_zram(self) -> None:
+        write_file(self.root, "sys/block/zram0/comp_algorithm", "lzo [lzo-rle] lz4 842\n")
+        self.assertEqual(self.manager().get_compressor(), "lz4")
+
+    def test_compressor_from_crypto(self) -> None:
+        write_file(self.root, "proc/crypto", "\n".join([
+            "name         : lzo-rle", "driver       : lzo-rle-scomp", "type         : scomp", "",
+            "name         : sha256", "driver       : sha256-generic", "type         : shash", "",
+        ]))
+        self.assertEqual(self.manager().get_compressor(), "lzo-rle")
+
+        write_file(self.root, "lib/modules/6.12.0/modules.dep",
+                   "kernel/crypto/zstd.ko.zst: kernel/lib/zstd/zstd_compress.ko.zst\n" + \
+                   "kernel/lib/zstd/zstd_compress.ko.zst:\n")
+        self.assertEqual(self.manager().get_compressor(), "zstd")
+
+    def test_compressor_built_in(self) -> None:
+        write_file(self.root, "lib/modules/6.12.0/modules.builtin",
+                   "kernel/crypto/lz4.ko\nkernel/crypto/lzo.ko\n")
+        self.assertEqual(self.manager().get_compressor(), "lz4")
+
+    def test_compressor_unknown(self) -> None:
+        self.assertEqual(self.manager().get_compressor(), "lzo")
+
+    def test_configs(self) -> None:
+        write_file(self.root, "sys/block/zram0/comp_algorithm", "lzo lzo-rle lz4 [zstd]\n")
+        configs: dict[str, str] = self.manager().generate_configs()
+
+        self.assertEqual(configs[zram.ZRAM_GENERATOR_CONFIG],
+                         "[zram0]\nzram-size = 8192\ncompression-algorithm = zstd\n" + \
+                         "swap-priority = 100\nfs-type = swap\n")
+        self.assertEqual(configs[zram.ZSWAP_TMPFILES_CONFIG],
+                         "w- /sys/module/zswap/parameters/enabled - - - - N\n")
+
+        configs = self.manager().generate_configs(zswap=True)
+        self.assertNotIn("[zram0]", configs[zram.ZRAM_GENERATOR_CONFIG])
+        self.assertEqual(configs[zram.ZSWAP_TMPFILES_CONFIG].splitlines(), [
+            "w- /sys/module/zswap/parameters/compressor - - - - zstd",
+            "w- /sys/module/zswap/parameters/max_pool_percent - - - - 20",
+            "w- /sys/module/zswap/parameters/enabled - - - - Y",
+        ])
+
+    def apply_zswap(self) -> list[list[str]]:
+        """
+        Enables zswap, returning the commands that were run.
+        """
+        commands: list[list[str]] = []
+
+        def run(command: list[str], **_: Any) -> subprocess.CompletedProcess[Any]:
+            commands.append(command)
+            return subprocess.CompletedProcess(command, 0)
+
+        for name in ("compressor", "max_pool_percent", "enabled"):
+            write_file(self.root, f"sys/module/zswap/parameters/{name}", "")
+
+        with mock.patch.object(tracing, "run", run):
+            self.manager().apply_zswap()
+
+        self.assertEqual(read_file(self.root, "sys/module/zswap/parameters/enabled"), "Y")
+        return commands
+
+    def test_zswap_turns_zram_swap_off(self) -> None:
+        write_file(self.root, "proc/swaps", SWAPS_HEADER + \
+                   "/swapfile\t\t\t\tfile\t\t33554428\t0\t\t60\n" + \
+                   "/dev/zram0\t\t\t\tpartition\t8388604\t\t1024\t\t100\n")
+
+        self.assertTrue(self.manager().is_zram_swap_active())
+        self.assertEqual(self.apply_zswap(), [["swapoff", zram.ZRAM_DEVICE],
+                                              ["systemctl", "stop", zram.ZRAM_SETUP_SERVICE]])
+
+    def test_zswap_without_zram_swap(self) -> None:
+        write_file(self.root, "proc/swaps", SWAPS_HEADER + \
+                   "/swapfile\t\t\t\tfile\t\t33554428\t0\t\t60\n")
+
+        self.assertFalse(self.manager().is_zram_swap_active())
+        self.assertEqual(self.apply_zswap(), [["systemctl", "stop", zram.ZRAM_SETUP_SERVICE]])
+
+    def test_zswap_unavailable(self) -> None:
+        with self.assertRaises(FileNotFoundError):
+            self.manager().apply_zswap()
+
+        self.manager().apply_zswap(enabled=False)
+
+if __name__ == "__main__":
+    unittest.main()